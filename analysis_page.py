@@ -4,21 +4,264 @@ Refactored analysis page with improved user interface and modular components.
 
 import streamlit as st
 import pandas as pd
-import plotly.express as px
+import numpy as np
 import plotly.graph_objects as go
+import plotly.io as pio
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
+from typing import List, Optional, Tuple
 import io
-import tempfile
-import os
+import hashlib
+from datetime import datetime
 
 from file_parsers import FileParser
 from character_analyzer import CharacterAnalyzer
 from word_analyzer import WordAnalyzer
 from pronunciation_analyzer import PronunciationAnalyzer
-from mongodb_user_database import UserDatabase
+from user_cache import get_user_db, get_user_history, get_user_prefs, get_user_statistics
 from mongodb_file_tracker import FileTracker
 from mongodb_learning_tracker import LearningTracker
 
+# Serialize Plotly figures with orjson when it is installed; it is much faster
+# than the stdlib encoder on the numeric arrays inside large charts.
+try:
+    import orjson  # noqa: F401
+    pio.json.config.default_engine = 'orjson'
+except ImportError:
+    pass
+
+# Upper bound on the marks sent to the browser for bar and treemap charts; it also keeps
+# bar charts small enough for SVG, so they never need a WebGL trace
+MAX_PLOT_ITEMS = 200
+
+# Run independent analysis steps in parallel; turn off if an analyzer proves not thread-safe
+PARALLEL_ANALYSIS = True
+
+
+@st.cache_resource
+def get_parser() -> FileParser:
+    """Shared file parser, created once per process."""
+    return FileParser()
+
+
+@st.cache_resource
+def get_char_analyzer() -> CharacterAnalyzer:
+    """Shared character analyzer, created once per process."""
+    return CharacterAnalyzer()
+
+
+@st.cache_resource
+def get_word_analyzer() -> WordAnalyzer:
+    """Shared word analyzer, created once per process so jieba setup runs only once."""
+    return WordAnalyzer()
+
+
+@st.cache_resource
+def get_pron_analyzer() -> PronunciationAnalyzer:
+    """Shared pronunciation analyzer, created once per process."""
+    return PronunciationAnalyzer()
+
+
+@st.cache_resource
+def get_file_tracker() -> FileTracker:
+    """Shared file tracker, created once per process rather than in every page section."""
+    return FileTracker()
+
+
+@st.cache_resource
+def get_learning_tracker() -> LearningTracker:
+    """Shared learning tracker, created once per process rather than in every page section."""
+    return LearningTracker()
+
+
+@st.cache_resource
+def get_executor() -> ThreadPoolExecutor:
+    """Shared worker pool for overlapping independent analysis steps."""
+    return ThreadPoolExecutor(max_workers=2)
+
+
+def _content_hash(uploaded_file) -> str:
+    """
+    Hash an upload's content without copying it out of the upload buffer.
+    
+    The digest is remembered for the current Streamlit upload, so reruns and the file
+    tracker (which keeps its first 16 hex digits) don't hash the same bytes again.
+    Objects without an upload file_id, such as re-analysed stored files, are always
+    hashed, since a name and size can be shared by files with different content.
+    """
+    upload_id = getattr(uploaded_file, 'file_id', None)
+    if upload_id is None:
+        return hashlib.sha256(uploaded_file.getbuffer()).hexdigest()
+    memo = st.session_state.get('content_hash_memo')
+    if memo is None or memo[0] != upload_id:
+        memo = (upload_id, hashlib.sha256(uploaded_file.getbuffer()).hexdigest())
+        st.session_state.content_hash_memo = memo
+    return memo[1]
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _parse_upload(content_hash: str, suffix: str, mime_type: str, _uploaded_file) -> str:
+    """Extract text from an uploaded file, cached on its content hash."""
+    # The upload is already an in-memory stream; parse it in place rather than via a temp file
+    _uploaded_file.seek(0)
+    return get_parser().parse_stream(_uploaded_file, mime_type, suffix)
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _analyze_characters(content_hash: str, _text: str):
+    """Run character analysis, cached on the upload's content hash rather than the (long) text."""
+    return get_char_analyzer().analyze_text(_text)
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _analyze_words(content_hash: str, _text: str):
+    """Run word analysis, cached on the upload's content hash rather than the (long) text."""
+    return get_word_analyzer().analyze_text(_text)
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _pronounce_characters(freq_items: tuple):
+    """Look up character pronunciations, cached on the (char, count) pairs."""
+    return get_pron_analyzer().get_character_pronunciations(dict(freq_items))
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _pronounce_words(freq_items: tuple):
+    """Look up word pronunciations, cached on the (word, count) pairs; callers pass han_words."""
+    return get_pron_analyzer().get_word_pronunciations(dict(freq_items), han_only=True)
+
+
+def _run_pair(first, second):
+    """Run two independent callables, concurrently when PARALLEL_ANALYSIS is on."""
+    if not PARALLEL_ANALYSIS:
+        return first(), second()
+    # Hand one task to the shared pool and run the other on this thread
+    first_future = get_executor().submit(first)
+    second_result = second()
+    return first_future.result(), second_result
+
+
+def _analyze_text(content_hash: str, text: str):
+    """Run character and word analysis on the same text, extracted from the upload with this hash."""
+    return _run_pair(lambda: _analyze_characters(content_hash, text), lambda: _analyze_words(content_hash, text))
+
+
+def _pronounce(analysis_results, word_analysis_results):
+    """Look up character and word pronunciations for a pair of analysis results."""
+    return _run_pair(
+        lambda: _pronounce_characters(tuple(analysis_results['character_frequency'].items())),
+        lambda: _pronounce_words(tuple(word_analysis_results['han_words'].items()))
+    )
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _top_items(freq_series: pd.Series, min_frequency: int, max_n: Optional[int]) -> List[Tuple[str, int]]:
+    """Return (item, count) pairs with count >= min_frequency, most frequent first.
+    
+    freq_series must already be ranked by descending count (see _ranked_series),
+    so the frequency cut is a binary search and the display cap a plain slice.
+    """
+    cutoff = int(np.searchsorted(-freq_series.to_numpy(), -min_frequency, side='right'))
+    if max_n is not None:
+        cutoff = min(cutoff, max_n)
+    top = freq_series.iloc[:cutoff]
+    return list(zip(top.index, top.tolist()))
+
+
+def _cap_plot_items(labels, frequencies, limit: int = MAX_PLOT_ITEMS):
+    """Keep the first `limit` items and fold the remainder into an "Other" entry."""
+    if len(labels) <= limit:
+        return list(labels), frequencies
+    return list(labels[:limit]) + ['Other'], np.append(frequencies[:limit], frequencies[limit:].sum())
+
+
+def _ranked_series(freq) -> pd.Series:
+    """Build a count-ranked Series, using Counter.most_common when available.
+    
+    Items and counts are held as two flat arrays (an object index and int32
+    values) rather than a dict, so filtering and slicing stay in NumPy.
+    """
+    if isinstance(freq, Counter):
+        ranked = freq.most_common()
+    else:
+        ranked = sorted(freq.items(), key=itemgetter(1), reverse=True)
+    items = np.array(list(map(itemgetter(0), ranked)), dtype=object)
+    counts = np.fromiter(map(itemgetter(1), ranked), dtype=np.int32, count=len(ranked))
+    return pd.Series(counts, index=pd.Index(items, dtype=object), copy=False)
+
+
+def _store_freq_items(char_results, word_results):
+    """Keep ranked frequency Series in session_state for filtering and as stable cache keys."""
+    st.session_state.char_series = _ranked_series(char_results.get('character_frequency', {}))
+    st.session_state.word_series = _ranked_series(word_results.get('han_words', {}))
+
+
+def _session_top_items(state_key, freq, min_frequency, max_n):
+    """Reuse this session's top items while the stored Series and settings are unchanged.
+    
+    Skips even the cache-key hashing of _top_items on reruns triggered by
+    unrelated widgets such as the chart type.
+    """
+    series = _freq_series(state_key, freq)
+    memo = st.session_state.setdefault('top_items_memo', {})
+    cached_series, results = memo.get(state_key, (None, None))
+    if cached_series is not series:
+        results = {}
+        memo[state_key] = (series, results)
+    
+    settings_key = (min_frequency, max_n)
+    if settings_key not in results:
+        results[settings_key] = _top_items(series, min_frequency, max_n)
+    return results[settings_key]
+
+
+def _flatten_pronunciations(pronunciations):
+    """Split {item: {'jyutping': ..., 'type': ...}} into flat jyutping, type and type-label lookups."""
+    jyutpings = {item: data.get('jyutping', 'unknown') for item, data in pronunciations.items()}
+    types = {item: data.get('type', 'unknown') for item, data in pronunciations.items()}
+    type_labels = {item: item_type.capitalize() for item, item_type in types.items()}
+    return jyutpings, types, type_labels
+
+
+def _pronunciation_table(jyutpings, type_labels):
+    """Index type labels and jyutping by item, ready to join onto a frequency table."""
+    return pd.DataFrame({'Type': type_labels, 'Jyutping': jyutpings})
+
+
+def _store_pronunciations(character_pronunciations, word_pronunciations):
+    """Store pronunciation data along with its flattened per-item lookups."""
+    st.session_state.pronunciation_data = {
+        'characters': character_pronunciations,
+        'words': word_pronunciations
+    }
+    char_jyutping, char_type, char_type_label = _flatten_pronunciations(character_pronunciations)
+    word_jyutping, word_type, word_type_label = _flatten_pronunciations(word_pronunciations)
+    st.session_state.pron_flat = {
+        'char_jyutping': char_jyutping,
+        'char_type': char_type,
+        'char_type_label': char_type_label,
+        'word_jyutping': word_jyutping,
+        'word_type': word_type,
+        'word_type_label': word_type_label,
+        'char_table': _pronunciation_table(char_jyutping, char_type_label),
+        'word_table': _pronunciation_table(word_jyutping, word_type_label)
+    }
+
+
+def _pronunciation_lookups():
+    """Get the flattened pronunciation lookups, rebuilding them if the session has none."""
+    if st.session_state.get('pron_flat') is None or 'char_table' not in st.session_state.pron_flat:
+        pronunciation_data = st.session_state.pronunciation_data
+        _store_pronunciations(pronunciation_data['characters'], pronunciation_data['words'])
+    return st.session_state.pron_flat
+
+
+def _freq_series(state_key, freq):
+    """Get the stored frequency Series, rebuilding it if the session has none."""
+    series = st.session_state.get(state_key)
+    return series if series is not None else _ranked_series(freq)
+
 
 def display_analysis_header(user_data):
     """Display the main header with user info and navigation."""
@@ -63,17 +306,11 @@ def display_file_upload_section():
         
         if uploaded_file:
             # Check if file already exists
-            file_tracker = FileTracker()
-            file_content = uploaded_file.getvalue()
-            file_hash = file_tracker._generate_file_hash(file_content)
+            file_tracker = get_file_tracker()
+            file_hash = _content_hash(uploaded_file)[:16]
             
             # Check for existing file
-            data = file_tracker._load_data()
-            existing_file = None
-            for file_id, file_data in data.items():
-                if file_data.get('file_hash') == file_hash:
-                    existing_file = file_data
-                    break
+            existing_file = file_tracker.find_file_by_hash(file_hash)
             
             if existing_file:
                 st.warning(f"📋 This file has been analyzed before!")
@@ -106,8 +343,8 @@ def display_file_upload_section():
             return None
         
         user_data = st.session_state.current_user
-        file_tracker = FileTracker()
-        user_files = file_tracker.get_user_files(user_data['user_id'])
+        file_tracker = get_file_tracker()
+        user_files = file_tracker.get_user_files(user_data['user_id'], limit=20)
         
         if not user_files:
             st.info("No previous files found. Upload a document to start building your analysis history.")
@@ -115,7 +352,7 @@ def display_file_upload_section():
         
         st.write("**Select a previously analyzed file:**")
         
-        for file_data in user_files[:20]:  # Show last 20 files
+        for file_data in user_files:  # Show last 20 files
             with st.expander(f"📄 {file_data['filename']}", expanded=False):
                 col1, col2, col3 = st.columns([2, 1, 1])
                 
@@ -125,7 +362,7 @@ def display_file_upload_section():
                     st.write(f"**Uploaded:** {file_data['uploaded_at'][:10]}")
                 
                 with col2:
-                    st.write(f"**Analyses:** {len(file_data['analysis_history'])}")
+                    st.write(f"**Analyses:** {file_data['analysis_count']}")
                     st.write(f"**Last accessed:** {file_data['last_accessed'][:10]}")
                 
                 with col3:
@@ -215,11 +452,12 @@ def process_uploaded_file(uploaded_file, settings, user_data, db):
     """Process the uploaded file and perform analysis."""
     
     # Initialize trackers
-    file_tracker = FileTracker()
-    learning_tracker = LearningTracker()
+    file_tracker = get_file_tracker()
+    learning_tracker = get_learning_tracker()
     
     # Check if this is a new file or if we need to reprocess
-    file_content = uploaded_file.getvalue()
+    file_content = uploaded_file.getbuffer()
+    content_hash = _content_hash(uploaded_file)
     current_file_key = f"{uploaded_file.name}_{len(file_content)}"
     
     if st.session_state.get('uploaded_file_key') != current_file_key:
@@ -228,6 +466,7 @@ def process_uploaded_file(uploaded_file, settings, user_data, db):
         st.session_state.analysis_results = None
         st.session_state.word_analysis_results = None
         st.session_state.pronunciation_data = None
+        st.session_state.pron_flat = None
         st.session_state.current_file_id = None
         
         # Register file in tracker
@@ -236,7 +475,8 @@ def process_uploaded_file(uploaded_file, settings, user_data, db):
             file_content,
             user_data['user_id'],
             uploaded_file.size,
-            uploaded_file.type
+            uploaded_file.type,
+            file_hash=content_hash[:16]
         )
         st.session_state.current_file_id = file_id
         
@@ -252,107 +492,92 @@ def process_uploaded_file(uploaded_file, settings, user_data, db):
                 status_text.text("📄 Parsing file...")
                 progress_bar.progress(15)
                 
-                parser = FileParser()
+                # Extract text
+                text_content = _parse_upload(
+                    content_hash,
+                    f".{uploaded_file.name.split('.')[-1]}",
+                    uploaded_file.type,
+                    uploaded_file
+                )
                 
-                # Create temporary file
-                with tempfile.NamedTemporaryFile(delete=False, suffix=f".{uploaded_file.name.split('.')[-1]}") as tmp_file:
-                    tmp_file.write(file_content)
-                    tmp_file_path = tmp_file.name
+                if not text_content.strip():
+                    st.error("❌ No text content found in the uploaded file.")
+                    return False
                 
-                try:
-                    # Extract text
-                    text_content = parser.parse_file(tmp_file_path, uploaded_file.type)
-                    
-                    if not text_content.strip():
-                        st.error("❌ No text content found in the uploaded file.")
-                        return False
-                    
-                    # Step 2: Character analysis
-                    status_text.text("🔤 Analyzing characters...")
-                    progress_bar.progress(35)
-                    
-                    analyzer = CharacterAnalyzer()
-                    analysis_results = analyzer.analyze_text(text_content)
-                    st.session_state.analysis_results = analysis_results
-                    
-                    # Step 3: Word analysis
-                    status_text.text("📝 Analyzing words...")
-                    progress_bar.progress(55)
-                    
-                    word_analyzer = WordAnalyzer()
-                    word_analysis_results = word_analyzer.analyze_text(text_content)
-                    st.session_state.word_analysis_results = word_analysis_results
-                    
-                    # Step 4: Pronunciation analysis
-                    status_text.text("🗣️ Analyzing pronunciations...")
-                    progress_bar.progress(75)
-                    
-                    pronunciation_analyzer = PronunciationAnalyzer()
-                    character_pronunciations = pronunciation_analyzer.get_character_pronunciations(
-                        analysis_results['character_frequency']
-                    )
-                    word_pronunciations = pronunciation_analyzer.get_word_pronunciations(
-                        word_analysis_results['han_words']
-                    )
-                    
-                    st.session_state.pronunciation_data = {
-                        'characters': character_pronunciations,
-                        'words': word_pronunciations
-                    }
-                    
-                    # Step 5: Track learning progress
-                    status_text.text("📚 Tracking learning progress...")
-                    progress_bar.progress(85)
-                    
-                    learning_tracker.track_exposure(
-                        user_data['user_id'],
-                        dict(analysis_results['character_frequency']),
-                        dict(word_analysis_results['han_words']),
-                        file_id,
-                        uploaded_file.name
-                    )
-                    
-                    # Step 6: Save to database
-                    status_text.text("💾 Saving analysis...")
-                    progress_bar.progress(95)
-                    
-                    # Save analysis results
-                    analysis_data = {
-                        'filename': uploaded_file.name,
-                        'file_size': uploaded_file.size,
-                        'analysis_type': settings['analysis_type'].lower(),
-                        'character_stats': analysis_results,
-                        'word_stats': word_analysis_results,
-                        'top_characters': dict(analysis_results['character_frequency'].most_common(10)),
-                        'top_words': dict(word_analysis_results['han_words'].most_common(10)),
-                        'settings_used': {
-                            'preferred_analysis_type': settings['analysis_type'].lower(),
-                            'min_frequency': settings['min_frequency'],
-                            'max_chars_display': settings['max_items_display'],
-                            'show_chart_type': settings['chart_type'].lower()
-                        }
+                # Steps 2-3: Character and word analysis
+                status_text.text("🔤 Analyzing characters and words...")
+                progress_bar.progress(35)
+                
+                analysis_results, word_analysis_results = _analyze_text(content_hash, text_content)
+                st.session_state.analysis_results = analysis_results
+                st.session_state.word_analysis_results = word_analysis_results
+                _store_freq_items(analysis_results, word_analysis_results)
+                
+                # Step 4: Pronunciation analysis
+                status_text.text("🗣️ Analyzing pronunciations...")
+                progress_bar.progress(75)
+                
+                character_pronunciations, word_pronunciations = _pronounce(
+                    analysis_results, word_analysis_results
+                )
+                
+                _store_pronunciations(character_pronunciations, word_pronunciations)
+                
+                # Step 5: Track learning progress
+                status_text.text("📚 Tracking learning progress...")
+                progress_bar.progress(85)
+                
+                # One timestamp is shared by every record this analysis writes
+                analyzed_at = datetime.now().isoformat()
+                learning_tracker.track_exposure(
+                    user_data['user_id'],
+                    dict(analysis_results['character_frequency']),
+                    dict(word_analysis_results['han_words']),
+                    file_id,
+                    uploaded_file.name,
+                    timestamp=analyzed_at
+                )
+                
+                # Step 6: Save to database
+                status_text.text("💾 Saving analysis...")
+                progress_bar.progress(95)
+                
+                # Save analysis results
+                analysis_data = {
+                    'filename': uploaded_file.name,
+                    'file_size': uploaded_file.size,
+                    'analysis_type': settings['analysis_type'].lower(),
+                    'character_stats': analysis_results,
+                    'word_stats': word_analysis_results,
+                    'top_characters': dict(_session_top_items('char_series', analysis_results['character_frequency'], 1, 10)),
+                    'top_words': dict(_session_top_items('word_series', word_analysis_results['han_words'], 1, 10)),
+                    'settings_used': {
+                        'preferred_analysis_type': settings['analysis_type'].lower(),
+                        'min_frequency': settings['min_frequency'],
+                        'max_chars_display': settings['max_items_display'],
+                        'show_chart_type': settings['chart_type'].lower()
                     }
-                    
-                    db.save_analysis_result(user_data['user_id'], analysis_data)
-                    file_tracker.add_analysis_record(file_id, user_data['user_id'], analysis_data)
-                    
-                    # Update user preferences
-                    db.update_user_preferences(user_data['user_id'], analysis_data['settings_used'])
-                    
-                    status_text.text("✅ Analysis complete!")
-                    progress_bar.progress(100)
-                    
-                    # Clear progress after a moment
-                    import time
-                    time.sleep(1)
-                    progress_container.empty()
-                    
-                    st.success("🎉 Analysis completed successfully! File tracked and learning progress updated.")
-                    
-                finally:
-                    # Clean up temporary file
-                    os.unlink(tmp_file_path)
-                    
+                }
+                
+                db.save_analysis_result(user_data['user_id'], analysis_data, timestamp=analyzed_at)
+                get_user_statistics.clear()
+                get_user_history.clear()
+                file_tracker.add_analysis_record(file_id, user_data['user_id'], analysis_data, timestamp=analyzed_at)
+                
+                # Update user preferences
+                db.update_user_preferences(user_data['user_id'], analysis_data['settings_used'])
+                get_user_prefs.clear()
+                
+                status_text.text("✅ Analysis complete!")
+                progress_bar.progress(100)
+                
+                # Clear progress after a moment
+                import time
+                time.sleep(1)
+                progress_container.empty()
+                
+                st.success("🎉 Analysis completed successfully! File tracked and learning progress updated.")
+                
             except Exception as e:
                 st.error(f"❌ Error processing file: {str(e)}")
                 return False
@@ -369,8 +594,8 @@ def display_learning_progress():
         return
     
     user_data = st.session_state.current_user
-    learning_tracker = LearningTracker()
-    file_tracker = FileTracker()
+    learning_tracker = get_learning_tracker()
+    file_tracker = get_file_tracker()
     
     # Get learning progress
     progress = learning_tracker.get_user_progress(user_data['user_id'])
@@ -415,11 +640,11 @@ def display_learning_progress():
         st.write("**Character Mastery**")
         char_mastery = progress['character_stats']['mastery_breakdown']
         if char_mastery:
-            mastery_df = pd.DataFrame([
-                {'Level': level.title(), 'Count': count}
-                for level, count in char_mastery.items()
-            ])
-            fig = px.pie(mastery_df, values='Count', names='Level', title="Character Mastery Distribution")
+            fig = go.Figure(go.Pie(
+                labels=[level.title() for level in char_mastery],
+                values=list(char_mastery.values())
+            ))
+            fig.update_layout(title="Character Mastery Distribution")
             st.plotly_chart(fig, use_container_width=True)
         else:
             st.info("No character mastery data yet.")
@@ -428,11 +653,11 @@ def display_learning_progress():
         st.write("**Word Mastery**")
         word_mastery = progress['word_stats']['mastery_breakdown']
         if word_mastery:
-            mastery_df = pd.DataFrame([
-                {'Level': level.title(), 'Count': count}
-                for level, count in word_mastery.items()
-            ])
-            fig = px.pie(mastery_df, values='Count', names='Level', title="Word Mastery Distribution")
+            fig = go.Figure(go.Pie(
+                labels=[level.title() for level in word_mastery],
+                values=list(word_mastery.values())
+            ))
+            fig.update_layout(title="Word Mastery Distribution")
             st.plotly_chart(fig, use_container_width=True)
         else:
             st.info("No word mastery data yet.")
@@ -482,11 +707,11 @@ def display_learning_progress():
     
     # File history
     st.subheader("📂 Your File History")
-    user_files = file_tracker.get_user_files(user_data['user_id'])
+    user_files = file_tracker.get_user_files(user_data['user_id'], limit=10)
     
     if user_files:
         with st.expander("View File Details", expanded=False):
-            for file_data in user_files[:10]:  # Show last 10 files
+            for file_data in user_files:  # Show last 10 files
                 col1, col2, col3 = st.columns([2, 1, 1])
                 
                 with col1:
@@ -495,7 +720,7 @@ def display_learning_progress():
                 
                 with col2:
                     st.write(f"Size: {file_data['file_size']:,} bytes")
-                    st.write(f"Analyses: {len(file_data['analysis_history'])}")
+                    st.write(f"Analyses: {file_data['analysis_count']}")
                 
                 with col3:
                     st.write(f"Last accessed: {file_data['last_accessed'][:10]}")
@@ -520,34 +745,39 @@ def display_analysis_results(settings):
     char_results = st.session_state.analysis_results
     word_results = st.session_state.word_analysis_results
     pronunciation_data = st.session_state.pronunciation_data
+    pron_flat = _pronunciation_lookups()
     
     # Create tabs for different analysis views
     if settings['analysis_type'] == "Both":
-        tab1, tab2, tab3, tab4 = st.tabs(["📊 Overview", "🔤 Characters", "📝 Words", "📚 Learning Progress"])
+        # Tabs render every pane on each rerun, so select one view and render only that
+        active_tab = st.radio(
+            "View",
+            ["📊 Overview", "🔤 Characters", "📝 Words", "📚 Learning Progress"],
+            horizontal=True,
+            label_visibility="collapsed",
+            key="active_tab"
+        )
         
-        with tab1:
+        if active_tab == "📊 Overview":
             display_overview_analysis(char_results, word_results, pronunciation_data, settings)
-        
-        with tab2:
-            display_character_analysis(char_results, pronunciation_data['characters'], settings)
-        
-        with tab3:
-            display_word_analysis(word_results, pronunciation_data['words'], settings)
-        
-        with tab4:
+        elif active_tab == "🔤 Characters":
+            display_character_analysis(char_results, pron_flat['char_jyutping'], settings)
+        elif active_tab == "📝 Words":
+            display_word_analysis(word_results, pron_flat['word_jyutping'], settings)
+        else:
             display_learning_progress()
     
     elif settings['analysis_type'] == "Characters":
         tab1, tab2 = st.tabs(["🔤 Character Analysis", "📚 Learning Progress"])
         with tab1:
-            display_character_analysis(char_results, pronunciation_data['characters'], settings)
+            display_character_analysis(char_results, pron_flat['char_jyutping'], settings)
         with tab2:
             display_learning_progress()
     
     else:  # Words
         tab1, tab2 = st.tabs(["📝 Word Analysis", "📚 Learning Progress"])
         with tab1:
-            display_word_analysis(word_results, pronunciation_data['words'], settings)
+            display_word_analysis(word_results, pron_flat['word_jyutping'], settings)
         with tab2:
             display_learning_progress()
 
@@ -592,140 +822,134 @@ def display_overview_analysis(char_results, word_results, pronunciation_data, se
     
     with col1:
         st.subheader("🔤 Top Characters")
-        top_chars = dict(char_results['character_frequency'].most_common(10))
+        top_chars = dict(_session_top_items('char_series', char_results['character_frequency'], 1, 10))
         if top_chars:
-            fig = px.bar(
+            fig = go.Figure(go.Bar(
                 x=list(top_chars.keys()),
-                y=list(top_chars.values()),
-                title="Most Frequent Characters"
-            )
-            fig.update_layout(showlegend=False, height=400)
+                y=np.fromiter(top_chars.values(), dtype=np.int32, count=len(top_chars))
+            ))
+            fig.update_layout(title="Most Frequent Characters", showlegend=False, height=400)
             st.plotly_chart(fig, use_container_width=True)
     
     with col2:
         st.subheader("📝 Top Words")
-        top_words = dict(word_results['han_words'].most_common(10))
+        top_words = dict(_session_top_items('word_series', word_results['han_words'], 1, 10))
         if top_words:
-            fig = px.bar(
+            fig = go.Figure(go.Bar(
                 x=list(top_words.keys()),
-                y=list(top_words.values()),
-                title="Most Frequent Words"
-            )
-            fig.update_layout(showlegend=False, height=400)
+                y=np.fromiter(top_words.values(), dtype=np.int32, count=len(top_words))
+            ))
+            fig.update_layout(title="Most Frequent Words", showlegend=False, height=400)
             st.plotly_chart(fig, use_container_width=True)
 
 
-def display_character_analysis(char_results, pronunciation_data, settings):
+def display_character_analysis(char_results, jyutpings, settings):
     """Display detailed character analysis."""
     st.header("🔤 Character Analysis")
     
     # Filter and limit results
-    filtered_chars = {
-        char: count for char, count in char_results['character_frequency'].items()
-        if count >= settings['min_frequency']
-    }
-    
-    if settings['max_items_display']:
-        top_chars = dict(sorted(filtered_chars.items(), key=lambda x: x[1], reverse=True)[:settings['max_items_display']])
-    else:
-        top_chars = dict(sorted(filtered_chars.items(), key=lambda x: x[1], reverse=True))
+    top_chars = dict(_session_top_items(
+        'char_series',
+        char_results['character_frequency'],
+        settings['min_frequency'],
+        settings['max_items_display']
+    ))
     
     if not top_chars:
         st.warning(f"No characters found with frequency >= {settings['min_frequency']}. Try lowering the minimum frequency.")
         return
     
     # Display chart
-    display_frequency_chart(top_chars, settings['chart_type'], "Characters", pronunciation_data)
+    display_frequency_chart(top_chars, settings['chart_type'], "Characters")
     
     # Display table with pronunciations
-    display_frequency_table(top_chars, pronunciation_data, "Character")
+    display_frequency_table(top_chars, jyutpings, "Character")
 
 
-def display_word_analysis(word_results, pronunciation_data, settings):
+def display_word_analysis(word_results, jyutpings, settings):
     """Display detailed word analysis."""
     st.header("📝 Word Analysis")
     
     # Filter and limit results
-    filtered_words = {
-        word: count for word, count in word_results['han_words'].items()
-        if count >= settings['min_frequency']
-    }
-    
-    if settings['max_items_display']:
-        top_words = dict(sorted(filtered_words.items(), key=lambda x: x[1], reverse=True)[:settings['max_items_display']])
-    else:
-        top_words = dict(sorted(filtered_words.items(), key=lambda x: x[1], reverse=True))
+    top_words = dict(_session_top_items(
+        'word_series',
+        word_results['han_words'],
+        settings['min_frequency'],
+        settings['max_items_display']
+    ))
     
     if not top_words:
         st.warning(f"No words found with frequency >= {settings['min_frequency']}. Try lowering the minimum frequency.")
         return
     
     # Display chart
-    display_frequency_chart(top_words, settings['chart_type'], "Words", pronunciation_data)
+    display_frequency_chart(top_words, settings['chart_type'], "Words")
     
     # Display table with pronunciations
-    display_frequency_table(top_words, pronunciation_data, "Word")
+    display_frequency_table(top_words, jyutpings, "Word")
 
 
-def display_frequency_chart(data, chart_type, title, pronunciation_data):
-    """Display frequency chart based on selected type."""
-    st.subheader(f"📊 {title} Frequency Visualization")
+@st.cache_resource(max_entries=8)
+def _frequency_fig(items_tuple: tuple, chart_type: str, title: str) -> go.Figure:
+    """Build a frequency figure, shared across reruns with the same items and chart type."""
+    items = list(map(itemgetter(0), items_tuple))
+    frequencies = np.fromiter(map(itemgetter(1), items_tuple), dtype=np.int32, count=len(items))
     
     if chart_type == "Bar Chart":
-        fig = px.bar(
-            x=list(data.keys()),
-            y=list(data.values()),
+        plot_items, plot_freqs = _cap_plot_items(items, frequencies)
+        fig = go.Figure(go.Bar(x=plot_items, y=plot_freqs))
+        fig.update_layout(
             title=f"Most Frequent {title}",
-            labels={'x': title, 'y': 'Frequency'}
+            xaxis_title=title,
+            yaxis_title='Frequency',
+            showlegend=False
         )
-        fig.update_layout(showlegend=False)
         
     elif chart_type == "Pie Chart":
-        fig = px.pie(
-            values=list(data.values()),
-            names=list(data.keys()),
-            title=f"Most Frequent {title}"
-        )
+        fig = go.Figure(go.Pie(labels=items, values=frequencies))
+        fig.update_layout(title=f"Most Frequent {title}")
         
     else:  # Treemap
-        fig = px.treemap(
-            values=list(data.values()),
-            names=list(data.keys()),
-            title=f"Most Frequent {title}"
-        )
+        plot_items, plot_freqs = _cap_plot_items(items, frequencies)
+        fig = go.Figure(go.Treemap(
+            labels=plot_items,
+            parents=[""] * len(plot_items),
+            values=plot_freqs
+        ))
+        fig.update_layout(title=f"Most Frequent {title}")
+    
+    return fig
+
+
+def display_frequency_chart(data, chart_type, title):
+    """Display frequency chart based on selected type."""
+    st.subheader(f"📊 {title} Frequency Visualization")
     
+    fig = _frequency_fig(tuple(data.items()), chart_type, title)
     st.plotly_chart(fig, use_container_width=True)
 
 
-def display_frequency_table(data, pronunciation_data, item_type):
+def display_frequency_table(data, jyutpings, item_type):
     """Display frequency table with pronunciations."""
     st.subheader(f"📋 {item_type} Frequency Table")
     
-    # Prepare table data
-    table_data = []
-    total_count = sum(data.values())
-    
-    for item, frequency in data.items():
-        pronunciation = pronunciation_data.get(item, {}).get('jyutping', 'N/A')
-        percentage = (frequency / total_count) * 100
-        
-        table_data.append({
-            item_type: item,
-            'Frequency': frequency,
-            'Percentage': f"{percentage:.2f}%",
-            'Jyutping': pronunciation
-        })
-    
-    df = pd.DataFrame(table_data)
+    # Prepare table data column-wise
+    items = list(data)
+    frequencies = np.fromiter(data.values(), dtype=np.int64, count=len(items))
+    percentages = frequencies * (100.0 / frequencies.sum()) if len(items) else frequencies
+    
+    df = pd.DataFrame({
+        item_type: items,
+        'Frequency': frequencies,
+        'Percentage': np.char.mod('%.2f%%', percentages).tolist(),
+        'Jyutping': [jyutpings.get(item, 'N/A') for item in items]
+    })
     st.dataframe(df, use_container_width=True, hide_index=True)
     
     # Download CSV option
-    csv_buffer = io.StringIO()
-    df.to_csv(csv_buffer, index=False)
-    
     st.download_button(
         label=f"📄 Download {item_type} Data (CSV)",
-        data=csv_buffer.getvalue(),
+        data=df.to_csv(index=False).encode('utf-8'),
         file_name=f"{item_type.lower()}_frequency_{st.session_state.uploaded_filename}.csv",
         mime="text/csv"
     )
@@ -734,7 +958,7 @@ def display_frequency_table(data, pronunciation_data, item_type):
 def handle_file_reload(file_id, file_data, user_data, db):
     """Handle reloading a previously analyzed file."""
     try:
-        file_tracker = FileTracker()
+        file_tracker = get_file_tracker()
         analysis_history = file_tracker.get_file_analysis_history(file_id, user_data['user_id'])
         
         if analysis_history:
@@ -744,22 +968,19 @@ def handle_file_reload(file_id, file_data, user_data, db):
             # Reconstruct analysis results from stored data
             st.session_state.analysis_results = latest_analysis.get('character_stats', {})
             st.session_state.word_analysis_results = latest_analysis.get('word_stats', {})
+            _store_freq_items(st.session_state.analysis_results, st.session_state.word_analysis_results)
             st.session_state.uploaded_filename = file_data['filename']
             st.session_state.current_file_id = file_id
             
             # Generate pronunciation data if needed
             if not st.session_state.get('pronunciation_data'):
-                pronunciation_analyzer = PronunciationAnalyzer()
                 char_freq = latest_analysis.get('character_stats', {}).get('character_frequency', {})
                 word_freq = latest_analysis.get('word_stats', {}).get('han_words', {})
                 
-                character_pronunciations = pronunciation_analyzer.get_character_pronunciations(char_freq)
-                word_pronunciations = pronunciation_analyzer.get_word_pronunciations(word_freq)
+                character_pronunciations = _pronounce_characters(tuple(char_freq.items()))
+                word_pronunciations = _pronounce_words(tuple(word_freq.items()))
                 
-                st.session_state.pronunciation_data = {
-                    'characters': character_pronunciations,
-                    'words': word_pronunciations
-                }
+                _store_pronunciations(character_pronunciations, word_pronunciations)
             
             st.success(f"✅ Loaded previous analysis of {file_data['filename']}")
         else:
@@ -771,7 +992,7 @@ def handle_file_reload(file_id, file_data, user_data, db):
 def handle_file_reanalyze(file_id, file_data, user_data, db):
     """Handle re-analyzing a previously uploaded file."""
     try:
-        file_tracker = FileTracker()
+        file_tracker = get_file_tracker()
         file_content = file_tracker.get_file_content(file_id)
         
         if not file_content:
@@ -781,15 +1002,12 @@ def handle_file_reanalyze(file_id, file_data, user_data, db):
         # Create a mock uploaded file object for processing
         import io
         
-        class MockUploadedFile:
+        class MockUploadedFile(io.BytesIO):
             def __init__(self, name, content, file_type, size):
+                super().__init__(content)
                 self.name = name
                 self.type = file_type
                 self.size = size
-                self._content = content
-            
-            def getvalue(self):
-                return self._content
         
         mock_file = MockUploadedFile(
             file_data['filename'],
@@ -799,7 +1017,7 @@ def handle_file_reanalyze(file_id, file_data, user_data, db):
         )
         
         # Get current user preferences
-        user_prefs = db.get_user_preferences(user_data['user_id'])
+        user_prefs = get_user_prefs(user_data['user_id'])
         settings = {
             'analysis_type': user_prefs.get('preferred_analysis_type', 'both').title(),
             'min_frequency': user_prefs.get('min_frequency', 5),
@@ -823,7 +1041,7 @@ def display_comparison_interface(user_data, db):
     """Display interface for comparing different analyses."""
     st.header("🔄 Compare Analyses")
     
-    file_tracker = FileTracker()
+    file_tracker = get_file_tracker()
     user_files = file_tracker.get_user_files(user_data['user_id'])
     
     if len(user_files) < 2:
@@ -851,7 +1069,7 @@ def display_comparison_interface(user_data, db):
 
 def display_comparison_results(file1_id, file2_id, user_data, db):
     """Display comparison results between two files."""
-    file_tracker = FileTracker()
+    file_tracker = get_file_tracker()
     
     # Get analysis history for both files
     file1_history = file_tracker.get_file_analysis_history(file1_id, user_data['user_id'])
@@ -865,8 +1083,8 @@ def display_comparison_results(file1_id, file2_id, user_data, db):
     analysis1 = file1_history[0]
     analysis2 = file2_history[0]
     
-    file1_info = file_tracker.get_file_info(file1_id)
-    file2_info = file_tracker.get_file_info(file2_id)
+    file1_info = file_tracker.get_file_info(file1_id, include_content=False)
+    file2_info = file_tracker.get_file_info(file2_id, include_content=False)
     
     st.subheader("📊 Comparison Results")
     
@@ -974,10 +1192,10 @@ def main_analysis_page():
         return False
     
     user_data = st.session_state.current_user
-    db = UserDatabase()
+    db = get_user_db()
     
     # Load user preferences
-    user_prefs = db.get_user_preferences(user_data['user_id'])
+    user_prefs = get_user_prefs(user_data['user_id'])
     
     # Display header
     display_analysis_header(user_data)
@@ -1,19 +1,7 @@
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-from collections import Counter
-import io
-import tempfile
-import os
 
-from file_parsers import FileParser
-from character_analyzer import CharacterAnalyzer
-from word_analyzer import WordAnalyzer
-from pronunciation_analyzer import PronunciationAnalyzer
-from mongodb_user_database import UserDatabase
 from mongodb_config import ensure_indexes
-from analysis_page import main_analysis_page
+from user_cache import get_user_db, get_user_history, get_user_prefs, get_user_statistics
 from database_status_page import main_database_page
 
 # Configure page
@@ -24,12 +12,32 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-def show_user_progress(user_data, db):
+@st.cache_resource(max_entries=4)
+def _trends_figure(dates: tuple, char_totals: tuple, word_totals: tuple):
+    """Build the progress trends chart, shared across reruns with the same history."""
+    import plotly.graph_objects as go
+    
+    fig = go.Figure([
+        go.Scatter(x=dates, y=char_totals, mode='lines', name='Characters'),
+        go.Scatter(x=dates, y=word_totals, mode='lines', name='Words')
+    ])
+    fig.update_layout(
+        title="Characters and Words Analyzed Over Time",
+        xaxis_title='Date',
+        yaxis_title='value',
+        legend_title_text='variable'
+    )
+    return fig
+
+def show_user_progress(user_data):
     """Display user progress dashboard."""
+    # Imported here so the sign-in screen does not pay for pandas and plotly
+    import pandas as pd
+    
     st.header(f"📊 Progress Dashboard - {user_data['username']}")
     
     # User statistics
-    stats = db.get_user_statistics(user_data['user_id'])
+    stats = get_user_statistics(user_data['user_id'])
     
     col1, col2, col3, col4 = st.columns(4)
     with col1:
@@ -43,43 +51,36 @@ def show_user_progress(user_data, db):
     
     # Recent activity
     st.subheader("📈 Recent Analysis History")
-    history = db.get_user_history(user_data['user_id'], limit=10)
+    history = get_user_history(user_data['user_id'], limit=10)
     
     if history:
-        history_df = pd.DataFrame([
-            {
-                'Date': record['timestamp'][:10],
-                'Time': record['timestamp'][11:19],
-                'File': record['filename'],
-                'Type': record['analysis_type'],
-                'Characters': record['character_stats'].get('total_chars', 'N/A'),
-                'Words': record['word_stats'].get('total_words', 'N/A')
-            }
-            for record in history
-        ])
+        timestamps = [record['timestamp'] for record in history]
+        history_df = pd.DataFrame({
+            'Date': [timestamp[:10] for timestamp in timestamps],
+            'Time': [timestamp[11:19] for timestamp in timestamps],
+            'File': [record['filename'] for record in history],
+            'Type': [record['analysis_type'] for record in history],
+            'Characters': [record['character_stats'].get('total_chars', 'N/A') for record in history],
+            'Words': [record['word_stats'].get('total_words', 'N/A') for record in history]
+        })
         st.dataframe(history_df, use_container_width=True)
         
         # Analysis trends chart
         if len(history) > 1:
             st.subheader("📊 Analysis Trends")
-            chart_data = pd.DataFrame([
-                {
-                    'Date': record['timestamp'][:10],
-                    'Characters': record['character_stats'].get('total_chars', 0),
-                    'Words': record['word_stats'].get('total_words', 0)
-                }
-                for record in reversed(history)
-            ])
-            
-            fig = px.line(chart_data, x='Date', y=['Characters', 'Words'], 
-                         title="Characters and Words Analyzed Over Time")
+            oldest_first = history[::-1]
+            fig = _trends_figure(
+                tuple(timestamp[:10] for timestamp in reversed(timestamps)),
+                tuple(record['character_stats'].get('total_chars', 0) for record in oldest_first),
+                tuple(record['word_stats'].get('total_words', 0) for record in oldest_first)
+            )
             st.plotly_chart(fig, use_container_width=True)
     else:
         st.info("No analysis history yet. Start by uploading a document!")
     
     # User preferences section
     st.subheader("⚙️ Your Preferences")
-    prefs = db.get_user_preferences(user_data['user_id'])
+    prefs = get_user_prefs(user_data['user_id'])
     
     col1, col2 = st.columns(2)
     with col1:
@@ -91,7 +92,7 @@ def show_user_progress(user_data, db):
 
 def user_authentication():
     """Handle user authentication and registration."""
-    db = UserDatabase()
+    db = get_user_db()
     
     if 'current_user' not in st.session_state:
         st.session_state.current_user = None
@@ -107,10 +108,9 @@ def user_authentication():
             username = st.text_input("Username", key="signin_username")
             if st.button("Sign In", key="signin_button"):
                 if username:
-                    user_data = db.get_user_by_username(username)
+                    user_data = db.login(username)
                     if user_data:
                         st.session_state.current_user = user_data
-                        db.update_last_login(user_data['user_id'])
                         st.success(f"Welcome back, {username}!")
                         st.rerun()
                     else:
@@ -163,8 +163,7 @@ def main():
     # Show progress dashboard if requested
     if st.session_state.show_progress:
         user_data = st.session_state.current_user
-        db = UserDatabase()
-        show_user_progress(user_data, db)
+        show_user_progress(user_data)
         if st.button("← Back to Analysis"):
             st.session_state.show_progress = False
             st.rerun()
@@ -178,7 +177,8 @@ def main():
             st.rerun()
         return
     
-    # Use refactored analysis page
+    # Use refactored analysis page; imported only once signed in, as it pulls in the analyzers
+    from analysis_page import main_analysis_page
     main_analysis_page()
 
 if __name__ == "__main__":
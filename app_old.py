@@ -1,18 +1,24 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
+import numpy as np
 import plotly.graph_objects as go
-from collections import Counter
+from operator import itemgetter
+import csv
 import io
-import tempfile
-import os
 
-from file_parsers import FileParser
-from character_analyzer import CharacterAnalyzer
-from word_analyzer import WordAnalyzer
-from pronunciation_analyzer import PronunciationAnalyzer
 from user_database import UserDatabase
-from analysis_page import main_analysis_page
+from analysis_page import (
+    main_analysis_page,
+    _content_hash,
+    _parse_upload,
+    _analyze_text,
+    _pronounce,
+    _session_top_items,
+    _store_freq_items,
+    _cap_plot_items,
+    _store_pronunciations,
+    _pronunciation_lookups,
+)
 
 # Configure page
 st.set_page_config(
@@ -22,19 +28,15 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-def display_character_analysis(results, pronunciation_data, min_frequency, max_chars_display, show_chart_type):
+def display_character_analysis(results, pron_table, min_frequency, max_chars_display, show_chart_type):
     """Display character frequency analysis results."""
-    # Filter results based on settings
-    filtered_chars = {
-        char: count for char, count in results['character_frequency'].items()
-        if count >= min_frequency
-    }
-    
-    # Limit the number of characters displayed if specified
-    if max_chars_display is not None:
-        top_chars = dict(sorted(filtered_chars.items(), key=lambda x: x[1], reverse=True)[:max_chars_display])
-    else:
-        top_chars = dict(sorted(filtered_chars.items(), key=lambda x: x[1], reverse=True))
+    # Filter results based on settings, limited to max_chars_display if specified
+    top_chars = _session_top_items(
+        'char_series',
+        results['character_frequency'],
+        min_frequency,
+        max_chars_display
+    )
     
     if not top_chars:
         st.warning(f"No characters found with frequency >= {min_frequency}. Try lowering the minimum frequency.")
@@ -59,22 +61,19 @@ def display_character_analysis(results, pronunciation_data, min_frequency, max_c
     
     # Create visualization and table with pronunciation data
     display_frequency_chart_and_table_with_pronunciation(
-        top_chars, pronunciation_data, results['total_chars'], show_chart_type, "Character", "Characters"
+        top_chars, pron_table, results['total_chars'], show_chart_type, "Character", "Characters",
+        (min_frequency, max_chars_display)
     )
 
-def display_word_analysis(word_results, pronunciation_data, min_frequency, max_chars_display, show_chart_type):
+def display_word_analysis(word_results, pron_table, min_frequency, max_chars_display, show_chart_type):
     """Display word frequency analysis results."""
-    # Filter Han words based on settings
-    filtered_words = {
-        word: count for word, count in word_results['han_words'].items()
-        if count >= min_frequency
-    }
-    
-    # Limit the number of words displayed if specified
-    if max_chars_display is not None:
-        top_words = dict(sorted(filtered_words.items(), key=lambda x: x[1], reverse=True)[:max_chars_display])
-    else:
-        top_words = dict(sorted(filtered_words.items(), key=lambda x: x[1], reverse=True))
+    # Filter Han words based on settings, limited to max_chars_display if specified
+    top_words = _session_top_items(
+        'word_series',
+        word_results['han_words'],
+        min_frequency,
+        max_chars_display
+    )
     
     if not top_words:
         st.warning(f"No words found with frequency >= {min_frequency}. Try lowering the minimum frequency.")
@@ -99,96 +98,109 @@ def display_word_analysis(word_results, pronunciation_data, min_frequency, max_c
     
     # Create visualization and table with pronunciation data
     display_frequency_chart_and_table_with_pronunciation(
-        top_words, pronunciation_data, word_results['total_words'], show_chart_type, "Word", "Words"
+        top_words, pron_table, word_results['total_words'], show_chart_type, "Word", "Words",
+        (min_frequency, max_chars_display)
     )
 
-def display_combined_analysis(char_results, word_results, pronunciation_data, min_frequency, max_chars_display, show_chart_type):
+def display_combined_analysis(char_results, word_results, pron_flat, min_frequency, max_chars_display, show_chart_type):
     """Display both character and word analysis results."""
-    # Create tabs for different analysis types
-    tab1, tab2 = st.tabs(["📝 Characters", "🔤 Words"])
-    
-    with tab1:
-        display_character_analysis(char_results, pronunciation_data['characters'], min_frequency, max_chars_display, show_chart_type)
+    # Tabs render every pane on each rerun, so select one view and render only that
+    active_tab = st.radio(
+        "View",
+        ["📝 Characters", "🔤 Words"],
+        horizontal=True,
+        label_visibility="collapsed",
+        key="active_tab"
+    )
     
-    with tab2:
-        display_word_analysis(word_results, pronunciation_data['words'], min_frequency, max_chars_display, show_chart_type)
+    if active_tab == "📝 Characters":
+        display_character_analysis(char_results, pron_flat['char_table'], min_frequency, max_chars_display, show_chart_type)
+    else:
+        display_word_analysis(word_results, pron_flat['word_table'], min_frequency, max_chars_display, show_chart_type)
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _build_table_df(items_freq: tuple, total: int, item_type: str, _pron_table: pd.DataFrame) -> pd.DataFrame:
+    """Build the frequency table shown beside the chart; independent of chart type.
 
-def display_frequency_chart_and_table_with_pronunciation(top_items, pronunciation_data, total_count, show_chart_type, item_type, item_type_plural):
+    The pronunciation table is left out of the cache key: an item's pronunciation never changes.
+    """
+    items = list(map(itemgetter(0), items_freq))
+    freqs = np.fromiter(map(itemgetter(1), items_freq), dtype=np.int64, count=len(items))
+    df = pd.DataFrame({item_type: items, 'Frequency': freqs}).join(_pron_table, on=item_type)
+    df = df.fillna({'Type': 'Unknown', 'Jyutping': 'unknown'})
+    df['Percentage'] = np.char.mod('%.1f%%', freqs * (100.0 / total))
+    return df[[item_type, 'Type', 'Jyutping', 'Frequency', 'Percentage']]
+
+@st.cache_resource(max_entries=8)
+def _make_fig(items_tuple: tuple, chart_type: str, item_type: str, item_type_plural: str, total_count: int) -> go.Figure:
+    """Build the frequency figure, shared across reruns with the same items and chart type."""
+    # Prepare data for plotting
+    items = list(map(itemgetter(0), items_tuple))
+    frequencies = np.fromiter(map(itemgetter(1), items_tuple), dtype=np.int32, count=len(items))
+    
+    if chart_type == "Bar Chart":
+        # Bar and treemap show at most MAX_PLOT_ITEMS marks, with the tail folded into "Other";
+        # only the bar chart shows percentages, and only for the marks actually drawn
+        plot_items, plot_freqs = _cap_plot_items(items, frequencies)
+        fig = go.Figure(go.Bar(
+            x=plot_items,
+            y=plot_freqs,
+            customdata=np.char.mod('%.1f%%', plot_freqs * (100.0 / total_count)),
+            hovertemplate='%{x}: %{y} (%{customdata})<extra></extra>'
+        ))
+        fig.update_layout(
+            title=f"Top {len(items)} Most Frequent {item_type_plural}",
+            xaxis_title=item_type,
+            yaxis_title='Frequency',
+            xaxis_tickangle=-45
+        )
+        
+    elif chart_type == "Pie Chart":
+        # Show only top 30 for pie chart to avoid clutter
+        pie_items = items[:30]
+        fig = go.Figure(go.Pie(labels=pie_items, values=frequencies[:30]))
+        fig.update_layout(title=f"Top {len(pie_items)} Most Frequent {item_type_plural}")
+        
+    else:  # Treemap
+        plot_items, plot_freqs = _cap_plot_items(items, frequencies)
+        fig = go.Figure(go.Treemap(
+            labels=plot_items,
+            parents=[""] * len(plot_items),
+            values=plot_freqs
+        ))
+        fig.update_layout(title=f"{item_type} Frequency Treemap")
+    
+    fig.update_layout(height=500)
+    return fig
+
+def display_frequency_chart_and_table_with_pronunciation(top_items, pron_table, total_count, show_chart_type, item_type, item_type_plural, display_settings):
     """Display frequency chart and table for either characters or words."""
+    # Figure and table depend only on the analysed upload and these display settings, so a rerun
+    # with the same settings reuses them without rehashing the item list for the caches below
+    artifacts = st.session_state.setdefault('artifacts', {})
+    artifact_key = (st.session_state.get('content_hash'), item_type, display_settings, show_chart_type)
+    if artifact_key not in artifacts:
+        if len(artifacts) >= 16:
+            # Keep slider sweeps from piling up figures in the session
+            artifacts.clear()
+        items_freq = tuple(top_items)
+        artifacts[artifact_key] = (
+            _make_fig(items_freq, show_chart_type, item_type, item_type_plural, total_count),
+            _build_table_df(items_freq, total_count, item_type, pron_table)
+        )
+    fig, df_table = artifacts[artifact_key]
+    
     # Create two columns for visualization and table
     col_chart, col_table = st.columns([2, 1])
     
     with col_chart:
         st.subheader(f"📊 {item_type} Frequency Visualization")
         
-        # Prepare data for plotting
-        items = list(top_items.keys())
-        frequencies = list(top_items.values())
-        
-        # Create DataFrame for plotly
-        df_plot = pd.DataFrame({
-            item_type: items,
-            'Frequency': frequencies,
-            'Percentage': [f"{(freq/total_count*100):.1f}%" for freq in frequencies]
-        })
-        
-        if show_chart_type == "Bar Chart":
-            fig = px.bar(
-                df_plot, 
-                x=item_type, 
-                y='Frequency',
-                title=f"Top {len(top_items)} Most Frequent {item_type_plural}",
-                hover_data=['Percentage']
-            )
-            fig.update_layout(xaxis_tickangle=-45)
-            
-        elif show_chart_type == "Pie Chart":
-            # Show only top 30 for pie chart to avoid clutter
-            df_pie = df_plot.head(30)
-            fig = px.pie(
-                df_pie, 
-                values='Frequency', 
-                names=item_type,
-                title=f"Top {len(df_pie)} Most Frequent {item_type_plural}"
-            )
-            
-        else:  # Treemap
-            fig = px.treemap(
-                df_plot, 
-                path=[item_type], 
-                values='Frequency',
-                title=f"{item_type} Frequency Treemap"
-            )
-        
-        fig.update_layout(height=500)
         st.plotly_chart(fig, use_container_width=True)
     
     with col_table:
         st.subheader("📋 Frequency Table")
         
-        # Create detailed table with pronunciation data
-        table_data = []
-        for item, freq in top_items.items():
-            percentage = (freq / total_count) * 100
-            
-            # Get pronunciation and type data if available
-            if item in pronunciation_data:
-                jyutping = pronunciation_data[item]['jyutping']
-                char_type = pronunciation_data[item]['type']
-            else:
-                jyutping = "unknown"
-                char_type = "unknown"
-            
-            table_data.append({
-                item_type: item,
-                'Type': char_type.capitalize(),
-                'Jyutping': jyutping,
-                'Frequency': freq,
-                'Percentage': f"{percentage:.1f}%"
-            })
-        
-        df_table = pd.DataFrame(table_data)
-        
         # Display table with styling
         st.dataframe(
             df_table,
@@ -197,128 +209,145 @@ def display_frequency_chart_and_table_with_pronunciation(top_items, pronunciatio
             hide_index=True
         )
 
-def display_download_section(char_results, word_results, pronunciation_data, analysis_type):
+@st.cache_data(show_spinner=False, max_entries=16)
+def _build_frequency_csv(content_hash: str, min_frequency: int, label: str, include_type: bool,
+                         _freq_items: list, _jyutpings: dict, _type_labels: dict, total: int) -> bytes:
+    """Render (item, count) pairs with their jyutping and type labels as UTF-8 CSV bytes.
+    
+    Cached on the upload's content hash and the frequency cut rather than on the
+    (possibly very long) item list, so repeat reruns skip hashing the payload.
+    """
+    scale = 100.0 / total
+    csv_buffer = io.StringIO()
+    writer = csv.writer(csv_buffer, lineterminator='\n')
+    
+    if include_type:
+        writer.writerow((label, 'Type', 'Jyutping', 'Frequency', 'Percentage'))
+        writer.writerows(
+            (item, _type_labels.get(item, 'Unknown'), _jyutpings.get(item, 'unknown'), freq, round(freq * scale, 1))
+            for item, freq in _freq_items
+        )
+    else:
+        writer.writerow((label, 'Jyutping', 'Frequency', 'Percentage'))
+        writer.writerows(
+            (item, _jyutpings.get(item, 'unknown'), freq, round(freq * scale, 1))
+            for item, freq in _freq_items
+        )
+    
+    return csv_buffer.getvalue().encode('utf-8')
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _build_frequency_summary(content_hash: str, min_frequency: int, header: str,
+                             _freq_items: list, _jyutpings: dict, _types: dict, total: int) -> str:
+    """Render (item, count) pairs and their pronunciations as a ranked text summary."""
+    freqs = np.fromiter(map(itemgetter(1), _freq_items), dtype=np.int64, count=len(_freq_items))
+    percentages = freqs * (100.0 / total)
+    
+    lines = [header]
+    for i, ((item, _), freq, percentage) in enumerate(zip(_freq_items, freqs, percentages), 1):
+        lines.append(
+            f"{i:3d}. {item} [{_types.get(item, 'unknown')}] ({_jyutpings.get(item, 'unknown')}) "
+            f"- {freq:4d} times ({percentage:5.1f}%)"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def display_download_section(char_results, word_results, pron_flat, analysis_type, min_frequency):
     """Display download section with appropriate data based on analysis type."""
     st.divider()
-    st.subheader("💾 Download Results")
     
+    with st.expander("💾 Download Results", expanded=False):
+        # Payloads are only built once the user asks for them, not on every rerun
+        if st.button("Prepare downloads"):
+            st.session_state.show_dl = True
+        
+        if st.session_state.get('show_dl'):
+            _render_download_buttons(char_results, word_results, pron_flat, analysis_type, min_frequency)
+
+def _render_download_buttons(char_results, word_results, pron_flat, analysis_type, min_frequency):
+    """Build download payloads for the analysis type and render their buttons."""
     col_download1, col_download2 = st.columns(2)
+    filename = st.session_state.uploaded_filename
+    content_hash = st.session_state.content_hash
+    
+    if analysis_type in ("Characters", "Both"):
+        # All characters that meet minimum frequency
+        char_items = _session_top_items(
+            'char_series',
+            char_results['character_frequency'],
+            min_frequency,
+            None
+        )
+    
+    if analysis_type in ("Words", "Both"):
+        # All words that meet minimum frequency
+        word_items = _session_top_items(
+            'word_series',
+            word_results['han_words'],
+            min_frequency,
+            None
+        )
     
     if analysis_type == "Characters":
-        # Character analysis download - all characters that meet minimum frequency
-        all_chars = {
-            char: count for char, count in char_results['character_frequency'].items()
-            if count >= min_frequency
-        }
-        top_chars = dict(sorted(all_chars.items(), key=lambda x: x[1], reverse=True))
-        
         with col_download1:
-            # Create CSV with pronunciation data
-            csv_data_list = []
-            for char, freq in top_chars.items():
-                char_data = pronunciation_data['characters'].get(char, {})
-                jyutping = char_data.get('jyutping', 'unknown')
-                char_type = char_data.get('type', 'unknown')
-                percentage = (freq / char_results['total_chars'] * 100)
-                csv_data_list.append({
-                    'Character': char,
-                    'Type': char_type.capitalize(),
-                    'Jyutping': jyutping,
-                    'Frequency': freq,
-                    'Percentage': round(percentage, 1)
-                })
-            
-            csv_data = pd.DataFrame(csv_data_list)
-            csv_buffer = io.StringIO()
-            csv_data.to_csv(csv_buffer, index=False, encoding='utf-8')
-            
             st.download_button(
                 label="📄 Download Characters CSV",
-                data=csv_buffer.getvalue(),
-                file_name=f"han_character_frequency_{st.session_state.uploaded_filename}.csv",
+                data=_build_frequency_csv(
+                    content_hash, min_frequency, 'Character', True,
+                    char_items, pron_flat['char_jyutping'], pron_flat['char_type_label'], char_results['total_chars']
+                ),
+                file_name=f"han_character_frequency_{filename}.csv",
                 mime="text/csv"
             )
         
         with col_download2:
-            summary_text = f"""Han Character Frequency Analysis
-File: {st.session_state.uploaded_filename}
+            header = f"""Han Character Frequency Analysis
+File: {filename}
 Total Characters: {char_results['total_chars']}
 Unique Han Characters: {char_results['unique_han_chars']}
 Text Length: {char_results['text_length']}
 
-Top {len(top_chars)} Most Frequent Characters:
-{'='*50}
-"""
-            for i, (char, freq) in enumerate(top_chars.items(), 1):
-                percentage = (freq / char_results['total_chars']) * 100
-                char_data = pronunciation_data['characters'].get(char, {})
-                jyutping = char_data.get('jyutping', 'unknown')
-                char_type = char_data.get('type', 'unknown')
-                summary_text += f"{i:3d}. {char} [{char_type}] ({jyutping}) - {freq:4d} times ({percentage:5.1f}%)\n"
-            
+Top {len(char_items)} Most Frequent Characters:
+{'='*50}"""
             st.download_button(
                 label="📝 Download Character Summary",
-                data=summary_text,
-                file_name=f"han_character_summary_{st.session_state.uploaded_filename}.txt",
+                data=_build_frequency_summary(
+                    content_hash, min_frequency, header,
+                    char_items, pron_flat['char_jyutping'], pron_flat['char_type'], char_results['total_chars']
+                ),
+                file_name=f"han_character_summary_{filename}.txt",
                 mime="text/plain"
             )
     
     elif analysis_type == "Words":
-        # Word analysis download - all words that meet minimum frequency
-        all_words = {
-            word: count for word, count in word_results['han_words'].items()
-            if count >= min_frequency
-        }
-        top_words = dict(sorted(all_words.items(), key=lambda x: x[1], reverse=True))
-        
         with col_download1:
-            # Create CSV with pronunciation data
-            csv_data_list = []
-            for word, freq in top_words.items():
-                word_data = pronunciation_data['words'].get(word, {})
-                jyutping = word_data.get('jyutping', 'unknown')
-                word_type = word_data.get('type', 'unknown')
-                percentage = (freq / word_results['total_words'] * 100)
-                csv_data_list.append({
-                    'Word': word,
-                    'Type': word_type.capitalize(),
-                    'Jyutping': jyutping,
-                    'Frequency': freq,
-                    'Percentage': round(percentage, 1)
-                })
-            
-            csv_data = pd.DataFrame(csv_data_list)
-            csv_buffer = io.StringIO()
-            csv_data.to_csv(csv_buffer, index=False, encoding='utf-8')
-            
             st.download_button(
                 label="📄 Download Words CSV",
-                data=csv_buffer.getvalue(),
-                file_name=f"han_word_frequency_{st.session_state.uploaded_filename}.csv",
+                data=_build_frequency_csv(
+                    content_hash, min_frequency, 'Word', True,
+                    word_items, pron_flat['word_jyutping'], pron_flat['word_type_label'], word_results['total_words']
+                ),
+                file_name=f"han_word_frequency_{filename}.csv",
                 mime="text/csv"
             )
         
         with col_download2:
-            summary_text = f"""Han Word Frequency Analysis
-File: {st.session_state.uploaded_filename}
+            header = f"""Han Word Frequency Analysis
+File: {filename}
 Total Words: {word_results['total_words']}
 Unique Words: {word_results['unique_words']}
 Han Words: {len(word_results['han_words'])}
 
-Top {len(top_words)} Most Frequent Words:
-{'='*50}
-"""
-            for i, (word, freq) in enumerate(top_words.items(), 1):
-                percentage = (freq / word_results['total_words']) * 100
-                word_data = pronunciation_data['words'].get(word, {})
-                jyutping = word_data.get('jyutping', 'unknown')
-                word_type = word_data.get('type', 'unknown')
-                summary_text += f"{i:3d}. {word} [{word_type}] ({jyutping}) - {freq:4d} times ({percentage:5.1f}%)\n"
-            
+Top {len(word_items)} Most Frequent Words:
+{'='*50}"""
             st.download_button(
                 label="📝 Download Word Summary",
-                data=summary_text,
-                file_name=f"han_word_summary_{st.session_state.uploaded_filename}.txt",
+                data=_build_frequency_summary(
+                    content_hash, min_frequency, header,
+                    word_items, pron_flat['word_jyutping'], pron_flat['word_type'], word_results['total_words']
+                ),
+                file_name=f"han_word_summary_{filename}.txt",
                 mime="text/plain"
             )
     
@@ -327,69 +356,68 @@ Top {len(top_words)} Most Frequent Words:
         col_download3, col_download4 = st.columns(2)
         
         with col_download1:
-            # Character CSV with pronunciation - all characters that meet minimum frequency
-            all_chars = {
-                char: count for char, count in char_results['character_frequency'].items()
-                if count >= min_frequency
-            }
-            top_chars = dict(sorted(all_chars.items(), key=lambda x: x[1], reverse=True))
-            csv_data_list = []
-            for char, freq in top_chars.items():
-                jyutping = pronunciation_data['characters'].get(char, {}).get('jyutping', 'unknown')
-                percentage = (freq / char_results['total_chars'] * 100)
-                csv_data_list.append({
-                    'Character': char,
-                    'Jyutping': jyutping,
-                    'Frequency': freq,
-                    'Percentage': round(percentage, 1)
-                })
-            
-            csv_data = pd.DataFrame(csv_data_list)
-            csv_buffer = io.StringIO()
-            csv_data.to_csv(csv_buffer, index=False, encoding='utf-8')
-            
             st.download_button(
                 label="📄 Download Characters CSV",
-                data=csv_buffer.getvalue(),
-                file_name=f"han_character_frequency_{st.session_state.uploaded_filename}.csv",
+                data=_build_frequency_csv(
+                    content_hash, min_frequency, 'Character', False,
+                    char_items, pron_flat['char_jyutping'], {}, char_results['total_chars']
+                ),
+                file_name=f"han_character_frequency_{filename}.csv",
                 mime="text/csv"
             )
         
         with col_download2:
-            # Word CSV with pronunciation - all words that meet minimum frequency
-            all_words = {
-                word: count for word, count in word_results['han_words'].items()
-                if count >= min_frequency
-            }
-            top_words = dict(sorted(all_words.items(), key=lambda x: x[1], reverse=True))
-            csv_data_list = []
-            for word, freq in top_words.items():
-                jyutping = pronunciation_data['words'].get(word, {}).get('jyutping', 'unknown')
-                percentage = (freq / word_results['total_words'] * 100)
-                csv_data_list.append({
-                    'Word': word,
-                    'Jyutping': jyutping,
-                    'Frequency': freq,
-                    'Percentage': round(percentage, 1)
-                })
-            
-            csv_data = pd.DataFrame(csv_data_list)
-            csv_buffer = io.StringIO()
-            csv_data.to_csv(csv_buffer, index=False, encoding='utf-8')
-            
             st.download_button(
                 label="📄 Download Words CSV",
-                data=csv_buffer.getvalue(),
-                file_name=f"han_word_frequency_{st.session_state.uploaded_filename}.csv",
+                data=_build_frequency_csv(
+                    content_hash, min_frequency, 'Word', False,
+                    word_items, pron_flat['word_jyutping'], {}, word_results['total_words']
+                ),
+                file_name=f"han_word_frequency_{filename}.csv",
                 mime="text/csv"
             )
 
+@st.cache_resource
+def get_user_db() -> UserDatabase:
+    """Shared user database handle, created once per process."""
+    return UserDatabase()
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _user_prefs(user_id: str):
+    """User preferences, re-read at most every 30 seconds unless cleared after an update."""
+    return get_user_db().get_user_preferences(user_id)
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _user_statistics(user_id: str):
+    """User statistics, re-read at most every 30 seconds unless cleared after an analysis."""
+    return get_user_db().get_user_statistics(user_id)
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _user_history(user_id: str, limit: int = 10):
+    """Recent analysis history, re-read at most every 30 seconds unless cleared after an analysis."""
+    return get_user_db().get_user_history(user_id, limit=limit)
+
+@st.cache_resource(max_entries=4)
+def _trends_figure(dates: tuple, char_totals: tuple, word_totals: tuple) -> go.Figure:
+    """Build the progress trends chart, shared across reruns with the same history."""
+    fig = go.Figure([
+        go.Scatter(x=dates, y=char_totals, mode='lines', name='Characters'),
+        go.Scatter(x=dates, y=word_totals, mode='lines', name='Words')
+    ])
+    fig.update_layout(
+        title="Characters and Words Analyzed Over Time",
+        xaxis_title='Date',
+        yaxis_title='value',
+        legend_title_text='variable'
+    )
+    return fig
+
 def show_user_progress(user_data, db):
     """Display user progress dashboard."""
     st.header(f"📊 Progress Dashboard - {user_data['username']}")
     
     # User statistics
-    stats = db.get_user_statistics(user_data['user_id'])
+    stats = _user_statistics(user_data['user_id'])
     
     col1, col2, col3, col4 = st.columns(4)
     with col1:
@@ -403,43 +431,36 @@ def show_user_progress(user_data, db):
     
     # Recent activity
     st.subheader("📈 Recent Analysis History")
-    history = db.get_user_history(user_data['user_id'], limit=10)
+    history = _user_history(user_data['user_id'], limit=10)
     
     if history:
-        history_df = pd.DataFrame([
-            {
-                'Date': record['timestamp'][:10],
-                'Time': record['timestamp'][11:19],
-                'File': record['filename'],
-                'Type': record['analysis_type'],
-                'Characters': record['character_stats'].get('total_chars', 'N/A'),
-                'Words': record['word_stats'].get('total_words', 'N/A')
-            }
-            for record in history
-        ])
+        timestamps = [record['timestamp'] for record in history]
+        history_df = pd.DataFrame({
+            'Date': [timestamp[:10] for timestamp in timestamps],
+            'Time': [timestamp[11:19] for timestamp in timestamps],
+            'File': [record['filename'] for record in history],
+            'Type': [record['analysis_type'] for record in history],
+            'Characters': [record['character_stats'].get('total_chars', 'N/A') for record in history],
+            'Words': [record['word_stats'].get('total_words', 'N/A') for record in history]
+        })
         st.dataframe(history_df, use_container_width=True)
         
         # Analysis trends chart
         if len(history) > 1:
             st.subheader("📊 Analysis Trends")
-            chart_data = pd.DataFrame([
-                {
-                    'Date': record['timestamp'][:10],
-                    'Characters': record['character_stats'].get('total_chars', 0),
-                    'Words': record['word_stats'].get('total_words', 0)
-                }
-                for record in reversed(history)
-            ])
-            
-            fig = px.line(chart_data, x='Date', y=['Characters', 'Words'], 
-                         title="Characters and Words Analyzed Over Time")
+            oldest_first = history[::-1]
+            fig = _trends_figure(
+                tuple(timestamp[:10] for timestamp in reversed(timestamps)),
+                tuple(record['character_stats'].get('total_chars', 0) for record in oldest_first),
+                tuple(record['word_stats'].get('total_words', 0) for record in oldest_first)
+            )
             st.plotly_chart(fig, use_container_width=True)
     else:
         st.info("No analysis history yet. Start by uploading a document!")
     
     # User preferences section
     st.subheader("⚙️ Your Preferences")
-    prefs = db.get_user_preferences(user_data['user_id'])
+    prefs = _user_prefs(user_data['user_id'])
     
     col1, col2 = st.columns(2)
     with col1:
@@ -451,7 +472,7 @@ def show_user_progress(user_data, db):
 
 def user_authentication():
     """Handle user authentication and registration."""
-    db = UserDatabase()
+    db = get_user_db()
     
     if 'current_user' not in st.session_state:
         st.session_state.current_user = None
@@ -507,7 +528,7 @@ def main():
     
     # User is authenticated, show main app
     user_data = st.session_state.current_user
-    db = UserDatabase()
+    db = get_user_db()
     
     # Header with user info
     col1, col2, col3 = st.columns([2, 1, 1])
@@ -536,7 +557,7 @@ def main():
         st.session_state.show_progress = False
     
     # Load user preferences
-    user_prefs = db.get_user_preferences(user_data['user_id'])
+    user_prefs = _user_prefs(user_data['user_id'])
     
     # Show progress dashboard if requested
     if st.session_state.show_progress:
@@ -614,8 +635,14 @@ def main():
             'show_chart_type': show_chart_type.lower()
         }
         
-        if current_prefs != user_prefs:
-            db.update_user_preferences(user_data['user_id'], current_prefs)
+        # Only write when the widgets actually changed; stored preferences can carry extra keys,
+        # so comparing whole dicts would rewrite them on every rerun
+        prefs_hash = hash((user_data['user_id'], tuple(sorted(current_prefs.items()))))
+        if st.session_state.get('prefs_hash') != prefs_hash:
+            if any(user_prefs.get(key) != value for key, value in current_prefs.items()):
+                db.update_user_preferences(user_data['user_id'], current_prefs)
+                _user_prefs.clear()
+            st.session_state.prefs_hash = prefs_hash
     
     # Main content area
     if uploaded_file is not None:
@@ -625,69 +652,56 @@ def main():
             st.session_state.analysis_results = None
             st.session_state.word_analysis_results = None
             st.session_state.pronunciation_data = None
+            st.session_state.pron_flat = None
+            st.session_state.show_dl = False
+            st.session_state.artifacts = {}
             
             with st.spinner(f"Processing {uploaded_file.name}..."):
                 try:
-                    # Parse the file
-                    parser = FileParser()
+                    # Extract text from file
+                    st.session_state.content_hash = _content_hash(uploaded_file)
+                    text_content = _parse_upload(
+                        st.session_state.content_hash,
+                        f".{uploaded_file.name.split('.')[-1]}",
+                        uploaded_file.type,
+                        uploaded_file
+                    )
                     
-                    # Create temporary file to save uploaded content
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=f".{uploaded_file.name.split('.')[-1]}") as tmp_file:
-                        tmp_file.write(uploaded_file.getvalue())
-                        tmp_file_path = tmp_file.name
+                    if not text_content.strip():
+                        st.error("No text content found in the uploaded file.")
+                        return
+                    
+                    # Analyze characters and words
+                    analysis_results, word_analysis_results = _analyze_text(st.session_state.content_hash, text_content)
+                    st.session_state.analysis_results = analysis_results
+                    st.session_state.word_analysis_results = word_analysis_results
+                    _store_freq_items(analysis_results, word_analysis_results)
+                    
+                    # Analyze pronunciations
+                    character_pronunciations, word_pronunciations = _pronounce(
+                        analysis_results, word_analysis_results
+                    )
+                    
+                    _store_pronunciations(character_pronunciations, word_pronunciations)
+                    
+                    # Save analysis results to user database
+                    analysis_data = {
+                        'filename': uploaded_file.name,
+                        'file_size': uploaded_file.size,
+                        'analysis_type': analysis_type.lower(),
+                        'character_stats': analysis_results,
+                        'word_stats': word_analysis_results,
+                        'top_characters': dict(_session_top_items('char_series', analysis_results['character_frequency'], 1, 10)),
+                        'top_words': dict(_session_top_items('word_series', word_analysis_results['han_words'], 1, 10)),
+                        'settings_used': current_prefs
+                    }
+                    
+                    db.save_analysis_result(user_data['user_id'], analysis_data)
+                    _user_statistics.clear()
+                    _user_history.clear()
+                    
+                    st.success(f"✅ Analysis complete! Results saved to your progress.")
                     
-                    try:
-                        # Extract text from file
-                        text_content = parser.parse_file(tmp_file_path, uploaded_file.type)
-                        
-                        if not text_content.strip():
-                            st.error("No text content found in the uploaded file.")
-                            return
-                        
-                        # Analyze characters
-                        analyzer = CharacterAnalyzer()
-                        analysis_results = analyzer.analyze_text(text_content)
-                        st.session_state.analysis_results = analysis_results
-                        
-                        # Analyze words
-                        word_analyzer = WordAnalyzer()
-                        word_analysis_results = word_analyzer.analyze_text(text_content)
-                        st.session_state.word_analysis_results = word_analysis_results
-                        
-                        # Analyze pronunciations
-                        pronunciation_analyzer = PronunciationAnalyzer()
-                        character_pronunciations = pronunciation_analyzer.get_character_pronunciations(
-                            analysis_results['character_frequency']
-                        )
-                        word_pronunciations = pronunciation_analyzer.get_word_pronunciations(
-                            word_analysis_results['han_words']
-                        )
-                        
-                        st.session_state.pronunciation_data = {
-                            'characters': character_pronunciations,
-                            'words': word_pronunciations
-                        }
-                        
-                        # Save analysis results to user database
-                        analysis_data = {
-                            'filename': uploaded_file.name,
-                            'file_size': uploaded_file.size,
-                            'analysis_type': analysis_type.lower(),
-                            'character_stats': analysis_results,
-                            'word_stats': word_analysis_results,
-                            'top_characters': dict(analysis_results['character_frequency'].most_common(10)),
-                            'top_words': dict(word_analysis_results['han_words'].most_common(10)),
-                            'settings_used': current_prefs
-                        }
-                        
-                        db.save_analysis_result(user_data['user_id'], analysis_data)
-                        
-                        st.success(f"✅ Analysis complete! Results saved to your progress.")
-                        
-                    finally:
-                        # Clean up temporary file
-                        os.unlink(tmp_file_path)
-                        
                 except Exception as e:
                     st.error(f"Error processing file: {str(e)}")
                     return
@@ -696,19 +710,19 @@ def main():
     if st.session_state.analysis_results and st.session_state.word_analysis_results and st.session_state.pronunciation_data:
         char_results = st.session_state.analysis_results
         word_results = st.session_state.word_analysis_results
-        pronunciation_data = st.session_state.pronunciation_data
+        pron_flat = _pronunciation_lookups()
         
         # Display different analysis types based on selection
         if analysis_type == "Characters":
-            display_character_analysis(char_results, pronunciation_data['characters'], min_frequency, max_chars_display, show_chart_type)
+            display_character_analysis(char_results, pron_flat['char_table'], min_frequency, max_chars_display, show_chart_type)
         elif analysis_type == "Words":
-            display_word_analysis(word_results, pronunciation_data['words'], min_frequency, max_chars_display, show_chart_type)
+            display_word_analysis(word_results, pron_flat['word_table'], min_frequency, max_chars_display, show_chart_type)
         else:  # Both
-            display_combined_analysis(char_results, word_results, pronunciation_data, min_frequency, max_chars_display, show_chart_type)
+            display_combined_analysis(char_results, word_results, pron_flat, min_frequency, max_chars_display, show_chart_type)
         
         
         # Download section
-        display_download_section(char_results, word_results, pronunciation_data, analysis_type)
+        display_download_section(char_results, word_results, pron_flat, analysis_type, min_frequency)
     
     else:
         # Welcome screen when no file is uploaded
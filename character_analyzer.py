@@ -2,12 +2,77 @@ import re
 from collections import Counter
 from typing import Dict, Any
 
+import numpy as np
+
+# Whitespace lookup by code point, matching str.isspace() and so re's \s; every
+# whitespace code point is at or below U+3000, and the last slot stands for "anything above"
+_WHITESPACE_TABLE = np.zeros(0x3002, dtype=bool)
+_WHITESPACE_TABLE[[c for c in range(0x3001) if chr(c).isspace()]] = True
+
+
+def _scan_code_points(code_points: np.ndarray):
+    """
+    Scan a uint32 code-point array once for Han characters and cleaned length.
+    
+    Returns the Han code points in text order and the length the text would have
+    after CharacterAnalyzer._clean_text, without building the cleaned string.
+    """
+    han_mask = (
+        ((code_points >= 0x4e00) & (code_points <= 0x9fff))
+        | ((code_points >= 0x3400) & (code_points <= 0x4dbf))
+        | ((code_points >= 0xf900) & (code_points <= 0xfaff))
+    )
+    
+    # Cleaning collapses each whitespace run to one space and strips runs at either end
+    whitespace = _WHITESPACE_TABLE[np.minimum(code_points, 0x3001)]
+    non_whitespace = len(code_points) - int(np.count_nonzero(whitespace))
+    if non_whitespace == 0:
+        cleaned_length = 0
+    else:
+        runs = int(np.count_nonzero(whitespace[1:] & ~whitespace[:-1])) + int(whitespace[0])
+        cleaned_length = non_whitespace + runs - int(whitespace[0]) - int(whitespace[-1])
+    
+    return code_points[han_mask], cleaned_length
+
+
+# Below this many characters the regex path beats the fixed setup cost of the NumPy histogram
+SMALL_TEXT_MAX_CHARS = 2048
+
+# Every Han range counted here lies in U+3400..U+FAFF, small enough for a dense histogram
+_HAN_FIRST = 0x3400
+_HAN_SPAN = 0xfaff - _HAN_FIRST + 1
+
+# Per-code-point Han flags up to U+FAFF, for single-character checks without the regex engine
+_HAN_LOOKUP = bytearray(0xfb00)
+_HAN_LOOKUP[0x3400:0x4dc0] = b'\x01' * (0x4dc0 - 0x3400)
+_HAN_LOOKUP[0x4e00:0xa000] = b'\x01' * (0xa000 - 0x4e00)
+_HAN_LOOKUP[0xf900:0xfb00] = b'\x01' * (0xfb00 - 0xf900)
+
+
+def _han_histogram(han_codes: np.ndarray):
+    """
+    Count Han code points with np.bincount.
+    
+    Returns the distinct code points and their counts, ordered by first appearance.
+    """
+    offsets = (han_codes - _HAN_FIRST).astype(np.intp)
+    histogram = np.bincount(offsets, minlength=_HAN_SPAN)
+    present = np.flatnonzero(histogram)
+    
+    first_seen = np.full(_HAN_SPAN, len(offsets), dtype=np.intp)
+    np.minimum.at(first_seen, offsets, np.arange(len(offsets)))
+    present = present[np.argsort(first_seen[present], kind='stable')]
+    
+    return present + _HAN_FIRST, histogram[present]
+
+
 class CharacterAnalyzer:
     """Analyzes text for Han character frequency and statistics."""
     
     def __init__(self):
         # Unicode ranges for Han characters (CJK Unified Ideographs)
         self.han_pattern = re.compile(r'[\u4e00-\u9fff\u3400-\u4dbf\uf900-\ufaff]')
+        self.whitespace_pattern = re.compile(r'\s+')
         
     def analyze_text(self, text: str) -> Dict[str, Any]:
         """
@@ -33,19 +98,23 @@ class CharacterAnalyzer:
                 'han_character_ratio': 0.0
             }
         
-        # Clean text - remove extra whitespace and normalize
-        cleaned_text = self._clean_text(text)
+        if len(text) <= SMALL_TEXT_MAX_CHARS:
+            return self._analyze_small_text(text)
         
-        # Extract all Han characters
-        han_characters = self.han_pattern.findall(cleaned_text)
+        # View the text as code points and scan them in one vectorized pass, instead of
+        # cleaning it with regexes and running every character through a Python-level Counter;
+        # surrogatepass keeps lone surrogates from extracted PDF text as their own code points
+        code_points = np.frombuffer(text.encode('utf-32-le', 'surrogatepass'), dtype=np.uint32)
+        han_codes, text_length = _scan_code_points(code_points)
         
-        # Count character frequencies
-        char_frequency = Counter(han_characters)
+        # Count character frequencies as a dense histogram over the Han code-point span
+        # rather than sorting, keeping first-appearance order like Counter(findall(...))
+        codes, counts = _han_histogram(han_codes)
+        char_frequency = Counter(dict(zip(map(chr, codes.tolist()), counts.tolist())))
         
         # Calculate statistics
-        total_han_chars = len(han_characters)
+        total_han_chars = len(han_codes)
         unique_han_chars = len(char_frequency)
-        text_length = len(cleaned_text)
         han_ratio = total_han_chars / text_length if text_length > 0 else 0.0
         
         return {
@@ -56,18 +125,24 @@ class CharacterAnalyzer:
             'han_character_ratio': han_ratio
         }
     
+    def _analyze_small_text(self, text: str) -> Dict[str, Any]:
+        """Regex-based analyze_text for short texts, such as those from per-widget calls."""
+        text_length = len(self._clean_text(text))
+        char_frequency = Counter(self.han_pattern.findall(text))
+        total_han_chars = sum(char_frequency.values())
+        
+        return {
+            'character_frequency': char_frequency,
+            'total_chars': total_han_chars,
+            'unique_han_chars': len(char_frequency),
+            'text_length': text_length,
+            'han_character_ratio': total_han_chars / text_length if text_length > 0 else 0.0
+        }
+    
     def _clean_text(self, text: str) -> str:
         """Clean and normalize text for analysis."""
-        # Remove excessive whitespace
-        text = re.sub(r'\s+', ' ', text)
-        
-        # Remove common formatting artifacts
-        text = re.sub(r'[\r\n\t]+', ' ', text)
-        
-        # Strip leading/trailing whitespace
-        text = text.strip()
-        
-        return text
+        # Collapse whitespace runs (\s already covers \r, \n and \t) and strip the ends
+        return self.whitespace_pattern.sub(' ', text).strip()
     
     def get_character_difficulty_level(self, char_frequency: Counter, total_chars: int) -> Dict[str, Dict[str, int]]:
         """
@@ -93,26 +168,15 @@ class CharacterAnalyzer:
         common_threshold = total_chars * 0.005      # > 0.5% of all characters
         uncommon_threshold = total_chars * 0.001    # > 0.1% of all characters
         
-        levels = {
-            'very_common': {'count': 0, 'characters': []},
-            'common': {'count': 0, 'characters': []},
-            'uncommon': {'count': 0, 'characters': []},
-            'rare': {'count': 0, 'characters': []}
-        }
+        # Bucket every frequency in one vectorized pass: 0 = rare ... 3 = very common
+        chars = list(char_frequency.keys())
+        freqs = np.fromiter(char_frequency.values(), dtype=np.int64, count=len(chars))
+        buckets = np.digitize(freqs, [uncommon_threshold, common_threshold, very_common_threshold])
         
-        for char, freq in char_frequency.items():
-            if freq >= very_common_threshold:
-                levels['very_common']['characters'].append(char)
-                levels['very_common']['count'] += 1
-            elif freq >= common_threshold:
-                levels['common']['characters'].append(char)
-                levels['common']['count'] += 1
-            elif freq >= uncommon_threshold:
-                levels['uncommon']['characters'].append(char)
-                levels['uncommon']['count'] += 1
-            else:
-                levels['rare']['characters'].append(char)
-                levels['rare']['count'] += 1
+        levels = {}
+        for level, bucket in (('very_common', 3), ('common', 2), ('uncommon', 1), ('rare', 0)):
+            level_chars = [chars[i] for i in np.flatnonzero(buckets == bucket).tolist()]
+            levels[level] = {'count': len(level_chars), 'characters': level_chars}
         
         return levels
     
@@ -158,7 +222,10 @@ class CharacterAnalyzer:
         Returns:
             True if the character is a Han character, False otherwise
         """
-        return bool(self.han_pattern.match(char))
+        if not char:
+            return False
+        code_point = ord(char[0])
+        return code_point < 0xfb00 and _HAN_LOOKUP[code_point] == 1
     
     def get_character_stats_summary(self, analysis_results: Dict[str, Any]) -> str:
         """
@@ -176,18 +243,19 @@ class CharacterAnalyzer:
         text_length = analysis_results['text_length']
         han_ratio = analysis_results['han_character_ratio']
         
-        summary = f"""Text Analysis Summary:
+        header = f"""Text Analysis Summary:
         
 Total text length: {text_length:,} characters
 Han characters found: {total_chars:,} ({han_ratio:.1%} of text)
 Unique Han characters: {unique_chars:,}
-Average character frequency: {total_chars/unique_chars:.1f} (if unique_chars > 0 else 0)
+Average character frequency: {total_chars / unique_chars if unique_chars > 0 else 0:.1f}
 
 Top 10 most frequent characters:
 """
         
+        parts = [header]
         for i, (char, freq) in enumerate(char_freq.most_common(10), 1):
             percentage = (freq / total_chars) * 100 if total_chars > 0 else 0
-            summary += f"{i:2d}. {char} - {freq:4d} times ({percentage:5.1f}%)\n"
+            parts.append(f"{i:2d}. {char} - {freq:4d} times ({percentage:5.1f}%)\n")
         
-        return summary
+        return "".join(parts)
@@ -3,7 +3,14 @@ Database status and migration page for MongoDB integration.
 """
 
 import streamlit as st
+from pymongo import ReplaceOne
 from mongodb_config import get_mongo_manager
+from mongodb_learning_tracker import exposure_to_public
+
+# Upserts sent per bulk_write call during migration
+MIGRATION_BATCH_SIZE = 1000
+# Documents fetched per cursor round-trip during export
+EXPORT_BATCH_SIZE = 1000
 
 
 def show_database_status():
@@ -115,6 +122,17 @@ def show_migration_tools():
             export_mongodb_to_json()
 
 
+def _bulk_upsert(collection, key_field, records):
+    """Upsert {key: document} records in unordered batches instead of one round-trip each."""
+    operations = [
+        ReplaceOne({key_field: key}, document, upsert=True)
+        for key, document in records.items()
+    ]
+    for start in range(0, len(operations), MIGRATION_BATCH_SIZE):
+        collection.bulk_write(operations[start:start + MIGRATION_BATCH_SIZE], ordered=False)
+    return len(operations)
+
+
 def migrate_json_to_mongodb():
     """Migrate data from JSON files to MongoDB."""
     mongo = get_mongo_manager()
@@ -132,32 +150,27 @@ def migrate_json_to_mongodb():
             
             # Migrate users
             if os.path.exists('data/users.json'):
-                with open('data/users.json', 'r', encoding='utf-8') as f:
-                    users_data = json.load(f)
+                # Load through the JSON user database so logins and analysis results still in
+                # its update log are included
+                from user_database import UserDatabase as JsonUserDatabase
+                users_data = {
+                    user_data['user_id']: user_data
+                    for user_data in JsonUserDatabase('data/users.json').list_all_users()
+                }
                 
                 users_collection = mongo.get_collection('users')
-                for user_id, user_data in users_data.items():
-                    users_collection.replace_one(
-                        {'user_id': user_id},
-                        user_data,
-                        upsert=True
-                    )
-                    migration_count += 1
+                migration_count += _bulk_upsert(users_collection, 'user_id', users_data)
                 st.write(f"✅ Migrated {len(users_data)} users")
             
             # Migrate files
             if os.path.exists('data/files.json'):
-                with open('data/files.json', 'r', encoding='utf-8') as f:
-                    files_data = json.load(f)
+                # Load through the JSON tracker so analysis records still in its append log are
+                # included and uploads stored beside files.json come along as file_content
+                from file_tracker import FileTracker as JsonFileTracker
+                files_data = JsonFileTracker('data/files.json').get_all_files(inline_content=True)
                 
                 files_collection = mongo.get_collection('files')
-                for file_id, file_data in files_data.items():
-                    files_collection.replace_one(
-                        {'file_id': file_id},
-                        file_data,
-                        upsert=True
-                    )
-                    migration_count += 1
+                migration_count += _bulk_upsert(files_collection, 'file_id', files_data)
                 st.write(f"✅ Migrated {len(files_data)} files")
             
             # Migrate learning progress
@@ -168,12 +181,7 @@ def migrate_json_to_mongodb():
                 learning_collection = mongo.get_collection('learning_progress')
                 for user_id, progress_data in learning_data.items():
                     progress_data['user_id'] = user_id
-                    learning_collection.replace_one(
-                        {'user_id': user_id},
-                        progress_data,
-                        upsert=True
-                    )
-                    migration_count += 1
+                migration_count += _bulk_upsert(learning_collection, 'user_id', learning_data)
                 st.write(f"✅ Migrated {len(learning_data)} learning records")
             
             st.success(f"🎉 Migration completed! Processed {migration_count} records.")
@@ -182,6 +190,19 @@ def migrate_json_to_mongodb():
             st.error(f"❌ Migration failed: {e}")
 
 
+def _export_cursor(collection):
+    """Iterate a collection without the server-side _id, in large cursor batches."""
+    return collection.find({}, projection={'_id': 0}).batch_size(EXPORT_BATCH_SIZE)
+
+
+def _export_default(value):
+    """JSON fallback for BSON values: binary file content as base64, like the JSON store, and ids as strings."""
+    if isinstance(value, bytes):
+        import base64
+        return base64.b64encode(value).decode('utf-8')
+    return str(value)
+
+
 def export_mongodb_to_json():
     """Export data from MongoDB to JSON files."""
     mongo = get_mongo_manager()
@@ -203,8 +224,7 @@ def export_mongodb_to_json():
             # Export users
             users_collection = mongo.get_collection('users')
             users_data = {}
-            for user in users_collection.find():
-                user.pop('_id', None)
+            for user in _export_cursor(users_collection):
                 user_id = user['user_id']
                 users_data[user_id] = user
             
@@ -216,24 +236,33 @@ def export_mongodb_to_json():
             # Export files
             files_collection = mongo.get_collection('files')
             files_data = {}
-            for file_doc in files_collection.find():
-                file_doc.pop('_id', None)
+            for file_doc in _export_cursor(files_collection):
                 file_id = file_doc['file_id']
                 files_data[file_id] = file_doc
             
             with open('data/files_export.json', 'w', encoding='utf-8') as f:
-                json.dump(files_data, f, indent=2, ensure_ascii=False)
+                json.dump(files_data, f, indent=2, ensure_ascii=False, default=_export_default)
             export_count += len(files_data)
             st.write(f"✅ Exported {len(files_data)} files to files_export.json")
             
             # Export learning progress
             learning_collection = mongo.get_collection('learning_progress')
             learning_data = {}
-            for progress in learning_collection.find():
-                progress.pop('_id', None)
+            for progress in _export_cursor(learning_collection):
                 user_id = progress.pop('user_id')
                 learning_data[user_id] = progress
             
+            # Exposures live in their own collection; fold them back into the JSON layout
+            exposure_fields = {'characters': 'character_exposure', 'words': 'word_exposure'}
+            for exposure in _export_cursor(mongo.get_collection('exposures')):
+                exposure = exposure_to_public(exposure)
+                progress = learning_data.setdefault(exposure.pop('user_id'), {})
+                kind, item = exposure.pop('kind'), exposure.pop('item')
+                mastery = exposure.pop('mastery', None)
+                progress.setdefault(exposure_fields[kind], {})[item] = exposure
+                if mastery is not None:
+                    progress.setdefault('mastery_levels', {}).setdefault(kind, {})[item] = mastery
+            
             with open('data/learning_progress_export.json', 'w', encoding='utf-8') as f:
                 json.dump(learning_data, f, indent=2, ensure_ascii=False)
             export_count += len(learning_data)
@@ -1,18 +1,114 @@
+import codecs
+import gzip
+import hashlib
 import io
+import multiprocessing
+import os
+import posixpath
 import re
-from typing import Optional
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import BinaryIO, List, Optional, Union
+from urllib.parse import unquote
+
+# Byte-order marks and the codecs that consume them; UTF-32 first, as its LE mark starts with UTF-16's
+TEXT_BOMS = (
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+# Supported file extensions and the parser kind each maps to
+SUPPORTED_EXTENSIONS = {
+    '.pdf': 'pdf',
+    '.epub': 'epub',
+    '.txt': 'txt',
+    '.text': 'txt'
+}
+
+# Upload MIME types with a known parser kind; generic ones such as application/octet-stream
+# are resolved by extension instead
+SUPPORTED_MIME_TYPES = {
+    'application/pdf': 'pdf',
+    'application/epub+zip': 'epub',
+    'text/plain': 'txt'
+}
+
+# Extracted PDF/EPUB text, gzipped and keyed by content hash; delete the directory to invalidate
+TEXT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'cantonese_learner')
+
+# PDFs with fewer pages than this are extracted in-process; starting worker processes costs more
+PARALLEL_PDF_MIN_PAGES = 32
+
+# Leading bytes of a text file checked for signs of UTF-16 without a byte-order mark
+UTF16_SNIFF_BYTES = 4096
+
+# UTF-16 code units that make up ordinary Chinese text: ASCII, CJK punctuation, ideographs
+# and full-width forms. Other encodings misread as UTF-16 produce mostly other units.
+_UTF16_TEXT_UNITS = re.compile(r'[\t\n\r\x20-\x7e\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]')
+
+
+def _extension(filename: str) -> str:
+    """Lower-cased final extension of a filename including the dot, or '' if it has none."""
+    _, dot, extension = filename.lower().rpartition('.')
+    return f".{extension}" if dot else ''
+
+
+def _looks_like_utf16(data: bytes) -> bool:
+    """
+    Whether BOM-less bytes are likely UTF-16 (little-endian) text.
+    
+    Text in any 8-bit encoding has no NUL bytes, while UTF-16 of ASCII has one in every
+    other byte. Chinese UTF-16 has none, so it is recognised by decoding the start of the
+    data and checking that nearly every unit is one that Chinese text uses.
+    """
+    sample = data[:UTF16_SNIFF_BYTES]
+    if b'\x00' in sample:
+        return True
+    text = sample[:len(sample) & ~1].decode('utf-16-le', errors='replace')
+    return bool(text) and len(_UTF16_TEXT_UNITS.findall(text)) >= 0.9 * len(text)
+
+
+def _read_cached_text(key: str) -> Optional[str]:
+    """Return previously extracted text for a cache key, or None on a miss."""
+    try:
+        with gzip.open(os.path.join(TEXT_CACHE_DIR, f"{key}.txt.gz"), 'rt', encoding='utf-8') as file:
+            return file.read()
+    except (OSError, EOFError, UnicodeDecodeError):
+        return None
+
+
+def _write_cached_text(key: str, text: str):
+    """Store extracted text for a cache key; the cache is best-effort, so write failures are ignored."""
+    path = os.path.join(TEXT_CACHE_DIR, f"{key}.txt.gz")
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(TEXT_CACHE_DIR, exist_ok=True)
+        with gzip.open(temp_path, 'wt', encoding='utf-8', compresslevel=1) as file:
+            file.write(text)
+        os.replace(temp_path, path)
+    except (OSError, ValueError):
+        # ValueError covers UnicodeEncodeError, from text holding lone surrogates
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+
+def _extract_pdf_pages(pdf_bytes: bytes, start: int, stop: int) -> List[str]:
+    """Extract the text of pages [start, stop) of an in-memory PDF; runs in a worker process."""
+    import PyPDF2
+    
+    pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
+    return [(page.extract_text() or "") + "\n" for page in islice(pdf_reader.pages, start, stop)]
+
 
 class FileParser:
     """Handles parsing of different file formats to extract text content."""
     
-    def __init__(self):
-        self.supported_types = {
-            'application/pdf': self._parse_pdf,
-            'application/epub+zip': self._parse_epub,
-            'text/plain': self._parse_txt,
-            'application/octet-stream': self._parse_by_extension  # Fallback for some uploads
-        }
-    
     def parse_file(self, file_path: str, mime_type: str) -> str:
         """
         Parse a file and extract text content.
@@ -28,40 +124,86 @@ class FileParser:
             ValueError: If file type is not supported
             Exception: If parsing fails
         """
-        if mime_type in self.supported_types:
-            return self.supported_types[mime_type](file_path)
+        # Unknown and generic MIME types are resolved by file extension
+        kind = SUPPORTED_MIME_TYPES.get(mime_type) or self._kind_by_extension(file_path)
+        if kind == 'txt':
+            return self._parse_txt(file_path)
+        
+        # PDFs and EPUBs go through the stream path to share its on-disk text cache
+        with open(file_path, 'rb') as file:
+            return self.parse_stream(file, mime_type, file_path)
+    
+    def parse_stream(self, stream: BinaryIO, mime_type: str, filename: str = "") -> str:
+        """
+        Parse an in-memory file and extract text content without writing it to disk.
+        
+        Args:
+            stream: Binary file-like object positioned at the start of the file
+            mime_type: MIME type of the file
+            filename: Original filename, used when the MIME type is not recognized
+            
+        Returns:
+            Extracted text content as string
+            
+        Raises:
+            ValueError: If file type is not supported
+            Exception: If parsing fails
+        """
+        kind = SUPPORTED_MIME_TYPES.get(mime_type) or self._kind_by_extension(filename)
+        
+        if kind == 'txt':
+            try:
+                return self._decode_txt(stream.read())
+            except Exception as e:
+                raise Exception(f"Failed to parse text file: {str(e)}")
+        
+        # PDF and EPUB extraction is slow, so reuse text from an earlier parse of the same bytes
+        content = stream.read()
+        cache_key = f"{hashlib.sha1(content).hexdigest()}-{kind}"
+        text = _read_cached_text(cache_key)
+        if text is not None:
+            return text
+        
+        if kind == 'pdf':
+            # PyPDF2 and pdfplumber both read from file-like objects
+            text = self._parse_pdf(io.BytesIO(content))
         else:
-            # Try to determine by file extension
-            return self._parse_by_extension(file_path)
+            text = self._parse_epub(io.BytesIO(content))
+        
+        _write_cached_text(cache_key, text)
+        return text
     
-    def _parse_pdf(self, file_path: str) -> str:
-        """Parse PDF file and extract text content."""
+    def _parse_pdf(self, source: Union[str, BinaryIO]) -> str:
+        """Parse PDF file (path or binary stream) and extract text content."""
         try:
             import PyPDF2
             
-            text_content = ""
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                
-                for page_num in range(len(pdf_reader.pages)):
-                    page = pdf_reader.pages[page_num]
-                    text_content += page.extract_text() + "\n"
+            pdf_reader = PyPDF2.PdfReader(source)
+            page_count = len(pdf_reader.pages)
+            workers = min(os.cpu_count() or 1, page_count // PARALLEL_PDF_MIN_PAGES)
+            
+            if workers > 1:
+                return "".join(self._extract_pdf_pages_parallel(source, page_count, workers))
+            
+            page_texts = []
+            for page in pdf_reader.pages:
+                page_texts.append((page.extract_text() or "") + "\n")
             
-            return text_content
+            return "".join(page_texts)
             
         except ImportError:
             # Fallback to pdfplumber if PyPDF2 is not available
             try:
                 import pdfplumber
                 
-                text_content = ""
-                with pdfplumber.open(file_path) as pdf:
+                page_texts = []
+                with pdfplumber.open(source) as pdf:
                     for page in pdf.pages:
                         page_text = page.extract_text()
                         if page_text:
-                            text_content += page_text + "\n"
+                            page_texts.append(page_text + "\n")
                 
-                return text_content
+                return "".join(page_texts)
                 
             except ImportError:
                 raise Exception("PDF parsing libraries not available. Please install PyPDF2 or pdfplumber.")
@@ -69,30 +211,68 @@ class FileParser:
         except Exception as e:
             raise Exception(f"Failed to parse PDF: {str(e)}")
     
-    def _parse_epub(self, file_path: str) -> str:
-        """Parse EPUB file and extract text content."""
+    def _extract_pdf_pages_parallel(self, source: Union[str, BinaryIO], page_count: int, workers: int) -> List[str]:
+        """Split page extraction into contiguous page ranges across a process pool, in page order."""
+        if isinstance(source, str):
+            with open(source, 'rb') as file:
+                pdf_bytes = file.read()
+        else:
+            source.seek(0)
+            pdf_bytes = source.read()
+        
+        bounds = [page_count * i // workers for i in range(workers + 1)]
+        # spawn rather than fork, since the stores keep timer threads in this process
+        with ProcessPoolExecutor(max_workers=workers,
+                                 mp_context=multiprocessing.get_context('spawn')) as executor:
+            chunks = executor.map(
+                _extract_pdf_pages,
+                [pdf_bytes] * workers,
+                bounds[:-1],
+                bounds[1:]
+            )
+            return [text for chunk in chunks for text in chunk]
+    
+    def _parse_epub(self, source: Union[str, BinaryIO]) -> str:
+        """Parse EPUB file (path or binary stream) and extract text content."""
         try:
-            import ebooklib
-            from ebooklib import epub
-            import html2text
+            from lxml import etree, html
             
-            book = epub.read_epub(file_path)
-            text_content = ""
+            document_texts = []
             
-            # Convert HTML to text
-            h = html2text.HTML2Text()
-            h.ignore_links = True
-            h.ignore_images = True
+            # Only the text nodes matter for frequency analysis, so pull them out with lxml
+            # rather than rendering Markdown through html2text
+            parser = html.HTMLParser(encoding='utf-8')
             
-            for item in book.get_items():
-                if item.get_type() == ebooklib.ITEM_DOCUMENT:
-                    content = item.get_content().decode('utf-8')
-                    text_content += h.handle(content) + "\n"
+            # An EPUB is a zip archive: META-INF/container.xml names the package file, whose
+            # manifest lists the XHTML documents. Reading it with zipfile directly works on
+            # in-memory uploads, where ebooklib needs a path on disk.
+            with zipfile.ZipFile(source) as archive:
+                container = etree.fromstring(archive.read('META-INF/container.xml'))
+                package_path = container.find('.//{*}rootfile').get('full-path')
+                package = etree.fromstring(archive.read(package_path))
+                package_dir = posixpath.dirname(package_path)
+                
+                for item in package.iterfind('{*}manifest/{*}item'):
+                    # Same documents ebooklib reports as ITEM_DOCUMENT: XHTML, minus the nav page
+                    if item.get('media-type') != 'application/xhtml+xml' or 'nav' in item.get('properties', '').split():
+                        continue
+                    
+                    item_path = posixpath.normpath(posixpath.join(package_dir, unquote(item.get('href', ''))))
+                    try:
+                        content = archive.read(item_path)
+                    except KeyError:
+                        continue
+                    if not content.strip():
+                        continue
+                    
+                    document = html.fromstring(content, parser=parser)
+                    etree.strip_elements(document, 'head', 'script', 'style', with_tail=False)
+                    document_texts.append(document.text_content() + "\n")
             
-            return text_content
+            return "".join(document_texts)
             
         except ImportError:
-            raise Exception("EPUB parsing library not available. Please install ebooklib and html2text.")
+            raise Exception("EPUB parsing library not available. Please install lxml.")
         
         except Exception as e:
             raise Exception(f"Failed to parse EPUB: {str(e)}")
@@ -100,37 +280,57 @@ class FileParser:
     def _parse_txt(self, file_path: str) -> str:
         """Parse text file and return content."""
         try:
-            # Try different encodings
-            encodings = ['utf-8', 'utf-16', 'gb2312', 'gbk', 'big5']
+            with open(file_path, 'rb') as file:
+                return self._decode_txt(file.read())
+                
+        except Exception as e:
+            raise Exception(f"Failed to parse text file: {str(e)}")
+    
+    def _decode_txt(self, data: bytes) -> str:
+        """Decode raw text file bytes, trying common Chinese encodings in turn."""
+        # A byte-order mark names the encoding outright, so skip trial decoding
+        text = None
+        for bom, encoding in TEXT_BOMS:
+            if data.startswith(bom):
+                try:
+                    text = data.decode(encoding)
+                except UnicodeDecodeError:
+                    pass
+                break
+        
+        if text is None:
+            # Try different encodings. GBK is a superset of GB2312, so a separate GB2312
+            # attempt would only add a second full failed decode for GBK files. Almost any
+            # even-length byte string "decodes" as UTF-16 and GBK alike, so UTF-16 without a
+            # BOM is tried before GBK and Big5 only when the bytes look like UTF-16 text
+            encodings = ['utf-8', 'gbk', 'big5']
+            if _looks_like_utf16(data):
+                # ASCII also reads as CJK ideographs in UTF-16, so valid UTF-8 still comes
+                # first unless the bytes contain NULs
+                encodings.insert(0 if b'\x00' in data[:UTF16_SNIFF_BYTES] else 1, 'utf-16')
+            else:
+                encodings.append('utf-16')
             
             for encoding in encodings:
                 try:
-                    with open(file_path, 'r', encoding=encoding) as file:
-                        return file.read()
+                    text = data.decode(encoding)
+                    break
                 except UnicodeDecodeError:
                     continue
-            
-            # If all encodings fail, try with error handling
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as file:
-                return file.read()
-                
-        except Exception as e:
-            raise Exception(f"Failed to parse text file: {str(e)}")
-    
-    def _parse_by_extension(self, file_path: str) -> str:
-        """Determine parsing method by file extension."""
-        file_path_lower = file_path.lower()
+            else:
+                # If all encodings fail, try with error handling
+                text = data.decode('utf-8', errors='ignore')
         
-        if file_path_lower.endswith('.pdf'):
-            return self._parse_pdf(file_path)
-        elif file_path_lower.endswith('.epub'):
-            return self._parse_epub(file_path)
-        elif file_path_lower.endswith(('.txt', '.text')):
-            return self._parse_txt(file_path)
-        else:
+        # Match the newline translation of reading in text mode
+        return text.replace('\r\n', '\n').replace('\r', '\n')
+    
+    def _kind_by_extension(self, filename: str) -> str:
+        """Map a filename to 'pdf', 'epub' or 'txt' by its extension."""
+        kind = SUPPORTED_EXTENSIONS.get(_extension(filename))
+        if kind is None:
             raise ValueError(f"Unsupported file type. Supported formats: PDF, EPUB, TXT")
+        return kind
     
     def is_supported_file(self, filename: str) -> bool:
         """Check if a file type is supported based on filename."""
-        supported_extensions = ['.pdf', '.epub', '.txt', '.text']
-        return any(filename.lower().endswith(ext) for ext in supported_extensions)
+        return _extension(filename) in SUPPORTED_EXTENSIONS
@@ -2,12 +2,55 @@
 File tracking and analysis history management module.
 """
 
-import json
 import os
+import threading
 import hashlib
+from collections import defaultdict
 from datetime import datetime
-from typing import Dict, Any, Optional, List
+from heapq import nlargest
+from typing import Dict, Any, Optional, List, Set, Tuple
 import uuid
+import zlib
+
+from json_store import JsonStore
+
+
+# Analysis records are appended to a log next to the JSON file instead of rewriting it;
+# once this many accumulate they are folded into a full save, which empties the log
+ANALYSIS_LOG_CHECKPOINT = 200
+
+# Stored uploads are deflated when a sample of this many bytes shrinks by at least 10%
+COMPRESS_SAMPLE_BYTES = 64 * 1024
+
+
+def pack_content(file_content: bytes) -> Tuple[bytes, Optional[str]]:
+    """Deflate uploads that compress well (plain text); PDFs and EPUBs are already compressed."""
+    sample = file_content[:COMPRESS_SAMPLE_BYTES]
+    if len(sample) and len(zlib.compress(sample, 1)) < len(sample) * 0.9:
+        return zlib.compress(file_content), 'zlib'
+    return bytes(file_content), None
+
+
+def unpack_content(payload: bytes, content_encoding: Optional[str]) -> bytes:
+    """Undo pack_content."""
+    return zlib.decompress(payload) if content_encoding == 'zlib' else payload
+
+
+def apply_analysis_record(file_data: Dict[str, Any], record: Dict[str, Any]):
+    """Add an analysis record to a file's history, keeping the last 20; replaying a record is a no-op."""
+    history = file_data.setdefault('analysis_history', [])
+    if any(existing.get('analysis_id') == record['analysis_id'] for existing in history):
+        return
+    history.append(record)
+    del history[:-20]
+    file_data['last_accessed'] = max(file_data.get('last_accessed', ''), record['timestamp'])
+
+
+def apply_logged_record(data: Dict[str, Any], entry: Dict[str, Any]):
+    """Replay one entry of the analysis log onto the loaded file records."""
+    file_data = data.get(entry['file_id'])
+    if file_data is not None:
+        apply_analysis_record(file_data, entry['record'])
 
 
 class FileTracker:
@@ -22,35 +65,43 @@ class FileTracker:
         """
         self.db_path = db_path
         self.db_dir = os.path.dirname(db_path)
-        self._ensure_db_exists()
-    
-    def _ensure_db_exists(self):
-        """Ensure the database directory and file exist."""
-        if not os.path.exists(self.db_dir):
-            os.makedirs(self.db_dir)
+        self.uploads_dir = os.path.join(self.db_dir, "uploads")
         
-        if not os.path.exists(self.db_path):
-            self._save_data({})
-    
-    def _load_data(self) -> Dict[str, Any]:
-        """Load data from the JSON database file."""
-        try:
-            with open(self.db_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {}
+        # Records stay in memory after the first load, with analysis records appended to a
+        # log rather than rewriting the file; _lock guards the records and the indexes
+        self._lock = threading.RLock()
+        self._hash_index: Dict[str, str] = {}
+        self._user_index: Dict[str, Set[str]] = defaultdict(set)
+        self._store = JsonStore(
+            db_path, lock=self._lock,
+            log_path=os.path.join(self.db_dir, "analysis.jsonl"),
+            log_checkpoint=ANALYSIS_LOG_CHECKPOINT,
+            apply_log_entry=apply_logged_record,
+            on_load=self._build_indexes,
+            indent=True
+        )
     
-    def _save_data(self, data: Dict[str, Any]):
-        """Save data to the JSON database file."""
-        with open(self.db_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+    def _build_indexes(self, data: Dict[str, Any]):
+        """Index the loaded records by content hash and by the users who accessed each file."""
+        self._hash_index = {}
+        self._user_index = defaultdict(set)
+        for file_id, file_data in data.items():
+            self._hash_index.setdefault(file_data.get('file_hash'), file_id)
+            for user_id in file_data.get('accessed_by', []):
+                self._user_index[user_id].add(file_id)
     
     def _generate_file_hash(self, content: bytes) -> str:
-        """Generate a unique hash for file content."""
+        """
+        Generate a unique hash for file content.
+        
+        Every byte is hashed: an upload whose hash matches is treated as the same file
+        and its stored copy is reused, so a sampled hash could silently swap an edited
+        book for an older version of the same size.
+        """
         return hashlib.sha256(content).hexdigest()[:16]
     
     def register_file(self, filename: str, file_content: bytes, user_id: str, 
-                     file_size: int, file_type: str = None) -> str:
+                     file_size: int, file_type: str = None, file_hash: str = None) -> str:
         """
         Register a new file or retrieve existing file ID.
         
@@ -60,73 +111,109 @@ class FileTracker:
             user_id: User who uploaded the file
             file_size: Size of file in bytes
             file_type: MIME type of file
+            file_hash: Precomputed _generate_file_hash of file_content, if the caller has it
             
         Returns:
             File ID string
         """
-        data = self._load_data()
-        file_hash = self._generate_file_hash(file_content)
-        
-        # Check if file already exists
-        for file_id, file_data in data.items():
-            if file_data.get('file_hash') == file_hash:
+        with self._lock:
+            data = self._store.load()
+            file_hash = file_hash or self._generate_file_hash(file_content)
+            now = datetime.now().isoformat()
+            
+            # Check if file already exists
+            file_id = self._hash_index.get(file_hash)
+            if file_id is not None:
+                file_data = data[file_id]
+                
                 # Update last accessed
-                file_data['last_accessed'] = datetime.now().isoformat()
+                file_data['last_accessed'] = now
                 file_data['access_count'] = file_data.get('access_count', 0) + 1
                 
-                # Add user to accessed_by if not already there
-                if user_id not in file_data.get('accessed_by', []):
+                # Add user to accessed_by if not already there; the user index answers
+                # that without scanning the file's accessed_by list
+                user_file_ids = self._user_index[user_id]
+                if file_id not in user_file_ids:
                     file_data.setdefault('accessed_by', []).append(user_id)
+                    user_file_ids.add(file_id)
                 
-                self._save_data(data)
+                self._store.save(data)
                 return file_id
-        
-        # Create new file record
-        file_id = str(uuid.uuid4())[:12]
-        
-        # Store file content as base64 for re-analysis capability
-        import base64
-        file_content_b64 = base64.b64encode(file_content).decode('utf-8')
-        
-        file_data = {
-            'file_id': file_id,
-            'filename': filename,
-            'file_hash': file_hash,
-            'file_size': file_size,
-            'file_type': file_type,
-            'uploaded_by': user_id,
-            'uploaded_at': datetime.now().isoformat(),
-            'last_accessed': datetime.now().isoformat(),
-            'access_count': 1,
-            'accessed_by': [user_id],
-            'analysis_history': [],
-            'file_content': file_content_b64,  # Store for re-analysis
-            'metadata': {
-                'original_filename': filename,
-                'upload_session': str(uuid.uuid4())[:8]
+            
+            # Create new file record
+            file_id = str(uuid.uuid4())[:12]
+            
+            # Store file content (deflated if it helps) next to the database for re-analysis,
+            # so files.json only holds metadata and stays quick to parse
+            payload, content_encoding = pack_content(file_content)
+            content_file = self._write_upload(file_id, payload)
+            
+            file_data = {
+                'file_id': file_id,
+                'filename': filename,
+                'file_hash': file_hash,
+                'file_size': file_size,
+                'file_type': file_type,
+                'uploaded_by': user_id,
+                'uploaded_at': now,
+                'last_accessed': now,
+                'access_count': 1,
+                'accessed_by': [user_id],
+                'analysis_history': [],
+                'file_content_file': content_file,  # Stored for re-analysis
+                'content_encoding': content_encoding,
+                'metadata': {
+                    'original_filename': filename,
+                    'upload_session': str(uuid.uuid4())[:8]
+                }
             }
-        }
-        
-        data[file_id] = file_data
-        self._save_data(data)
-        
-        return file_id
+            
+            data[file_id] = file_data
+            self._hash_index[file_hash] = file_id
+            self._user_index[user_id].add(file_id)
+            self._store.save(data)
+            
+            return file_id
+    
+    def _write_upload(self, file_id: str, payload: bytes) -> str:
+        """Write stored file content to the uploads directory and return its file name."""
+        os.makedirs(self.uploads_dir, exist_ok=True)
+        content_file = f"{file_id}.bin"
+        content_path = os.path.join(self.uploads_dir, content_file)
+        temp_path = f"{content_path}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(payload)
+        os.replace(temp_path, content_path)
+        return content_file
+    
+    def _read_upload(self, file_data: Dict[str, Any]) -> Optional[bytes]:
+        """Read a record's stored content, still packed; records saved before uploads were split out hold base64 text."""
+        if 'file_content_file' in file_data:
+            with open(os.path.join(self.uploads_dir, file_data['file_content_file']), 'rb') as f:
+                return f.read()
+        if 'file_content' in file_data:
+            import base64
+            return base64.b64decode(file_data['file_content'])
+        return None
     
     def get_file_content(self, file_id: str) -> Optional[bytes]:
         """Get the original file content for re-analysis."""
-        data = self._load_data()
+        data = self._store.load()
         file_data = data.get(file_id)
         
-        if not file_data or 'file_content' not in file_data:
+        if not file_data:
             return None
         
-        import base64
         try:
-            return base64.b64decode(file_data['file_content'])
+            payload = self._read_upload(file_data)
+            if payload is None:
+                return None
+            return unpack_content(payload, file_data.get('content_encoding'))
         except Exception:
             return None
     
-    def add_analysis_record(self, file_id: str, user_id: str, analysis_results: Dict[str, Any]):
+    def add_analysis_record(self, file_id: str, user_id: str, analysis_results: Dict[str, Any],
+                            timestamp: Optional[str] = None):
         """
         Add an analysis record to a file's history.
         
@@ -134,68 +221,111 @@ class FileTracker:
             file_id: File identifier
             user_id: User who performed the analysis
             analysis_results: Complete analysis results
+            timestamp: ISO time of the analysis; defaults to now
         """
-        data = self._load_data()
-        
-        if file_id not in data:
-            return False
-        
-        analysis_record = {
-            'analysis_id': str(uuid.uuid4())[:8],
-            'user_id': user_id,
-            'timestamp': datetime.now().isoformat(),
-            'analysis_type': analysis_results.get('analysis_type', 'both'),
-            'settings_used': analysis_results.get('settings_used', {}),
-            'character_stats': {
-                'total_chars': analysis_results.get('character_stats', {}).get('total_chars', 0),
-                'unique_chars': analysis_results.get('character_stats', {}).get('unique_han_chars', 0),
-                'top_10_chars': analysis_results.get('top_characters', {})
-            },
-            'word_stats': {
-                'total_words': analysis_results.get('word_stats', {}).get('total_words', 0),
-                'unique_words': analysis_results.get('word_stats', {}).get('unique_words', 0),
-                'han_words_count': len(analysis_results.get('word_stats', {}).get('han_words', {})),
-                'top_10_words': analysis_results.get('top_words', {})
+        with self._lock:
+            data = self._store.load()
+            
+            if file_id not in data:
+                return False
+            
+            character_stats = analysis_results.get('character_stats', {})
+            word_stats = analysis_results.get('word_stats', {})
+            analysis_record = {
+                'analysis_id': str(uuid.uuid4())[:8],
+                'user_id': user_id,
+                'timestamp': timestamp or datetime.now().isoformat(),
+                'analysis_type': analysis_results.get('analysis_type', 'both'),
+                'settings_used': analysis_results.get('settings_used', {}),
+                'character_stats': {
+                    'total_chars': character_stats.get('total_chars', 0),
+                    'unique_chars': character_stats.get('unique_han_chars', 0),
+                    'top_10_chars': analysis_results.get('top_characters', {})
+                },
+                'word_stats': {
+                    'total_words': word_stats.get('total_words', 0),
+                    'unique_words': word_stats.get('unique_words', 0),
+                    'han_words_count': len(word_stats.get('han_words', {})),
+                    'top_10_words': analysis_results.get('top_words', {})
+                }
             }
-        }
-        
-        data[file_id]['analysis_history'].append(analysis_record)
-        data[file_id]['last_accessed'] = datetime.now().isoformat()
-        
-        # Keep only last 20 analysis records per file
-        if len(data[file_id]['analysis_history']) > 20:
-            data[file_id]['analysis_history'] = data[file_id]['analysis_history'][-20:]
-        
-        self._save_data(data)
-        return True
+            
+            # Keeps only the last 20 analysis records per file; the record is appended to
+            # the analysis log rather than rewriting the whole JSON file
+            apply_analysis_record(data[file_id], analysis_record)
+            self._store.append_log({'file_id': file_id, 'record': analysis_record})
+            return True
     
-    def get_file_info(self, file_id: str) -> Optional[Dict[str, Any]]:
-        """Get complete information about a file."""
-        data = self._load_data()
+    def get_file_info(self, file_id: str, include_content: bool = True) -> Optional[Dict[str, Any]]:
+        """Get complete information about a file; include_content is accepted for parity with the MongoDB tracker."""
+        data = self._store.load()
         return data.get(file_id)
     
-    def get_user_files(self, user_id: str) -> List[Dict[str, Any]]:
-        """Get all files accessed by a user."""
-        data = self._load_data()
-        user_files = []
+    def get_all_files(self, inline_content: bool = False) -> Dict[str, Dict[str, Any]]:
+        """
+        Get every file record keyed by file ID, including analysis records still in the log.
         
-        for file_data in data.values():
-            if user_id in file_data.get('accessed_by', []):
-                user_files.append(file_data)
+        With inline_content, records are copies whose stored content is embedded as base64
+        file_content, as exports and migrations expect.
+        """
+        data = self._store.load()
+        if not inline_content:
+            return data
+        
+        import base64
+        files = {}
+        for file_id, file_data in data.items():
+            file_data = dict(file_data)
+            if 'file_content_file' in file_data:
+                try:
+                    payload = self._read_upload(file_data)
+                except OSError:
+                    payload = None
+                del file_data['file_content_file']
+                if payload is not None:
+                    file_data['file_content'] = base64.b64encode(payload).decode('utf-8')
+            files[file_id] = file_data
+        return files
+    
+    def find_file_by_hash(self, file_hash: str) -> Optional[Dict[str, Any]]:
+        """Get the record of a previously registered file with this content hash."""
+        data = self._store.load()
+        file_id = self._hash_index.get(file_hash)
+        return data[file_id] if file_id is not None else None
+    
+    def get_user_files(self, user_id: str, limit: int = 0) -> List[Dict[str, Any]]:
+        """
+        Get files accessed by a user, most recently accessed first; limit=0 returns all of them.
         
-        # Sort by last accessed (most recent first)
-        return sorted(user_files, key=lambda x: x.get('last_accessed', ''), reverse=True)
+        Each record carries analysis_count, the length of its analysis history.
+        """
+        # Under the lock, since register_file adds to the user's file id set from other sessions
+        with self._lock:
+            data = self._store.load()
+            
+            # Sort by last accessed (most recent first), picking only the first `limit` files
+            # when there is one, and copy just the records that are returned
+            file_ids = self._user_index.get(user_id, ())
+            last_accessed = lambda file_id: data[file_id].get('last_accessed', '')
+            if limit:
+                file_ids = nlargest(limit, file_ids, key=last_accessed)
+            else:
+                file_ids = sorted(file_ids, key=last_accessed, reverse=True)
+            return [
+                dict(data[file_id], analysis_count=len(data[file_id].get('analysis_history', [])))
+                for file_id in file_ids
+            ]
     
     def get_file_analysis_history(self, file_id: str, user_id: str = None) -> List[Dict[str, Any]]:
         """Get analysis history for a file, optionally filtered by user."""
-        data = self._load_data()
+        data = self._store.load()
         
         if file_id not in data:
             return []
         
         history = data[file_id]['analysis_history']
         
+        # Records are appended in time order, so newest-first is the list reversed
         if user_id:
-            history = [record for record in history if record['user_id'] == user_id]
-        
-        return sorted(history, key=lambda x: x['timestamp'], reverse=True)
\ No newline at end of file
+            return [record for record in reversed(history) if record['user_id'] == user_id]
+        return history[::-1]
\ No newline at end of file
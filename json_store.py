@@ -0,0 +1,209 @@
+"""
+In-memory JSON record store with coalesced background saves, shared by the JSON trackers.
+"""
+
+import atexit
+import json
+import os
+import threading
+from typing import Any, Callable, Dict, Optional
+
+# orjson parses and encodes the records several times faster than the stdlib json module
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Saves are coalesced and written this long after the first unsaved change
+SAVE_DELAY_SECONDS = 0.5
+
+
+def _json_default(value):
+    """Encode in-memory sets, such as the learning trackers' file id sets, as sorted lists."""
+    if isinstance(value, set):
+        return sorted(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _loads(raw: bytes) -> Any:
+    """Parse JSON bytes with orjson when it is installed."""
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+
+class JsonStore:
+    """
+    A JSON file of records held in memory and written back on a background timer.
+    
+    The file is parsed on first use and again only when its modification time shows another
+    process rewrote it; unsaved local changes take precedence. Small updates can be appended
+    to a log next to the file instead of rewriting it; the log is replayed on load and folded
+    into the next full save once log_checkpoint entries accumulate.
+    
+    Callers change the records returned by load() while holding lock, then call save().
+    """
+    
+    def __init__(self, path: str, lock: Optional[threading.RLock] = None,
+                 log_path: Optional[str] = None, log_checkpoint: int = 200,
+                 apply_log_entry: Optional[Callable[[Dict[str, Any], Dict[str, Any]], None]] = None,
+                 on_load: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 indent: bool = False):
+        """
+        Args:
+            path: JSON file holding the records
+            lock: Lock guarding the records; shared with the owner so its own state changes with them
+            log_path: Append-only log of updates not yet in the JSON file, if the owner uses one
+            log_checkpoint: Number of logged updates that triggers a full save
+            apply_log_entry: Applies one logged update to the records; must be idempotent
+            on_load: Called with the records after each (re)load, e.g. to rebuild indexes
+            indent: Write the file indented for reading by hand
+        """
+        self.path = path
+        self.log_path = log_path
+        self.lock = lock or threading.RLock()
+        self._log_checkpoint = log_checkpoint
+        self._apply_log_entry = apply_log_entry
+        self._on_load = on_load
+        self._indent = indent
+        
+        self._cache: Optional[Dict[str, Any]] = None
+        self._cache_mtime_ns: Optional[int] = None
+        self._dirty = False
+        self._flush_timer: Optional[threading.Timer] = None
+        # Keeps overlapping flushes writing in order while lock is released for the write
+        self._write_lock = threading.Lock()
+        # Entries and bytes in the log that the JSON file does not hold yet
+        self._log_entries = 0
+        self._log_bytes = 0
+        atexit.register(self.flush)
+        
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        if not os.path.exists(path):
+            self._write_payload(self._encode({}))
+    
+    def load(self) -> Dict[str, Any]:
+        """Return the in-memory records, (re)reading the file when needed."""
+        with self.lock:
+            if self._cache is not None and not self._dirty and self._file_mtime_ns() != self._cache_mtime_ns:
+                self._cache = None
+            
+            if self._cache is None:
+                self._cache_mtime_ns = self._file_mtime_ns()
+                try:
+                    with open(self.path, 'rb') as f:
+                        self._cache = _loads(f.read())
+                except (FileNotFoundError, ValueError):
+                    self._cache = {}
+                self._replay_log()
+                if self._on_load is not None:
+                    self._on_load(self._cache)
+            return self._cache
+    
+    def save(self, data: Optional[Dict[str, Any]] = None):
+        """Adopt data (by default the loaded records) and schedule a coalesced write to disk."""
+        with self.lock:
+            if data is not None:
+                self._cache = data
+            self._dirty = True
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer(SAVE_DELAY_SECONDS, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+    
+    def append_log(self, entry: Dict[str, Any]):
+        """Append one update, already applied to the records, to the log instead of saving them."""
+        if orjson is not None:
+            line = orjson.dumps(entry, option=orjson.OPT_NON_STR_KEYS) + b"\n"
+        else:
+            line = json.dumps(entry, ensure_ascii=False).encode('utf-8') + b"\n"
+        with self.lock:
+            with open(self.log_path, 'ab') as f:
+                f.write(line)
+            self._log_entries += 1
+            self._log_bytes += len(line)
+            if self._log_entries >= self._log_checkpoint:
+                self.save()
+    
+    def flush(self):
+        """Write pending changes to the JSON file, if there are any."""
+        # Only the encoding holds lock; requests can change records again while the file is
+        # written and synced
+        with self._write_lock:
+            with self.lock:
+                self._flush_timer = None
+                if not self._dirty:
+                    return
+                payload = self._encode(self._cache)
+                logged_bytes = self._log_bytes
+                self._dirty = False
+            try:
+                self._write_payload(payload)
+            except OSError:
+                with self.lock:
+                    self._dirty = True
+                raise
+            with self.lock:
+                self._truncate_log(logged_bytes)
+    
+    def _file_mtime_ns(self) -> Optional[int]:
+        """Modification time of the JSON file, or None if it does not exist."""
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+    
+    def _replay_log(self):
+        """Apply logged updates appended since the JSON file was last written."""
+        self._log_entries = 0
+        self._log_bytes = 0
+        if self.log_path is None:
+            return
+        try:
+            with open(self.log_path, 'rb') as f:
+                for line in f:
+                    self._log_bytes += len(line)
+                    try:
+                        entry = _loads(line)
+                    except ValueError:
+                        # A line torn by a crash mid-append
+                        continue
+                    self._log_entries += 1
+                    self._apply_log_entry(self._cache, entry)
+        except FileNotFoundError:
+            pass
+    
+    def _truncate_log(self, written_bytes: int):
+        """Drop the first written_bytes of the log, which the JSON file now holds."""
+        if not written_bytes:
+            return
+        with open(self.log_path, 'rb') as f:
+            f.seek(written_bytes)
+            tail = f.read()
+        # Entries appended while the JSON file was being written stay in the log
+        temp_path = f"{self.log_path}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(tail)
+        os.replace(temp_path, self.log_path)
+        self._log_entries = tail.count(b"\n")
+        self._log_bytes = len(tail)
+    
+    def _encode(self, data: Dict[str, Any]) -> bytes:
+        """Encode the records for the JSON file in one piece."""
+        if orjson is not None:
+            option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if self._indent else 0)
+            return orjson.dumps(data, default=_json_default, option=option)
+        if self._indent:
+            return json.dumps(data, ensure_ascii=False, indent=2, default=_json_default).encode('utf-8')
+        return json.dumps(
+            data, ensure_ascii=False, separators=(',', ':'), default=_json_default
+        ).encode('utf-8')
+    
+    def _write_payload(self, payload: bytes):
+        """Write an encoded document to the JSON file, replacing it atomically."""
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(payload)
+            # Saves run on the background flush, so syncing before the rename costs requests nothing
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        self._cache_mtime_ns = self._file_mtime_ns()
@@ -2,11 +2,28 @@
 Learning progress tracker for characters and words.
 """
 
-import json
 import os
+import threading
 from datetime import datetime
-from typing import Dict, Any, List, Set
-from collections import defaultdict
+from typing import Dict, Any, List, Set, Optional
+from collections import Counter
+from operator import itemgetter
+
+from json_store import JsonStore
+
+
+# Each character and word keeps only its most recent per-file frequency entries
+MAX_FREQ_HISTORY = 20
+
+
+def files_as_sets(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Turn the file id lists of freshly loaded records into sets, for constant-time membership."""
+    for user_data in data.values():
+        user_data['unique_files_analyzed'] = set(user_data.get('unique_files_analyzed', []))
+        for field in ('character_exposure', 'word_exposure'):
+            for item_data in user_data.get(field, {}).values():
+                item_data['files_seen_in'] = set(item_data.get('files_seen_in', []))
+    return data
 
 
 class LearningTracker:
@@ -21,31 +38,14 @@ class LearningTracker:
         """
         self.db_path = db_path
         self.db_dir = os.path.dirname(db_path)
-        self._ensure_db_exists()
-    
-    def _ensure_db_exists(self):
-        """Ensure the database directory and file exist."""
-        if not os.path.exists(self.db_dir):
-            os.makedirs(self.db_dir)
         
-        if not os.path.exists(self.db_path):
-            self._save_data({})
-    
-    def _load_data(self) -> Dict[str, Any]:
-        """Load data from the JSON database file."""
-        try:
-            with open(self.db_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {}
-    
-    def _save_data(self, data: Dict[str, Any]):
-        """Save data to the JSON database file."""
-        with open(self.db_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        # Records stay in memory after the first load and are written back in the background;
+        # _lock guards the records
+        self._lock = threading.RLock()
+        self._store = JsonStore(db_path, lock=self._lock, on_load=files_as_sets)
     
     def track_exposure(self, user_id: str, characters: Dict[str, int], words: Dict[str, int],
-                      file_id: str, filename: str):
+                      file_id: str, filename: str, timestamp: Optional[str] = None):
         """
         Track user exposure to characters and words from a file.
         
@@ -55,111 +55,119 @@ class LearningTracker:
             words: Word frequency data
             file_id: File identifier
             filename: Original filename
+            timestamp: ISO time of the analysis; defaults to now
         """
-        data = self._load_data()
-        
-        if user_id not in data:
-            data[user_id] = {
-                'character_exposure': {},
-                'word_exposure': {},
-                'learning_sessions': [],
-                'mastery_levels': {
-                    'characters': {},
-                    'words': {}
-                },
-                'total_exposures': 0,
-                'unique_files_analyzed': set()
-            }
-        
-        user_data = data[user_id]
-        timestamp = datetime.now().isoformat()
-        
-        # Track character exposure
-        for char, frequency in characters.items():
-            if char not in user_data['character_exposure']:
-                user_data['character_exposure'][char] = {
+        with self._lock:
+            data = self._store.load()
+            
+            if user_id not in data:
+                data[user_id] = {
+                    'character_exposure': {},
+                    'word_exposure': {},
+                    'learning_sessions': [],
+                    'mastery_levels': {
+                        'characters': {},
+                        'words': {}
+                    },
                     'total_exposures': 0,
-                    'files_seen_in': [],
-                    'first_seen': timestamp,
-                    'last_seen': timestamp,
-                    'frequency_history': []
+                    'unique_files_analyzed': set()
                 }
             
-            char_data = user_data['character_exposure'][char]
-            char_data['total_exposures'] += frequency
-            char_data['last_seen'] = timestamp
-            char_data['frequency_history'].append({
-                'file_id': file_id,
-                'filename': filename,
-                'frequency': frequency,
-                'date': timestamp
-            })
+            user_data = data[user_id]
+            timestamp = timestamp or datetime.now().isoformat()
             
-            if file_id not in char_data['files_seen_in']:
-                char_data['files_seen_in'].append(file_id)
-        
-        # Track word exposure
-        for word, frequency in words.items():
-            if word not in user_data['word_exposure']:
-                user_data['word_exposure'][word] = {
-                    'total_exposures': 0,
-                    'files_seen_in': [],
-                    'first_seen': timestamp,
-                    'last_seen': timestamp,
-                    'frequency_history': []
-                }
+            # Track character exposure
+            for char, frequency in characters.items():
+                if char not in user_data['character_exposure']:
+                    user_data['character_exposure'][char] = {
+                        'total_exposures': 0,
+                        'files_seen_in': set(),
+                        'files_count': 0,
+                        'first_seen': timestamp,
+                        'last_seen': timestamp,
+                        'frequency_history': []
+                    }
+                
+                char_data = user_data['character_exposure'][char]
+                char_data['total_exposures'] += frequency
+                char_data['last_seen'] = timestamp
+                char_data['frequency_history'].append({
+                    'file_id': file_id,
+                    'filename': filename,
+                    'frequency': frequency,
+                    'date': timestamp
+                })
+                del char_data['frequency_history'][:-MAX_FREQ_HISTORY]
+                
+                char_data['files_seen_in'].add(file_id)
+                char_data['files_count'] = len(char_data['files_seen_in'])
             
-            word_data = user_data['word_exposure'][word]
-            word_data['total_exposures'] += frequency
-            word_data['last_seen'] = timestamp
-            word_data['frequency_history'].append({
+            # Track word exposure
+            for word, frequency in words.items():
+                if word not in user_data['word_exposure']:
+                    user_data['word_exposure'][word] = {
+                        'total_exposures': 0,
+                        'files_seen_in': set(),
+                        'files_count': 0,
+                        'first_seen': timestamp,
+                        'last_seen': timestamp,
+                        'frequency_history': []
+                    }
+                
+                word_data = user_data['word_exposure'][word]
+                word_data['total_exposures'] += frequency
+                word_data['last_seen'] = timestamp
+                word_data['frequency_history'].append({
+                    'file_id': file_id,
+                    'filename': filename,
+                    'frequency': frequency,
+                    'date': timestamp
+                })
+                del word_data['frequency_history'][:-MAX_FREQ_HISTORY]
+                
+                word_data['files_seen_in'].add(file_id)
+                word_data['files_count'] = len(word_data['files_seen_in'])
+            
+            # Add learning session
+            session = {
+                'session_id': f"{file_id}_{timestamp[:19]}",
                 'file_id': file_id,
                 'filename': filename,
-                'frequency': frequency,
-                'date': timestamp
-            })
+                'timestamp': timestamp,
+                'characters_encountered': len(characters),
+                'words_encountered': len(words),
+                'new_characters': len([c for c in characters if c not in user_data['character_exposure']]),
+                'new_words': len([w for w in words if w not in user_data['word_exposure']])
+            }
             
-            if file_id not in word_data['files_seen_in']:
-                word_data['files_seen_in'].append(file_id)
-        
-        # Add learning session
-        session = {
-            'session_id': f"{file_id}_{timestamp[:19]}",
-            'file_id': file_id,
-            'filename': filename,
-            'timestamp': timestamp,
-            'characters_encountered': len(characters),
-            'words_encountered': len(words),
-            'new_characters': len([c for c in characters if c not in user_data['character_exposure']]),
-            'new_words': len([w for w in words if w not in user_data['word_exposure']])
-        }
-        
-        user_data['learning_sessions'].append(session)
-        user_data['total_exposures'] += 1
-        
-        # Convert set to list for JSON serialization
-        if isinstance(user_data['unique_files_analyzed'], set):
-            user_data['unique_files_analyzed'] = list(user_data['unique_files_analyzed'])
-        
-        if file_id not in user_data['unique_files_analyzed']:
-            user_data['unique_files_analyzed'].append(file_id)
-        
-        # Keep only last 50 sessions
-        if len(user_data['learning_sessions']) > 50:
-            user_data['learning_sessions'] = user_data['learning_sessions'][-50:]
-        
-        # Update mastery levels based on exposure
-        self._update_mastery_levels(user_data)
-        
-        self._save_data(data)
+            user_data['learning_sessions'].append(session)
+            user_data['total_exposures'] += 1
+            
+            user_data['unique_files_analyzed'].add(file_id)
+            
+            # Keep only last 50 sessions
+            if len(user_data['learning_sessions']) > 50:
+                user_data['learning_sessions'] = user_data['learning_sessions'][-50:]
+            
+            # Update mastery levels based on exposure
+            self._update_mastery_levels(user_data, set(characters), set(words), timestamp)
+            
+            self._store.save(data)
     
-    def _update_mastery_levels(self, user_data: Dict[str, Any]):
-        """Update mastery levels based on exposure frequency."""
+    def _update_mastery_levels(self, user_data: Dict[str, Any], changed_chars: Set[str], changed_words: Set[str],
+                               last_updated: str):
+        """
+        Update mastery levels based on exposure frequency.
         
+        Only the characters and words passed in are recomputed; a level depends on nothing
+        but the item's own exposures and files, so the others cannot have changed.
+        last_updated is the timestamp of the session being recorded.
+        """
         # Character mastery levels
-        for char, char_data in user_data['character_exposure'].items():
+        for char in changed_chars:
+            char_data = user_data['character_exposure'][char]
             exposures = char_data['total_exposures']
-            files_count = len(char_data['files_seen_in'])
+            files_count = char_data.get('files_count', len(char_data['files_seen_in']))
             
             if exposures >= 50 and files_count >= 5:
                 level = 'mastered'
@@ -174,13 +182,14 @@ class LearningTracker:
                 'level': level,
                 'exposures': exposures,
                 'files_count': files_count,
-                'last_updated': datetime.now().isoformat()
+                'last_updated': last_updated
             }
         
         # Word mastery levels
-        for word, word_data in user_data['word_exposure'].items():
+        for word in changed_words:
+            word_data = user_data['word_exposure'][word]
             exposures = word_data['total_exposures']
-            files_count = len(word_data['files_seen_in'])
+            files_count = word_data.get('files_count', len(word_data['files_seen_in']))
             
             if exposures >= 30 and files_count >= 4:
                 level = 'mastered'
@@ -195,32 +204,37 @@ class LearningTracker:
                 'level': level,
                 'exposures': exposures,
                 'files_count': files_count,
-                'last_updated': datetime.now().isoformat()
+                'last_updated': last_updated
             }
     
     def get_user_progress(self, user_id: str) -> Dict[str, Any]:
         """Get comprehensive learning progress for a user."""
-        data = self._load_data()
-        
-        if user_id not in data:
-            return self._empty_progress()
-        
-        user_data = data[user_id]
-        
-        # Calculate statistics
-        char_stats = self._calculate_character_stats(user_data)
-        word_stats = self._calculate_word_stats(user_data)
-        session_stats = self._calculate_session_stats(user_data)
-        
-        return {
-            'character_stats': char_stats,
-            'word_stats': word_stats,
-            'session_stats': session_stats,
-            'mastery_levels': user_data.get('mastery_levels', {}),
-            'recent_sessions': user_data.get('learning_sessions', [])[-10:],
-            'total_exposures': user_data.get('total_exposures', 0),
-            'unique_files': len(user_data.get('unique_files_analyzed', []))
-        }
+        # Held throughout, since track_exposure changes these records from other sessions;
+        # the mastery levels are copied so callers never iterate the live dicts
+        with self._lock:
+            data = self._store.load()
+            
+            if user_id not in data:
+                return self._empty_progress()
+            
+            user_data = data[user_id]
+            
+            # Calculate statistics
+            char_stats = self._calculate_character_stats(user_data)
+            word_stats = self._calculate_word_stats(user_data)
+            session_stats = self._calculate_session_stats(user_data)
+            
+            return {
+                'character_stats': char_stats,
+                'word_stats': word_stats,
+                'session_stats': session_stats,
+                'mastery_levels': {
+                    kind: dict(levels) for kind, levels in user_data.get('mastery_levels', {}).items()
+                },
+                'recent_sessions': user_data.get('learning_sessions', [])[-10:],
+                'total_exposures': user_data.get('total_exposures', 0),
+                'unique_files': len(user_data.get('unique_files_analyzed', []))
+            }
     
     def _calculate_character_stats(self, user_data: Dict[str, Any]) -> Dict[str, Any]:
         """Calculate character learning statistics."""
@@ -230,13 +244,10 @@ class LearningTracker:
         stats = {
             'total_characters_seen': len(char_exposure),
             'total_character_exposures': sum(data['total_exposures'] for data in char_exposure.values()),
-            'mastery_breakdown': defaultdict(int)
+            'mastery_breakdown': dict(Counter(map(itemgetter('level'), mastery.values())))
         }
         
-        for char_mastery in mastery.values():
-            stats['mastery_breakdown'][char_mastery['level']] += 1
-        
-        return dict(stats)
+        return stats
     
     def _calculate_word_stats(self, user_data: Dict[str, Any]) -> Dict[str, Any]:
         """Calculate word learning statistics."""
@@ -246,13 +257,10 @@ class LearningTracker:
         stats = {
             'total_words_seen': len(word_exposure),
             'total_word_exposures': sum(data['total_exposures'] for data in word_exposure.values()),
-            'mastery_breakdown': defaultdict(int)
+            'mastery_breakdown': dict(Counter(map(itemgetter('level'), mastery.values())))
         }
         
-        for word_mastery in mastery.values():
-            stats['mastery_breakdown'][word_mastery['level']] += 1
-        
-        return dict(stats)
+        return stats
     
     def _calculate_session_stats(self, user_data: Dict[str, Any]) -> Dict[str, Any]:
         """Calculate learning session statistics."""
@@ -283,47 +291,49 @@ class LearningTracker:
     
     def get_mastered_items(self, user_id: str, item_type: str = 'both') -> Dict[str, List[str]]:
         """Get list of mastered characters and/or words."""
-        data = self._load_data()
-        
-        if user_id not in data:
-            return {'characters': [], 'words': []}
-        
-        mastery = data[user_id].get('mastery_levels', {})
-        result = {}
-        
-        if item_type in ['characters', 'both']:
-            result['characters'] = [
-                char for char, data in mastery.get('characters', {}).items()
-                if data['level'] == 'mastered'
-            ]
-        
-        if item_type in ['words', 'both']:
-            result['words'] = [
-                word for word, data in mastery.get('words', {}).items()
-                if data['level'] == 'mastered'
-            ]
-        
-        return result
+        with self._lock:
+            data = self._store.load()
+            
+            if user_id not in data:
+                return {'characters': [], 'words': []}
+            
+            mastery = data[user_id].get('mastery_levels', {})
+            result = {}
+            
+            if item_type in ['characters', 'both']:
+                result['characters'] = [
+                    char for char, data in mastery.get('characters', {}).items()
+                    if data['level'] == 'mastered'
+                ]
+            
+            if item_type in ['words', 'both']:
+                result['words'] = [
+                    word for word, data in mastery.get('words', {}).items()
+                    if data['level'] == 'mastered'
+                ]
+            
+            return result
     
     def get_learning_recommendations(self, user_id: str) -> Dict[str, List[str]]:
         """Get recommendations for what to focus on learning."""
-        data = self._load_data()
-        
-        if user_id not in data:
-            return {'characters': [], 'words': []}
-        
-        mastery = data[user_id].get('mastery_levels', {})
-        
-        # Recommend items at 'learning' level (not beginner, not mastered)
-        recommendations = {
-            'characters': [
-                char for char, data in mastery.get('characters', {}).items()
-                if data['level'] == 'learning'
-            ][:20],  # Top 20 recommendations
-            'words': [
-                word for word, data in mastery.get('words', {}).items()
-                if data['level'] == 'learning'
-            ][:20]
-        }
+        with self._lock:
+            data = self._store.load()
+            
+            if user_id not in data:
+                return {'characters': [], 'words': []}
+            
+            mastery = data[user_id].get('mastery_levels', {})
+            
+            # Recommend items at 'learning' level (not beginner, not mastered)
+            recommendations = {
+                'characters': [
+                    char for char, data in mastery.get('characters', {}).items()
+                    if data['level'] == 'learning'
+                ][:20],  # Top 20 recommendations
+                'words': [
+                    word for word, data in mastery.get('words', {}).items()
+                    if data['level'] == 'learning'
+                ][:20]
+            }
         
         return recommendations
\ No newline at end of file
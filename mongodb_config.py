@@ -2,11 +2,27 @@
 MongoDB configuration and connection management.
 """
 
+import atexit
 import os
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
+import threading
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import AutoReconnect, BulkWriteError, ConnectionFailure, PyMongoError
+from bson import json_util
 import streamlit as st
-from typing import Optional
+from typing import Any, Dict, List, Optional, Tuple
+
+# Queued updates MongoDB rejected, or that could not be sent within the retry limit, are
+# appended here rather than dropped, so they can be inspected and replayed by hand
+FAILED_UPDATES_PATH = "data/failed_mongo_updates.jsonl"
+
+# A batch interrupted by a connection error is retried this long after the failure, at most
+# MONGO_MAX_RETRIES times in a row
+MONGO_RETRY_DELAY_SECONDS = 5.0
+MONGO_MAX_RETRIES = 5
+
+# While MongoDB is unreachable, queued updates beyond this many are recorded in
+# FAILED_UPDATES_PATH, oldest first, instead of being held in memory
+MONGO_MAX_QUEUED_UPDATES = 1000
 
 
 class MongoDBManager:
@@ -15,6 +31,8 @@ class MongoDBManager:
     def __init__(self):
         self.client: Optional[MongoClient] = None
         self.database = None
+        # Set once ensure_indexes has succeeded on this connection
+        self.indexes_ensured = False
         self._connect()
     
     def _connect(self):
@@ -27,7 +45,11 @@ class MongoDBManager:
                 mongodb_uri,
                 serverSelectionTimeoutMS=5000,  # 5 second timeout
                 connectTimeoutMS=5000,
-                socketTimeoutMS=5000
+                socketTimeoutMS=5000,
+                # Keep a few connections open in the background so the first queries
+                # of a session don't pay for connection setup
+                minPoolSize=5,
+                maxPoolSize=50
             )
             
             # Test the connection
@@ -75,14 +97,16 @@ def get_mongo_manager() -> MongoDBManager:
     global _mongo_manager
     if _mongo_manager is None:
         _mongo_manager = MongoDBManager()
+        # Every collection the stores query is indexed before the first store uses it
+        ensure_indexes()
     return _mongo_manager
 
 
 def ensure_indexes():
-    """Ensure proper indexes are created for performance."""
+    """Ensure proper indexes are created for performance, once per connection."""
     mongo = get_mongo_manager()
     
-    if not mongo.is_connected():
+    if not mongo.is_connected() or mongo.indexes_ensured:
         return
     
     try:
@@ -96,13 +120,165 @@ def ensure_indexes():
         files.create_index("file_id", unique=True)
         files.create_index("file_hash")
         files.create_index("uploaded_by")
-        files.create_index("accessed_by")
+        # Serves get_user_files' filter and its newest-first sort together
+        files.create_index([("accessed_by", 1), ("last_accessed", -1)])
         
         # Learning progress collection indexes
         learning = mongo.get_collection('learning_progress')
         learning.create_index("user_id", unique=True)
         
+        # Exposures collection indexes
+        exposures = mongo.get_collection('exposures')
+        exposures.create_index([("user_id", 1), ("kind", 1), ("item", 1)], unique=True)
+        
+        mongo.indexes_ensured = True
         print("✅ MongoDB indexes ensured")
         
     except Exception as e:
-        print(f"⚠️ Error creating indexes: {e}")
\ No newline at end of file
+        print(f"⚠️ Error creating indexes: {e}")
+
+
+def _record_failed_updates(collection_name: str, failures: List[tuple]):
+    """Append ((filter, update, upsert), error message) pairs that were not applied to FAILED_UPDATES_PATH."""
+    try:
+        os.makedirs(os.path.dirname(FAILED_UPDATES_PATH), exist_ok=True)
+        with open(FAILED_UPDATES_PATH, 'a', encoding='utf-8') as f:
+            for (update_filter, update, upsert), error in failures:
+                f.write(json_util.dumps({
+                    'collection': collection_name,
+                    'filter': update_filter,
+                    'update': update,
+                    'upsert': upsert,
+                    'error': error
+                }) + "\n")
+        print(f"{len(failures)} queued MongoDB update(s) not applied; recorded in {FAILED_UPDATES_PATH}")
+    except Exception as e:
+        print(f"Error recording unapplied MongoDB updates: {e}; lost: {failures}")
+
+
+class UpdateQueue:
+    """
+    update_one operations queued in memory and sent to a collection in batched bulk_writes.
+    
+    Updates are (filter, update, upsert) tuples and must be idempotent, for example by
+    guarding a $push with a $ne filter on the pushed record's id: a batch interrupted by a
+    connection error may have been partly applied before it is sent again.
+    """
+    
+    def __init__(self, collection, ordered: bool, flush_threshold: int, delay_seconds: float):
+        """
+        Args:
+            collection: Collection the updates apply to
+            ordered: Send batches ordered, so updates land in the order they were queued
+            flush_threshold: Number of queued updates that are sent without waiting
+            delay_seconds: How long after the first queued update a batch is sent
+        """
+        self.collection = collection
+        self._ordered = ordered
+        self._flush_threshold = flush_threshold
+        self._delay_seconds = delay_seconds
+        
+        # _lock guards the queue and is never held while talking to MongoDB; _send_lock
+        # keeps batches going out one at a time, in order
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._pending: List[Tuple[Dict[str, Any], Dict[str, Any], bool]] = []
+        self._timer: Optional[threading.Timer] = None
+        # Batches in a row that could not be sent; non-zero while waiting to retry
+        self._failed_attempts = 0
+        atexit.register(self.flush)
+    
+    def put(self, update_filter: Dict[str, Any], update: Dict[str, Any], upsert: bool = False):
+        """Queue an update for the next batch."""
+        with self._lock:
+            if len(self._pending) >= MONGO_MAX_QUEUED_UPDATES:
+                _record_failed_updates(self.collection.name, [(self._pending.pop(0), 'update queue full')])
+            self._pending.append((update_filter, update, upsert))
+            send_now = len(self._pending) >= self._flush_threshold and not self._failed_attempts
+            if not send_now:
+                self._schedule(self._delay_seconds)
+        if send_now:
+            self.flush()
+    
+    @property
+    def pending(self) -> int:
+        """Number of updates queued and not yet sent."""
+        return len(self._pending)
+    
+    def sync(self):
+        """Send queued updates before a read, unless they are waiting to be retried after a connection error."""
+        if not self._failed_attempts:
+            self.flush(during_retry=False)
+    
+    def flush(self, during_retry: bool = True):
+        """Send queued updates in one bulk_write, keeping any that are worth retrying."""
+        with self._send_lock:
+            with self._lock:
+                if self._failed_attempts and not during_retry:
+                    return
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                updates, self._pending = self._pending, []
+            if not updates:
+                return
+            
+            retry = self._send(updates)
+            
+            with self._lock:
+                if not retry:
+                    self._failed_attempts = 0
+                    if self._pending:
+                        self._schedule(self._delay_seconds)
+                    return
+                self._failed_attempts += 1
+                if self._failed_attempts > MONGO_MAX_RETRIES:
+                    _record_failed_updates(self.collection.name, [
+                        (update, f"not sent after {MONGO_MAX_RETRIES} retries") for update in retry
+                    ])
+                    self._failed_attempts = 0
+                    return
+                # Kept at the front of the queue, so they still land before later updates
+                self._pending[:0] = retry
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                self._schedule(MONGO_RETRY_DELAY_SECONDS)
+    
+    def _schedule(self, delay_seconds: float):
+        """Start the timer that sends the next batch, if one is not already running."""
+        if self._timer is None:
+            self._timer = threading.Timer(delay_seconds, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+    
+    def _send(self, updates: List[tuple]) -> List[tuple]:
+        """
+        Send updates in one bulk_write and return those to send again.
+        
+        Only a connection error or timeout is retried, with every update in the batch. An
+        update MongoDB rejects would only fail again, so it is recorded in FAILED_UPDATES_PATH;
+        in an ordered batch the updates after it were never attempted and are sent straight away.
+        """
+        operations = [UpdateOne(update_filter, update, upsert=upsert) for update_filter, update, upsert in updates]
+        try:
+            self.collection.bulk_write(operations, ordered=self._ordered)
+            return []
+        except BulkWriteError as e:
+            write_errors = e.details.get('writeErrors', [])
+            if write_errors:
+                _record_failed_updates(self.collection.name, [
+                    (updates[error['index']], error.get('errmsg')) for error in write_errors
+                ])
+            if self._ordered and write_errors:
+                remaining = updates[write_errors[0]['index'] + 1:]
+                return self._send(remaining) if remaining else []
+            # Write concern errors alone mean the updates were applied
+            return []
+        except AutoReconnect as e:
+            # Includes NetworkTimeout
+            print(f"MongoDB bulk write error on {self.collection.name}, retrying later: {e}")
+            return updates
+        except PyMongoError as e:
+            _record_failed_updates(self.collection.name, [(update, str(e)) for update in updates])
+            return []
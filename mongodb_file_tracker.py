@@ -2,14 +2,60 @@
 MongoDB-based file tracker with fallback to JSON for development.
 """
 
-import json
 import os
+import threading
 import hashlib
+from collections import defaultdict
 from datetime import datetime
-from typing import Dict, Any, Optional, List
+from functools import lru_cache
+from heapq import nlargest
+from typing import Dict, Any, Optional, List, Set
 import uuid
 import base64
-from mongodb_config import get_mongo_manager
+from bson.binary import Binary
+from pymongo import ReturnDocument
+from mongodb_config import UpdateQueue, get_mongo_manager
+from file_tracker import (
+    ANALYSIS_LOG_CHECKPOINT, apply_logged_record, apply_analysis_record, pack_content, unpack_content
+)
+from json_store import SAVE_DELAY_SECONDS, JsonStore
+
+# Queued analysis-record updates are sent to MongoDB in one bulk_write once this many
+# accumulate, or SAVE_DELAY_SECONDS after the first one, whichever comes first
+MONGO_FLUSH_THRESHOLD = 50
+
+# Uploads at least this large are kept in GridFS rather than inline in the file document
+GRIDFS_MIN_BYTES = 1 << 20
+
+# Projection for reads that only need file metadata, leaving the stored upload on the server
+METADATA_PROJECTION = {'_id': 0, 'file_content': 0}
+
+# Projection for registration: the file id and whether its upload is stored, without the upload itself
+CONTENT_CHECK_PROJECTION = {
+    '_id': 0,
+    'file_id': 1,
+    'has_content': {'$or': [
+        {'$ne': [{'$type': '$file_content'}, 'missing']},
+        {'$ne': [{'$type': '$file_content_id'}, 'missing']}
+    ]}
+}
+
+# Projection for file listings: metadata with the analysis history reduced to its length
+LISTING_PROJECTION = {
+    '_id': 0,
+    'file_id': 1,
+    'filename': 1,
+    'file_hash': 1,
+    'file_size': 1,
+    'file_type': 1,
+    'uploaded_by': 1,
+    'uploaded_at': 1,
+    'last_accessed': 1,
+    'access_count': 1,
+    'accessed_by': 1,
+    'metadata': 1,
+    'analysis_count': {'$size': {'$ifNull': ['$analysis_history', []]}}
+}
 
 
 class FileTracker:
@@ -17,163 +63,241 @@ class FileTracker:
     
     def __init__(self):
         self.mongo = get_mongo_manager()
+        # The manager connects once, so the collection handle is resolved here rather than per call
+        self._files = self.mongo.get_collection('files')
+        
+        # _lock guards the JSON records in fallback mode
+        self._lock = threading.RLock()
+        self._hash_index: Dict[str, str] = {}
+        self._user_index: Dict[str, Set[str]] = defaultdict(set)
+        
+        # MongoDB analysis-record updates waiting for the next bulk_write. Unordered, since
+        # each update touches its own record; add_analysis_record has already reported
+        # success, so a batch that could not be sent is retried rather than dropped
+        self._updates = UpdateQueue(self._files, ordered=False, flush_threshold=MONGO_FLUSH_THRESHOLD,
+                                    delay_seconds=SAVE_DELAY_SECONDS)
+        
+        # File metadata read from MongoDB, keyed by (file_id, write version); every write
+        # through this tracker bumps the version, so stale entries are simply never hit again
+        self._version = 0
+        self._cached_metadata = lru_cache(maxsize=1024)(self._fetch_file_metadata)
         
         # Fallback to JSON if MongoDB is not available
         if not self.mongo.is_connected():
             self.json_db_path = "data/files.json"
             self.json_db_dir = os.path.dirname(self.json_db_path)
-            self._ensure_json_db_exists()
-    
-    def _ensure_json_db_exists(self):
-        """Ensure JSON database exists (fallback mode)."""
-        if not os.path.exists(self.json_db_dir):
-            os.makedirs(self.json_db_dir)
-        
-        if not os.path.exists(self.json_db_path):
-            self._save_json_data({})
+            self.uploads_dir = os.path.join(self.json_db_dir, "uploads")
+            self._store = JsonStore(
+                self.json_db_path, lock=self._lock,
+                log_path=os.path.join(self.json_db_dir, "analysis.jsonl"),
+                log_checkpoint=ANALYSIS_LOG_CHECKPOINT,
+                apply_log_entry=apply_logged_record,
+                on_load=self._build_indexes,
+                indent=True
+            )
     
-    def _load_json_data(self) -> Dict[str, Any]:
-        """Load data from JSON file (fallback mode)."""
-        try:
-            with open(self.json_db_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {}
-    
-    def _save_json_data(self, data: Dict[str, Any]):
-        """Save data to JSON file (fallback mode)."""
-        with open(self.json_db_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+    def _build_indexes(self, data: Dict[str, Any]):
+        """Index the loaded records by content hash and by the users who accessed each file."""
+        self._hash_index = {}
+        self._user_index = defaultdict(set)
+        for file_id, file_data in data.items():
+            self._hash_index.setdefault(file_data.get('file_hash'), file_id)
+            for user_id in file_data.get('accessed_by', []):
+                self._user_index[user_id].add(file_id)
     
     def _generate_file_hash(self, content: bytes) -> str:
-        """Generate a unique hash for file content."""
+        """
+        Generate a unique hash for file content.
+        
+        Every byte is hashed: an upload whose hash matches is treated as the same file
+        and its stored copy is reused, so a sampled hash could silently swap an edited
+        book for an older version of the same size.
+        """
         return hashlib.sha256(content).hexdigest()[:16]
     
     def register_file(self, filename: str, file_content: bytes, user_id: str, 
-                     file_size: int, file_type: str = None) -> str:
-        """Register a new file or retrieve existing file ID."""
-        file_hash = self._generate_file_hash(file_content)
+                     file_size: int, file_type: str = None, file_hash: str = None) -> str:
+        """Register a new file or retrieve existing file ID; pass file_hash if it is already known."""
+        file_hash = file_hash or self._generate_file_hash(file_content)
+        now = datetime.now().isoformat()
         
         if self.mongo.is_connected():
             try:
-                files_collection = self.mongo.get_collection('files')
-                
-                # Check if file already exists
-                existing_file = files_collection.find_one({'file_hash': file_hash})
+                self._version += 1
+                access_update = {
+                    '$set': {'last_accessed': now},
+                    '$inc': {'access_count': 1},
+                    '$addToSet': {'accessed_by': user_id}
+                }
                 
-                if existing_file:
-                    # Update access information
-                    files_collection.update_one(
-                        {'file_id': existing_file['file_id']},
-                        {
-                            '$set': {'last_accessed': datetime.now().isoformat()},
-                            '$inc': {'access_count': 1},
-                            '$addToSet': {'accessed_by': user_id}
+                # Record the access to a file seen before, without packing its content: the
+                # upload is already stored unless an earlier GridFS write failed
+                file_data = self._files.find_one_and_update(
+                    {'file_hash': file_hash},
+                    access_update,
+                    projection=CONTENT_CHECK_PROJECTION,
+                    return_document=ReturnDocument.AFTER
+                )
+                payload = content_encoding = None
+                if file_data is None:
+                    # Store the (possibly deflated) bytes as BSON binary rather than base64 text;
+                    # small uploads are inserted together with the document, so it never exists
+                    # without them
+                    payload, content_encoding = pack_content(file_content)
+                    
+                    # Create the file document, or record the access if another session has
+                    # just created it; the fields under $inc, $addToSet and $set also
+                    # initialize a newly inserted document
+                    new_file_id = str(uuid.uuid4())[:12]
+                    new_document = {
+                        'file_id': new_file_id,
+                        'filename': filename,
+                        'file_size': file_size,
+                        'file_type': file_type,
+                        'uploaded_by': user_id,
+                        'uploaded_at': now,
+                        'analysis_history': [],
+                        'metadata': {
+                            'original_filename': filename,
+                            'upload_session': str(uuid.uuid4())[:8]
                         }
-                    )
-                    return existing_file['file_id']
-                
-                # Create new file record
-                file_id = str(uuid.uuid4())[:12]
-                file_content_b64 = base64.b64encode(file_content).decode('utf-8')
-                
-                file_data = {
-                    'file_id': file_id,
-                    'filename': filename,
-                    'file_hash': file_hash,
-                    'file_size': file_size,
-                    'file_type': file_type,
-                    'uploaded_by': user_id,
-                    'uploaded_at': datetime.now().isoformat(),
-                    'last_accessed': datetime.now().isoformat(),
-                    'access_count': 1,
-                    'accessed_by': [user_id],
-                    'analysis_history': [],
-                    'file_content': file_content_b64,
-                    'metadata': {
-                        'original_filename': filename,
-                        'upload_session': str(uuid.uuid4())[:8]
                     }
-                }
-                
-                files_collection.insert_one(file_data)
-                return file_id
-                
+                    if len(payload) < GRIDFS_MIN_BYTES:
+                        new_document['file_content'] = Binary(payload)
+                        new_document['content_encoding'] = content_encoding
+                    file_data = self._files.find_one_and_update(
+                        {'file_hash': file_hash},
+                        {'$setOnInsert': new_document, **access_update},
+                        projection=CONTENT_CHECK_PROJECTION,
+                        upsert=True,
+                        return_document=ReturnDocument.AFTER
+                    )
+                file_id = file_data['file_id']
             except Exception as e:
                 print(f"MongoDB file registration error: {e}")
                 # Fall back to JSON
-                pass
+                file_id = None
+            
+            if file_id is not None:
+                # Large uploads go to GridFS once the document exists; if that write failed
+                # earlier, this upload of the same bytes fills the content in
+                if not file_data.get('has_content'):
+                    if payload is None:
+                        payload, content_encoding = pack_content(file_content)
+                    self._store_missing_content(file_id, filename, payload, content_encoding)
+                return file_id
         
         # JSON fallback
-        data = self._load_json_data()
-        
-        # Check if file already exists
-        for file_id, file_data in data.items():
-            if file_data.get('file_hash') == file_hash:
+        with self._lock:
+            data = self._store.load()
+            
+            # Check if file already exists
+            file_id = self._hash_index.get(file_hash)
+            if file_id is not None:
                 # Update access information
-                file_data['last_accessed'] = datetime.now().isoformat()
+                file_data = data[file_id]
+                file_data['last_accessed'] = now
                 file_data['access_count'] = file_data.get('access_count', 0) + 1
-                if user_id not in file_data.get('accessed_by', []):
+                # The user index answers membership without scanning accessed_by
+                user_file_ids = self._user_index[user_id]
+                if file_id not in user_file_ids:
                     file_data.setdefault('accessed_by', []).append(user_id)
-                self._save_json_data(data)
+                    user_file_ids.add(file_id)
+                self._store.save(data)
                 return file_id
-        
-        # Create new file record
-        file_id = str(uuid.uuid4())[:12]
-        file_content_b64 = base64.b64encode(file_content).decode('utf-8')
-        
-        file_data = {
-            'file_id': file_id,
-            'filename': filename,
-            'file_hash': file_hash,
-            'file_size': file_size,
-            'file_type': file_type,
-            'uploaded_by': user_id,
-            'uploaded_at': datetime.now().isoformat(),
-            'last_accessed': datetime.now().isoformat(),
-            'access_count': 1,
-            'accessed_by': [user_id],
-            'analysis_history': [],
-            'file_content': file_content_b64,
-            'metadata': {
-                'original_filename': filename,
-                'upload_session': str(uuid.uuid4())[:8]
+            
+            # Create new file record
+            file_id = str(uuid.uuid4())[:12]
+            payload, content_encoding = pack_content(file_content)
+            content_file = self._write_upload(file_id, payload)
+            
+            file_data = {
+                'file_id': file_id,
+                'filename': filename,
+                'file_hash': file_hash,
+                'file_size': file_size,
+                'file_type': file_type,
+                'uploaded_by': user_id,
+                'uploaded_at': now,
+                'last_accessed': now,
+                'access_count': 1,
+                'accessed_by': [user_id],
+                'analysis_history': [],
+                'file_content_file': content_file,
+                'content_encoding': content_encoding,
+                'metadata': {
+                    'original_filename': filename,
+                    'upload_session': str(uuid.uuid4())[:8]
+                }
             }
-        }
-        
-        data[file_id] = file_data
-        self._save_json_data(data)
-        return file_id
+            
+            data[file_id] = file_data
+            self._hash_index[file_hash] = file_id
+            self._user_index[user_id].add(file_id)
+            self._store.save(data)
+            return file_id
     
-    def add_analysis_record(self, file_id: str, user_id: str, analysis_results: Dict[str, Any]):
-        """Add an analysis record to a file's history."""
+    def _store_missing_content(self, file_id: str, filename: str, payload: bytes,
+                               content_encoding: Optional[str]):
+        """Store an upload for a file document that has none, inline or in GridFS by size."""
+        try:
+            if len(payload) >= GRIDFS_MIN_BYTES:
+                import gridfs
+                content_field = {'file_content_id': gridfs.GridFS(self.mongo.database).put(
+                    payload, filename=filename
+                )}
+            else:
+                content_field = {'file_content': Binary(payload)}
+            content_field['content_encoding'] = content_encoding
+            self._files.update_one(
+                {'file_id': file_id, 'file_content': {'$exists': False}, 'file_content_id': {'$exists': False}},
+                {'$set': content_field}
+            )
+        except Exception as e:
+            # The document is registered; a later upload of the same bytes retries this
+            print(f"MongoDB file content error: {e}")
+    
+    def add_analysis_record(self, file_id: str, user_id: str, analysis_results: Dict[str, Any],
+                            timestamp: Optional[str] = None):
+        """Add an analysis record to a file's history; timestamp defaults to now."""
+        now = timestamp or datetime.now().isoformat()
+        character_stats = analysis_results.get('character_stats', {})
+        word_stats = analysis_results.get('word_stats', {})
         analysis_record = {
             'analysis_id': str(uuid.uuid4())[:8],
             'user_id': user_id,
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': now,
             'analysis_type': analysis_results.get('analysis_type', 'both'),
             'settings_used': analysis_results.get('settings_used', {}),
             'character_stats': {
-                'total_chars': analysis_results.get('character_stats', {}).get('total_chars', 0),
-                'unique_chars': analysis_results.get('character_stats', {}).get('unique_han_chars', 0),
+                'total_chars': character_stats.get('total_chars', 0),
+                'unique_chars': character_stats.get('unique_han_chars', 0),
                 'top_10_chars': analysis_results.get('top_characters', {})
             },
             'word_stats': {
-                'total_words': analysis_results.get('word_stats', {}).get('total_words', 0),
-                'unique_words': analysis_results.get('word_stats', {}).get('unique_words', 0),
-                'han_words_count': len(analysis_results.get('word_stats', {}).get('han_words', {})),
+                'total_words': word_stats.get('total_words', 0),
+                'unique_words': word_stats.get('unique_words', 0),
+                'han_words_count': len(word_stats.get('han_words', {})),
                 'top_10_words': analysis_results.get('top_words', {})
             }
         }
         
         if self.mongo.is_connected():
             try:
-                files_collection = self.mongo.get_collection('files')
-                files_collection.update_one(
-                    {'file_id': file_id},
+                # Unordered batches may apply a file's records out of order, so sort by
+                # timestamp before trimming to keep the newest 20
+                # The $ne filter makes a retried batch skip records it already pushed
+                with self._lock:
+                    self._version += 1
+                self._updates.put(
+                    {'file_id': file_id, 'analysis_history.analysis_id': {'$ne': analysis_record['analysis_id']}},
                     {
-                        '$push': {'analysis_history': {'$each': [analysis_record], '$slice': -20}},
-                        '$set': {'last_accessed': datetime.now().isoformat()}
+                        '$push': {'analysis_history': {
+                            '$each': [analysis_record],
+                            '$sort': {'timestamp': 1},
+                            '$slice': -20
+                        }},
+                        '$set': {'last_accessed': now}
                     }
                 )
                 return True
@@ -183,84 +307,148 @@ class FileTracker:
                 pass
         
         # JSON fallback
-        data = self._load_json_data()
-        if file_id in data:
-            data[file_id]['analysis_history'].append(analysis_record)
-            data[file_id]['last_accessed'] = datetime.now().isoformat()
-            # Keep only last 20 analysis records
-            if len(data[file_id]['analysis_history']) > 20:
-                data[file_id]['analysis_history'] = data[file_id]['analysis_history'][-20:]
-            self._save_json_data(data)
-            return True
-        return False
+        with self._lock:
+            data = self._store.load()
+            if file_id in data:
+                # Keep only last 20 analysis records; the record is appended to the
+                # analysis log rather than rewriting the whole JSON file
+                apply_analysis_record(data[file_id], analysis_record)
+                self._store.append_log({'file_id': file_id, 'record': analysis_record})
+                return True
+            return False
     
-    def get_file_info(self, file_id: str) -> Optional[Dict[str, Any]]:
-        """Get complete information about a file."""
+    def get_file_info(self, file_id: str, include_content: bool = True) -> Optional[Dict[str, Any]]:
+        """Get complete information about a file; include_content=False skips fetching the stored upload."""
         if self.mongo.is_connected():
             try:
-                files_collection = self.mongo.get_collection('files')
-                file_data = files_collection.find_one({'file_id': file_id})
-                if file_data:
-                    file_data.pop('_id', None)  # Remove MongoDB ObjectId
-                return file_data
+                self._updates.sync()
+                # Updates still waiting to be retried are not in MongoDB yet, so nothing read
+                # now may be cached under the current version
+                if not include_content and not self._updates.pending:
+                    return self._cached_metadata(file_id, self._version)
+                if not include_content:
+                    return self._fetch_file_metadata(file_id, self._version)
+                return self._files.find_one({'file_id': file_id}, projection={'_id': 0})
             except Exception as e:
                 print(f"MongoDB file info error: {e}")
                 # Fall back to JSON
                 pass
         
         # JSON fallback
-        data = self._load_json_data()
+        data = self._store.load()
         return data.get(file_id)
     
-    def get_user_files(self, user_id: str) -> List[Dict[str, Any]]:
-        """Get all files accessed by a user."""
+    def _fetch_file_metadata(self, file_id: str, version: int) -> Optional[Dict[str, Any]]:
+        """Read a file's metadata from MongoDB; version only keys the cache around this method."""
+        return self._files.find_one({'file_id': file_id}, projection=METADATA_PROJECTION)
+    
+    def find_file_by_hash(self, file_hash: str) -> Optional[Dict[str, Any]]:
+        """Get the record of a previously registered file with this content hash."""
         if self.mongo.is_connected():
             try:
-                files_collection = self.mongo.get_collection('files')
-                user_files = list(files_collection.find(
+                self._updates.sync()
+                return self._files.find_one({'file_hash': file_hash}, projection=METADATA_PROJECTION)
+            except Exception as e:
+                print(f"MongoDB file lookup error: {e}")
+                # Fall back to JSON
+                pass
+        
+        # JSON fallback
+        data = self._store.load()
+        file_id = self._hash_index.get(file_hash)
+        return data[file_id] if file_id is not None else None
+    
+    def get_user_files(self, user_id: str, limit: int = 0) -> List[Dict[str, Any]]:
+        """
+        Get files accessed by a user, most recently accessed first; limit=0 returns all of them.
+        
+        Each record carries analysis_count, the length of its analysis history.
+        """
+        if self.mongo.is_connected():
+            try:
+                self._updates.sync()
+                # Served by the (accessed_by, last_accessed) index without an in-memory sort
+                return list(self._files.find(
                     {'accessed_by': user_id},
-                    sort=[('last_accessed', -1)]
+                    projection=LISTING_PROJECTION,
+                    sort=[('last_accessed', -1)],
+                    limit=limit,
+                    batch_size=50
                 ))
-                for file_data in user_files:
-                    file_data.pop('_id', None)  # Remove MongoDB ObjectId
-                return user_files
             except Exception as e:
                 print(f"MongoDB user files error: {e}")
                 # Fall back to JSON
                 pass
         
-        # JSON fallback
-        data = self._load_json_data()
-        user_files = []
-        for file_data in data.values():
-            if user_id in file_data.get('accessed_by', []):
-                user_files.append(file_data)
-        
-        # Sort by last accessed (most recent first)
-        return sorted(user_files, key=lambda x: x.get('last_accessed', ''), reverse=True)
+        # JSON fallback, under the lock since register_file adds to the user's file id set
+        # from other sessions
+        with self._lock:
+            data = self._store.load()
+            
+            # Sort by last accessed (most recent first), picking only the first `limit` files
+            # when there is one, and copy just the records that are returned
+            file_ids = self._user_index.get(user_id, ())
+            last_accessed = lambda file_id: data[file_id].get('last_accessed', '')
+            if limit:
+                file_ids = nlargest(limit, file_ids, key=last_accessed)
+            else:
+                file_ids = sorted(file_ids, key=last_accessed, reverse=True)
+            return [
+                dict(data[file_id], analysis_count=len(data[file_id].get('analysis_history', [])))
+                for file_id in file_ids
+            ]
     
     def get_file_analysis_history(self, file_id: str, user_id: str = None) -> List[Dict[str, Any]]:
         """Get analysis history for a file, optionally filtered by user."""
-        file_data = self.get_file_info(file_id)
+        file_data = self.get_file_info(file_id, include_content=False)
         
         if not file_data:
             return []
         
         history = file_data.get('analysis_history', [])
         
+        # Records are appended in time order, so newest-first is the list reversed
         if user_id:
-            history = [record for record in history if record['user_id'] == user_id]
-        
-        return sorted(history, key=lambda x: x['timestamp'], reverse=True)
+            return [record for record in reversed(history) if record['user_id'] == user_id]
+        return history[::-1]
+    
+    def _write_upload(self, file_id: str, payload: bytes) -> str:
+        """Write stored file content to the uploads directory and return its file name (fallback mode)."""
+        os.makedirs(self.uploads_dir, exist_ok=True)
+        content_file = f"{file_id}.bin"
+        content_path = os.path.join(self.uploads_dir, content_file)
+        temp_path = f"{content_path}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(payload)
+        os.replace(temp_path, content_path)
+        return content_file
     
     def get_file_content(self, file_id: str) -> Optional[bytes]:
         """Get the original file content for re-analysis."""
         file_data = self.get_file_info(file_id)
         
-        if not file_data or 'file_content' not in file_data:
+        if not file_data:
             return None
         
         try:
-            return base64.b64decode(file_data['file_content'])
+            if 'file_content_id' in file_data:
+                import gridfs
+                payload = gridfs.GridFS(self.mongo.database).get(file_data['file_content_id']).read()
+            elif 'file_content_file' in file_data:
+                # JSON fallback records keep their content in the uploads directory
+                with open(os.path.join(self.uploads_dir, file_data['file_content_file']), 'rb') as f:
+                    payload = f.read()
+            else:
+                file_content = file_data.get('file_content')
+                if file_content is None:
+                    return None
+                
+                # JSON records and documents stored before binary storage hold base64 text
+                if isinstance(file_content, str):
+                    payload = base64.b64decode(file_content)
+                else:
+                    payload = bytes(file_content)
+            
+            return unpack_content(payload, file_data.get('content_encoding'))
         except Exception:
             return None
\ No newline at end of file
@@ -2,12 +2,62 @@
 MongoDB-based learning tracker with fallback to JSON for development.
 """
 
-import json
 import os
+import threading
 from datetime import datetime
-from typing import Dict, Any, List
-from collections import defaultdict
+from typing import Dict, Any, List, Tuple, Set, Optional
+from collections import Counter
+from operator import itemgetter
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.errors import DuplicateKeyError
 from mongodb_config import get_mongo_manager
+from json_store import JsonStore
+from learning_tracker import files_as_sets
+
+# Each character and word keeps only its most recent per-file frequency entries
+MAX_FREQ_HISTORY = 20
+
+
+# Short names stored in the exposures collection for its bulkiest, per-file fields;
+# exposure_to_public translates them back for anything outside this module
+EXPOSURE_FIELDS = {'files_seen_in': 'fs', 'frequency_history': 'fh'}
+FREQUENCY_FIELDS = {'file_id': 'f', 'filename': 'n', 'frequency': 'c', 'date': 'd'}
+
+
+def exposure_to_public(document: Dict[str, Any]) -> Dict[str, Any]:
+    """Return an exposures document with its long field names restored."""
+    public = dict(document)
+    for name, short in EXPOSURE_FIELDS.items():
+        if short in public:
+            public[name] = public.pop(short)
+    long_names = {short: name for name, short in FREQUENCY_FIELDS.items()}
+    public['frequency_history'] = [
+        {long_names.get(key, key): value for key, value in entry.items()}
+        for entry in public.get('frequency_history', [])
+    ]
+    return public
+
+
+def _character_level(exposures: int, files_count: int) -> str:
+    """Get the mastery level of a character."""
+    if exposures >= 50 and files_count >= 5:
+        return 'mastered'
+    elif exposures >= 20 and files_count >= 3:
+        return 'familiar'
+    elif exposures >= 5:
+        return 'learning'
+    return 'beginner'
+
+
+def _word_level(exposures: int, files_count: int) -> str:
+    """Get the mastery level of a word."""
+    if exposures >= 30 and files_count >= 4:
+        return 'mastered'
+    elif exposures >= 10 and files_count >= 2:
+        return 'familiar'
+    elif exposures >= 3:
+        return 'learning'
+    return 'beginner'
 
 
 class LearningTracker:
@@ -16,37 +66,24 @@ class LearningTracker:
     def __init__(self):
         self.mongo = get_mongo_manager()
         
+        # Each character or word a user has seen is its own document in the exposures
+        # collection, keyed by (user_id, kind, item), so learning documents stay small
+        self._exposures = self.mongo.get_collection('exposures')
+        # Users whose exposures were checked for the embedded layout in this process
+        self._migrated_users: Set[str] = set()
+        
+        # _lock guards the JSON records in fallback mode
+        self._lock = threading.RLock()
+        
         # Fallback to JSON if MongoDB is not available
         if not self.mongo.is_connected():
             self.json_db_path = "data/learning_progress.json"
-            self.json_db_dir = os.path.dirname(self.json_db_path)
-            self._ensure_json_db_exists()
-    
-    def _ensure_json_db_exists(self):
-        """Ensure JSON database exists (fallback mode)."""
-        if not os.path.exists(self.json_db_dir):
-            os.makedirs(self.json_db_dir)
-        
-        if not os.path.exists(self.json_db_path):
-            self._save_json_data({})
-    
-    def _load_json_data(self) -> Dict[str, Any]:
-        """Load data from JSON file (fallback mode)."""
-        try:
-            with open(self.json_db_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {}
-    
-    def _save_json_data(self, data: Dict[str, Any]):
-        """Save data to JSON file (fallback mode)."""
-        with open(self.json_db_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+            self._store = JsonStore(self.json_db_path, lock=self._lock, on_load=files_as_sets)
     
     def track_exposure(self, user_id: str, characters: Dict[str, int], words: Dict[str, int],
-                      file_id: str, filename: str):
-        """Track user exposure to characters and words from a file."""
-        timestamp = datetime.now().isoformat()
+                      file_id: str, filename: str, timestamp: Optional[str] = None):
+        """Track user exposure to characters and words from a file; timestamp defaults to now."""
+        timestamp = timestamp or datetime.now().isoformat()
         
         # Prepare session data
         session = {
@@ -62,93 +99,46 @@ class LearningTracker:
         
         if self.mongo.is_connected():
             try:
+                self._migrate_embedded_exposures(user_id)
                 learning_collection = self.mongo.get_collection('learning_progress')
                 
-                # Get existing user data
-                user_data = learning_collection.find_one({'user_id': user_id})
-                
-                if not user_data:
-                    # Create new user record
-                    user_data = {
-                        'user_id': user_id,
-                        'character_exposure': {},
-                        'word_exposure': {},
-                        'learning_sessions': [],
-                        'mastery_levels': {'characters': {}, 'words': {}},
-                        'total_exposures': 0,
-                        'unique_files_analyzed': []
-                    }
-                
-                # Track character exposure
-                for char, frequency in characters.items():
-                    if char not in user_data['character_exposure']:
-                        user_data['character_exposure'][char] = {
-                            'total_exposures': 0,
-                            'files_seen_in': [],
-                            'first_seen': timestamp,
-                            'last_seen': timestamp,
-                            'frequency_history': []
-                        }
-                        session['new_characters'] += 1
-                    
-                    char_data = user_data['character_exposure'][char]
-                    char_data['total_exposures'] += frequency
-                    char_data['last_seen'] = timestamp
-                    char_data['frequency_history'].append({
-                        'file_id': file_id,
-                        'filename': filename,
-                        'frequency': frequency,
-                        'date': timestamp
-                    })
-                    
-                    if file_id not in char_data['files_seen_in']:
-                        char_data['files_seen_in'].append(file_id)
-                
-                # Track word exposure
-                for word, frequency in words.items():
-                    if word not in user_data['word_exposure']:
-                        user_data['word_exposure'][word] = {
-                            'total_exposures': 0,
-                            'files_seen_in': [],
-                            'first_seen': timestamp,
-                            'last_seen': timestamp,
-                            'frequency_history': []
-                        }
-                        session['new_words'] += 1
-                    
-                    word_data = user_data['word_exposure'][word]
-                    word_data['total_exposures'] += frequency
-                    word_data['last_seen'] = timestamp
-                    word_data['frequency_history'].append({
-                        'file_id': file_id,
-                        'filename': filename,
-                        'frequency': frequency,
-                        'date': timestamp
-                    })
-                    
-                    if file_id not in word_data['files_seen_in']:
-                        word_data['files_seen_in'].append(file_id)
-                
-                # Add session and update counters
-                user_data['learning_sessions'].append(session)
-                user_data['total_exposures'] += 1
+                # Every item's files_seen_in is a subset of unique_files_analyzed, so when this
+                # user has not analyzed the file before no item needs a membership test
+                new_file = learning_collection.find_one(
+                    {'user_id': user_id, 'unique_files_analyzed': file_id},
+                    projection={'_id': 1}
+                ) is None
                 
-                if file_id not in user_data['unique_files_analyzed']:
-                    user_data['unique_files_analyzed'].append(file_id)
-                
-                # Keep only last 50 sessions
-                if len(user_data['learning_sessions']) > 50:
-                    user_data['learning_sessions'] = user_data['learning_sessions'][-50:]
-                
-                # Update mastery levels
-                self._update_mastery_levels(user_data)
-                
-                # Save to MongoDB
-                learning_collection.replace_one(
-                    {'user_id': user_id},
-                    user_data,
-                    upsert=True
+                totals = {'total_exposures': 1}
+                char_operations, session['new_characters'] = self._exposure_updates(
+                    user_id, 'characters', _character_level, characters, new_file,
+                    file_id, filename, timestamp, totals
                 )
+                word_operations, session['new_words'] = self._exposure_updates(
+                    user_id, 'words', _word_level, words, new_file,
+                    file_id, filename, timestamp, totals
+                )
+                if char_operations or word_operations:
+                    self._exposures.bulk_write(char_operations + word_operations, ordered=False)
+                
+                # The upsert creates the user's learning document on their first analysis;
+                # exposure_totals keeps the counts the progress page shows up to date. It is
+                # sent now rather than batched, since the totals and unique_files_analyzed
+                # (which new_file above relies on) must follow the exposures just written.
+                # The $ne filter makes sending the same session twice a no-op: the update
+                # then matches nothing and its upsert hits the unique user_id index
+                try:
+                    learning_collection.update_one(
+                        {'user_id': user_id, 'learning_sessions.session_id': {'$ne': session['session_id']}},
+                        {
+                            '$push': {'learning_sessions': {'$each': [session], '$slice': -50}},
+                            '$inc': totals,
+                            '$addToSet': {'unique_files_analyzed': file_id}
+                        },
+                        upsert=True
+                    )
+                except DuplicateKeyError:
+                    pass
                 return
                 
             except Exception as e:
@@ -157,167 +147,377 @@ class LearningTracker:
                 pass
         
         # JSON fallback
-        data = self._load_json_data()
-        
-        if user_id not in data:
-            data[user_id] = {
-                'character_exposure': {},
-                'word_exposure': {},
-                'learning_sessions': [],
-                'mastery_levels': {'characters': {}, 'words': {}},
-                'total_exposures': 0,
-                'unique_files_analyzed': []
-            }
-        
-        user_data = data[user_id]
-        
-        # Track character exposure
-        for char, frequency in characters.items():
-            if char not in user_data['character_exposure']:
-                user_data['character_exposure'][char] = {
+        with self._lock:
+            data = self._store.load()
+            
+            if user_id not in data:
+                data[user_id] = {
+                    'character_exposure': {},
+                    'word_exposure': {},
+                    'learning_sessions': [],
+                    'mastery_levels': {'characters': {}, 'words': {}},
                     'total_exposures': 0,
-                    'files_seen_in': [],
-                    'first_seen': timestamp,
-                    'last_seen': timestamp,
-                    'frequency_history': []
+                    'unique_files_analyzed': set()
                 }
-                session['new_characters'] += 1
             
-            char_data = user_data['character_exposure'][char]
-            char_data['total_exposures'] += frequency
-            char_data['last_seen'] = timestamp
-            char_data['frequency_history'].append({
-                'file_id': file_id,
-                'filename': filename,
-                'frequency': frequency,
-                'date': timestamp
-            })
+            user_data = data[user_id]
             
-            if file_id not in char_data['files_seen_in']:
-                char_data['files_seen_in'].append(file_id)
-        
-        # Track word exposure
-        for word, frequency in words.items():
-            if word not in user_data['word_exposure']:
-                user_data['word_exposure'][word] = {
-                    'total_exposures': 0,
-                    'files_seen_in': [],
-                    'first_seen': timestamp,
-                    'last_seen': timestamp,
-                    'frequency_history': []
-                }
-                session['new_words'] += 1
+            # Track character exposure
+            for char, frequency in characters.items():
+                if char not in user_data['character_exposure']:
+                    user_data['character_exposure'][char] = {
+                        'total_exposures': 0,
+                        'files_seen_in': set(),
+                        'files_count': 0,
+                        'first_seen': timestamp,
+                        'last_seen': timestamp,
+                        'frequency_history': []
+                    }
+                    session['new_characters'] += 1
+                
+                char_data = user_data['character_exposure'][char]
+                char_data['total_exposures'] += frequency
+                char_data['last_seen'] = timestamp
+                char_data['frequency_history'].append({
+                    'file_id': file_id,
+                    'filename': filename,
+                    'frequency': frequency,
+                    'date': timestamp
+                })
+                del char_data['frequency_history'][:-MAX_FREQ_HISTORY]
+                
+                char_data['files_seen_in'].add(file_id)
+                char_data['files_count'] = len(char_data['files_seen_in'])
             
-            word_data = user_data['word_exposure'][word]
-            word_data['total_exposures'] += frequency
-            word_data['last_seen'] = timestamp
-            word_data['frequency_history'].append({
-                'file_id': file_id,
-                'filename': filename,
-                'frequency': frequency,
-                'date': timestamp
-            })
+            # Track word exposure
+            for word, frequency in words.items():
+                if word not in user_data['word_exposure']:
+                    user_data['word_exposure'][word] = {
+                        'total_exposures': 0,
+                        'files_seen_in': set(),
+                        'files_count': 0,
+                        'first_seen': timestamp,
+                        'last_seen': timestamp,
+                        'frequency_history': []
+                    }
+                    session['new_words'] += 1
+                
+                word_data = user_data['word_exposure'][word]
+                word_data['total_exposures'] += frequency
+                word_data['last_seen'] = timestamp
+                word_data['frequency_history'].append({
+                    'file_id': file_id,
+                    'filename': filename,
+                    'frequency': frequency,
+                    'date': timestamp
+                })
+                del word_data['frequency_history'][:-MAX_FREQ_HISTORY]
+                
+                word_data['files_seen_in'].add(file_id)
+                word_data['files_count'] = len(word_data['files_seen_in'])
             
-            if file_id not in word_data['files_seen_in']:
-                word_data['files_seen_in'].append(file_id)
-        
-        # Add session and update counters
-        user_data['learning_sessions'].append(session)
-        user_data['total_exposures'] += 1
-        
-        if file_id not in user_data['unique_files_analyzed']:
-            user_data['unique_files_analyzed'].append(file_id)
-        
-        # Keep only last 50 sessions
-        if len(user_data['learning_sessions']) > 50:
-            user_data['learning_sessions'] = user_data['learning_sessions'][-50:]
-        
-        # Update mastery levels
-        self._update_mastery_levels(user_data)
-        
-        self._save_json_data(data)
+            # Add session and update counters
+            user_data['learning_sessions'].append(session)
+            user_data['total_exposures'] += 1
+            
+            user_data['unique_files_analyzed'].add(file_id)
+            
+            # Keep only last 50 sessions
+            if len(user_data['learning_sessions']) > 50:
+                user_data['learning_sessions'] = user_data['learning_sessions'][-50:]
+            
+            # Update mastery levels
+            self._update_mastery_levels(user_data, set(characters), set(words), timestamp)
+            
+            self._store.save(data)
     
-    def _update_mastery_levels(self, user_data: Dict[str, Any]):
-        """Update mastery levels based on exposure frequency."""
+    def _exposure_updates(self, user_id: str, kind: str, level_of, counts: Dict[str, int], new_file: bool,
+                          file_id: str, filename: str, timestamp: str,
+                          totals: Dict[str, int]) -> Tuple[List[UpdateOne], int]:
+        """
+        Build the MongoDB updates recording one file's exposures to characters or words.
+        
+        Returns the updates and the number of items the user had not seen before; the
+        matching changes to the user's exposure_totals are added to totals as $inc fields.
+        """
+        if not counts:
+            return [], 0
+        
+        # Read back the touched items' totals, to work out their mastery after this update;
+        # files_seen_in is only checked for this file when the user analyzed it before
+        projection = {'_id': 0, 'item': 1, 'total_exposures': 1, 'files_count': 1, 'mastery.level': 1}
+        if not new_file:
+            projection['fs'] = {'$elemMatch': {'$eq': file_id}}
+        seen = {
+            document['item']: document
+            for document in self._exposures.find(
+                {'user_id': user_id, 'kind': kind, 'item': {'$in': list(counts)}},
+                projection=projection
+            )
+        }
         
+        # Parts of the update that are the same for every item are built once and shared
+        set_on_insert = {'first_seen': timestamp}
+        add_to_set = {'fs': file_id}
+        level_changes = Counter()
+        
+        operations = []
+        new_items = 0
+        for item, frequency in counts.items():
+            prior = seen.get(item)
+            if prior is None:
+                prior = {}
+                new_items += 1
+            
+            # Mastery depends only on this item's own totals after the update
+            exposures = prior.get('total_exposures', 0) + frequency
+            files_count = prior.get('files_count', 0) + (new_file or not prior.get('fs'))
+            level = level_of(exposures, files_count)
+            
+            prior_level = prior.get('mastery', {}).get('level')
+            if level != prior_level:
+                level_changes[level] += 1
+                if prior_level is not None:
+                    level_changes[prior_level] -= 1
+            
+            operations.append(UpdateOne(
+                {'user_id': user_id, 'kind': kind, 'item': item},
+                {
+                    '$inc': {'total_exposures': frequency},
+                    '$set': {
+                        'last_seen': timestamp,
+                        'files_count': files_count,
+                        'mastery': {
+                            'level': level,
+                            'exposures': exposures,
+                            'files_count': files_count,
+                            'last_updated': timestamp
+                        }
+                    },
+                    '$setOnInsert': set_on_insert,
+                    '$addToSet': add_to_set,
+                    '$push': {'fh': {
+                        '$each': [{'f': file_id, 'n': filename, 'c': frequency, 'd': timestamp}],
+                        '$slice': -MAX_FREQ_HISTORY
+                    }}
+                },
+                upsert=True
+            ))
+        
+        for level, change in level_changes.items():
+            if change:
+                totals[f'exposure_totals.{kind}.levels.{level}'] = change
+        totals[f'exposure_totals.{kind}.items'] = new_items
+        totals[f'exposure_totals.{kind}.exposures'] = sum(counts.values())
+        return operations, new_items
+    
+    def _migrate_embedded_exposures(self, user_id: str):
+        """Move exposures still stored inside a user's learning document to the exposures collection."""
+        if user_id in self._migrated_users:
+            return
+        
+        learning_collection = self.mongo.get_collection('learning_progress')
+        user_data = learning_collection.find_one(
+            {
+                'user_id': user_id,
+                '$or': [{'character_exposure': {'$exists': True}}, {'word_exposure': {'$exists': True}}]
+            },
+            projection={'_id': 0, 'character_exposure': 1, 'word_exposure': 1, 'mastery_levels': 1}
+        )
+        
+        if user_data:
+            mastery_levels = user_data.get('mastery_levels', {})
+            operations = []
+            for field, kind in (('character_exposure', 'characters'), ('word_exposure', 'words')):
+                for item, item_data in user_data.get(field, {}).items():
+                    document = dict(item_data, user_id=user_id, kind=kind, item=item)
+                    document.setdefault('files_count', len(item_data.get('files_seen_in', [])))
+                    document['fs'] = document.pop('files_seen_in', [])
+                    document['fh'] = [
+                        {FREQUENCY_FIELDS.get(key, key): value for key, value in entry.items()}
+                        for entry in document.pop('frequency_history', [])[-MAX_FREQ_HISTORY:]
+                    ]
+                    if item in mastery_levels.get(kind, {}):
+                        document['mastery'] = mastery_levels[kind][item]
+                    operations.append(ReplaceOne(
+                        {'user_id': user_id, 'kind': kind, 'item': item}, document, upsert=True
+                    ))
+            if operations:
+                self._exposures.bulk_write(operations, ordered=False)
+            learning_collection.update_one(
+                {'user_id': user_id},
+                {'$unset': {'character_exposure': '', 'word_exposure': '', 'mastery_levels': ''}}
+            )
+        
+        # Exposures written before the short field names were introduced are renamed in place
+        self._exposures.update_many(
+            {'user_id': user_id, 'files_seen_in': {'$exists': True}},
+            {'$rename': EXPOSURE_FIELDS}
+        )
+        
+        self._backfill_exposure_totals(user_id)
+        self._migrated_users.add(user_id)
+    
+    def _backfill_exposure_totals(self, user_id: str):
+        """Compute exposure_totals from the exposures collection for a learning document written without them."""
+        learning_collection = self.mongo.get_collection('learning_progress')
+        if learning_collection.find_one(
+            {'user_id': user_id, 'exposure_totals': {'$exists': False}},
+            projection={'_id': 1}
+        ) is None:
+            return
+        
+        totals = {kind: {'items': 0, 'exposures': 0, 'levels': {}} for kind in ('characters', 'words')}
+        pipeline = [
+            {'$match': {'user_id': user_id}},
+            {'$group': {
+                '_id': {'kind': '$kind', 'level': '$mastery.level'},
+                'items': {'$sum': 1},
+                'exposures': {'$sum': '$total_exposures'}
+            }}
+        ]
+        for group in self._exposures.aggregate(pipeline):
+            kind_totals = totals[group['_id']['kind']]
+            kind_totals['items'] += group['items']
+            kind_totals['exposures'] += group['exposures']
+            level = group['_id'].get('level')
+            if level is not None:
+                kind_totals['levels'][level] = group['items']
+        
+        learning_collection.update_one(
+            {'user_id': user_id, 'exposure_totals': {'$exists': False}},
+            {'$set': {'exposure_totals': totals}}
+        )
+    
+    def _session_summary(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get a user's session statistics, recent sessions and counters, computed by MongoDB.
+        
+        Returns None if the user has no learning document.
+        """
+        learning_collection = self.mongo.get_collection('learning_progress')
+        sessions = {'$ifNull': ['$learning_sessions', []]}
+        pipeline = [
+            {'$match': {'user_id': user_id}},
+            {'$project': {
+                '_id': 0,
+                'total_exposures': 1,
+                'exposure_totals': 1,
+                'unique_files': {'$size': {'$ifNull': ['$unique_files_analyzed', []]}},
+                'recent_sessions': {'$slice': [sessions, -10]},
+                'session_stats': {
+                    'total_sessions': {'$size': sessions},
+                    'avg_characters_per_session': {'$avg': '$learning_sessions.characters_encountered'},
+                    'avg_words_per_session': {'$avg': '$learning_sessions.words_encountered'},
+                    'first_session': {'$arrayElemAt': ['$learning_sessions.timestamp', 0]},
+                    'last_session': {'$arrayElemAt': ['$learning_sessions.timestamp', -1]}
+                }
+            }}
+        ]
+        summary = next(learning_collection.aggregate(pipeline), None)
+        if summary is not None and not summary['session_stats']['total_sessions']:
+            summary['session_stats'] = {'total_sessions': 0}
+        return summary
+    
+    def _exposure_stats(self, exposure_totals: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Turn a learning document's exposure_totals into character and word statistics."""
+        char_totals = exposure_totals.get('characters', {})
+        word_totals = exposure_totals.get('words', {})
+        char_stats = {
+            'total_characters_seen': char_totals.get('items', 0),
+            'total_character_exposures': char_totals.get('exposures', 0),
+            'mastery_breakdown': {level: n for level, n in char_totals.get('levels', {}).items() if n}
+        }
+        word_stats = {
+            'total_words_seen': word_totals.get('items', 0),
+            'total_word_exposures': word_totals.get('exposures', 0),
+            'mastery_breakdown': {level: n for level, n in word_totals.get('levels', {}).items() if n}
+        }
+        return char_stats, word_stats
+    
+    def _update_mastery_levels(self, user_data: Dict[str, Any], changed_chars: Set[str], changed_words: Set[str],
+                               last_updated: str):
+        """
+        Update mastery levels based on exposure frequency.
+        
+        Only the characters and words passed in are recomputed; a level depends on nothing
+        but the item's own exposures and files, so the others cannot have changed.
+        last_updated is the timestamp of the session being recorded.
+        """
         # Character mastery levels
-        for char, char_data in user_data['character_exposure'].items():
+        for char in changed_chars:
+            char_data = user_data['character_exposure'][char]
             exposures = char_data['total_exposures']
-            files_count = len(char_data['files_seen_in'])
-            
-            if exposures >= 50 and files_count >= 5:
-                level = 'mastered'
-            elif exposures >= 20 and files_count >= 3:
-                level = 'familiar'
-            elif exposures >= 5:
-                level = 'learning'
-            else:
-                level = 'beginner'
+            files_count = char_data.get('files_count', len(char_data['files_seen_in']))
             
             user_data['mastery_levels']['characters'][char] = {
-                'level': level,
+                'level': _character_level(exposures, files_count),
                 'exposures': exposures,
                 'files_count': files_count,
-                'last_updated': datetime.now().isoformat()
+                'last_updated': last_updated
             }
         
         # Word mastery levels
-        for word, word_data in user_data['word_exposure'].items():
+        for word in changed_words:
+            word_data = user_data['word_exposure'][word]
             exposures = word_data['total_exposures']
-            files_count = len(word_data['files_seen_in'])
-            
-            if exposures >= 30 and files_count >= 4:
-                level = 'mastered'
-            elif exposures >= 10 and files_count >= 2:
-                level = 'familiar'
-            elif exposures >= 3:
-                level = 'learning'
-            else:
-                level = 'beginner'
+            files_count = word_data.get('files_count', len(word_data['files_seen_in']))
             
             user_data['mastery_levels']['words'][word] = {
-                'level': level,
+                'level': _word_level(exposures, files_count),
                 'exposures': exposures,
                 'files_count': files_count,
-                'last_updated': datetime.now().isoformat()
+                'last_updated': last_updated
             }
     
     def get_user_progress(self, user_id: str) -> Dict[str, Any]:
         """Get comprehensive learning progress for a user."""
         if self.mongo.is_connected():
             try:
-                learning_collection = self.mongo.get_collection('learning_progress')
-                user_data = learning_collection.find_one({'user_id': user_id})
-                if user_data:
-                    user_data.pop('_id', None)  # Remove MongoDB ObjectId
-                else:
+                self._migrate_embedded_exposures(user_id)
+                summary = self._session_summary(user_id)
+                if summary is None:
                     return self._empty_progress()
+                
+                char_stats, word_stats = self._exposure_stats(summary.get('exposure_totals', {}))
+                return {
+                    'character_stats': char_stats,
+                    'word_stats': word_stats,
+                    'session_stats': summary['session_stats'],
+                    'mastery_levels': self._get_mastery_levels(user_id),
+                    'recent_sessions': summary['recent_sessions'],
+                    'total_exposures': summary.get('total_exposures', 0),
+                    'unique_files': summary['unique_files']
+                }
             except Exception as e:
                 print(f"MongoDB learning progress error: {e}")
                 # Fall back to JSON
-                user_data = None
+                pass
         
-        if not user_data:
-            # JSON fallback
-            data = self._load_json_data()
+        # JSON fallback, held throughout since track_exposure changes these records from other
+        # sessions; the mastery levels are copied so callers never iterate the live dicts
+        with self._lock:
+            data = self._store.load()
             user_data = data.get(user_id)
             if not user_data:
                 return self._empty_progress()
-        
-        # Calculate statistics
-        char_stats = self._calculate_character_stats(user_data)
-        word_stats = self._calculate_word_stats(user_data)
-        session_stats = self._calculate_session_stats(user_data)
-        
-        return {
-            'character_stats': char_stats,
-            'word_stats': word_stats,
-            'session_stats': session_stats,
-            'mastery_levels': user_data.get('mastery_levels', {}),
-            'recent_sessions': user_data.get('learning_sessions', [])[-10:],
-            'total_exposures': user_data.get('total_exposures', 0),
-            'unique_files': len(user_data.get('unique_files_analyzed', []))
-        }
+            
+            # Calculate statistics
+            char_stats = self._calculate_character_stats(user_data)
+            word_stats = self._calculate_word_stats(user_data)
+            session_stats = self._calculate_session_stats(user_data)
+            
+            return {
+                'character_stats': char_stats,
+                'word_stats': word_stats,
+                'session_stats': session_stats,
+                'mastery_levels': {
+                    kind: dict(levels) for kind, levels in user_data.get('mastery_levels', {}).items()
+                },
+                'recent_sessions': user_data.get('learning_sessions', [])[-10:],
+                'total_exposures': user_data.get('total_exposures', 0),
+                'unique_files': len(user_data.get('unique_files_analyzed', []))
+            }
     
     def _calculate_character_stats(self, user_data: Dict[str, Any]) -> Dict[str, Any]:
         """Calculate character learning statistics."""
@@ -327,13 +527,10 @@ class LearningTracker:
         stats = {
             'total_characters_seen': len(char_exposure),
             'total_character_exposures': sum(data['total_exposures'] for data in char_exposure.values()),
-            'mastery_breakdown': defaultdict(int)
+            'mastery_breakdown': dict(Counter(map(itemgetter('level'), mastery.values())))
         }
         
-        for char_mastery in mastery.values():
-            stats['mastery_breakdown'][char_mastery['level']] += 1
-        
-        return dict(stats)
+        return stats
     
     def _calculate_word_stats(self, user_data: Dict[str, Any]) -> Dict[str, Any]:
         """Calculate word learning statistics."""
@@ -343,13 +540,10 @@ class LearningTracker:
         stats = {
             'total_words_seen': len(word_exposure),
             'total_word_exposures': sum(data['total_exposures'] for data in word_exposure.values()),
-            'mastery_breakdown': defaultdict(int)
+            'mastery_breakdown': dict(Counter(map(itemgetter('level'), mastery.values())))
         }
         
-        for word_mastery in mastery.values():
-            stats['mastery_breakdown'][word_mastery['level']] += 1
-        
-        return dict(stats)
+        return stats
     
     def _calculate_session_stats(self, user_data: Dict[str, Any]) -> Dict[str, Any]:
         """Calculate learning session statistics."""
@@ -378,10 +572,32 @@ class LearningTracker:
             'unique_files': 0
         }
     
+    def _get_mastery_levels(self, user_id: str) -> Dict[str, Any]:
+        """Get a user's mastery levels without reading or summarizing the rest of their progress."""
+        if self.mongo.is_connected():
+            try:
+                self._migrate_embedded_exposures(user_id)
+                mastery_levels = {'characters': {}, 'words': {}}
+                for document in self._exposures.find(
+                    {'user_id': user_id, 'mastery': {'$exists': True}},
+                    projection={'_id': 0, 'kind': 1, 'item': 1, 'mastery': 1}
+                ):
+                    mastery_levels[document['kind']][document['item']] = document['mastery']
+                return mastery_levels
+            except Exception as e:
+                print(f"MongoDB mastery levels error: {e}")
+                # Fall back to JSON
+                pass
+        
+        # JSON fallback, copied under the lock so callers never iterate the live dicts
+        with self._lock:
+            data = self._store.load()
+            mastery_levels = data.get(user_id, {}).get('mastery_levels', {})
+            return {kind: dict(levels) for kind, levels in mastery_levels.items()}
+    
     def get_mastered_items(self, user_id: str, item_type: str = 'both') -> Dict[str, List[str]]:
         """Get list of mastered characters and/or words."""
-        progress = self.get_user_progress(user_id)
-        mastery = progress.get('mastery_levels', {})
+        mastery = self._get_mastery_levels(user_id)
         result = {}
         
         if item_type in ['characters', 'both']:
@@ -400,8 +616,7 @@ class LearningTracker:
     
     def get_learning_recommendations(self, user_id: str) -> Dict[str, List[str]]:
         """Get recommendations for what to focus on learning."""
-        progress = self.get_user_progress(user_id)
-        mastery = progress.get('mastery_levels', {})
+        mastery = self._get_mastery_levels(user_id)
         
         # Recommend items at 'learning' level (not beginner, not mastered)
         recommendations = {
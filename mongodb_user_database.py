@@ -2,12 +2,49 @@
 MongoDB-based user database with fallback to JSON for development.
 """
 
-import json
 import os
+import threading
 from datetime import datetime
 from typing import Dict, Any, Optional, List
 import uuid
-from mongodb_config import get_mongo_manager
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from mongodb_config import UpdateQueue, get_mongo_manager
+from json_store import SAVE_DELAY_SECONDS, JsonStore
+
+# Queued user updates are sent to MongoDB in one bulk_write once this many accumulate,
+# or SAVE_DELAY_SECONDS after the first one, whichever comes first
+MONGO_FLUSH_THRESHOLD = 50
+
+# In fallback mode, logins and analysis results are appended to a log next to the JSON
+# file instead of rewriting it; once this many accumulate they are folded into a full save
+USER_LOG_CHECKPOINT = 200
+
+
+def _apply_user_update(user_data: Dict[str, Any], entry: Dict[str, Any]):
+    """Apply one logged login or analysis result to a user record; applying it twice changes nothing."""
+    if 'last_login' in entry:
+        user_data['last_login'] = entry['last_login']
+    
+    record = entry.get('record')
+    if record is None:
+        return
+    history = user_data['analysis_history']
+    if any(existing.get('analysis_id') == record['analysis_id'] for existing in history):
+        return
+    
+    # Keep only last 50 analyses
+    history.append(record)
+    del history[:-50]
+    user_data['total_analyses'] = user_data.get('total_analyses', 0) + 1
+    user_data['total_files_analyzed'] = user_data.get('total_files_analyzed', 0) + 1
+
+
+def _apply_logged_update(data: Dict[str, Any], entry: Dict[str, Any]):
+    """Replay one entry of the update log onto the loaded user records."""
+    user_data = data.get(entry['user_id'])
+    if user_data is not None:
+        _apply_user_update(user_data, entry)
 
 
 class UserDatabase:
@@ -16,42 +53,47 @@ class UserDatabase:
     def __init__(self):
         self.mongo = get_mongo_manager()
         
+        # _lock guards the JSON records in fallback mode
+        self._lock = threading.RLock()
+        # username -> user_id for the fallback records, rebuilt whenever they are reloaded
+        self._username_index: Dict[str, str] = {}
+        
+        # MongoDB analysis-result and preference updates waiting for the next bulk_write;
+        # ordered, so history pushes and preference changes land in the order they were made
+        self._updates = UpdateQueue(
+            self.mongo.get_collection('users'), ordered=True,
+            flush_threshold=MONGO_FLUSH_THRESHOLD, delay_seconds=SAVE_DELAY_SECONDS
+        )
+        
         # Fallback to JSON if MongoDB is not available
         if not self.mongo.is_connected():
             self.json_db_path = "data/users.json"
             self.json_db_dir = os.path.dirname(self.json_db_path)
-            self._ensure_json_db_exists()
-    
-    def _ensure_json_db_exists(self):
-        """Ensure JSON database exists (fallback mode)."""
-        if not os.path.exists(self.json_db_dir):
-            os.makedirs(self.json_db_dir)
-        
-        if not os.path.exists(self.json_db_path):
-            self._save_json_data({})
+            self._store = JsonStore(
+                self.json_db_path, lock=self._lock,
+                log_path=os.path.join(self.json_db_dir, "user_updates.jsonl"),
+                log_checkpoint=USER_LOG_CHECKPOINT,
+                apply_log_entry=_apply_logged_update,
+                on_load=self._build_username_index
+            )
     
-    def _load_json_data(self) -> Dict[str, Any]:
-        """Load data from JSON file (fallback mode)."""
-        try:
-            with open(self.json_db_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {}
-    
-    def _save_json_data(self, data: Dict[str, Any]):
-        """Save data to JSON file (fallback mode)."""
-        with open(self.json_db_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+    def _build_username_index(self, data: Dict[str, Any]):
+        """Index the loaded fallback records by username."""
+        self._username_index = {
+            user_data['username']: user_id
+            for user_id, user_data in data.items() if user_data.get('username')
+        }
     
     def create_user(self, username: str, email: str = None) -> Dict[str, Any]:
-        """Create a new user account."""
+        """Create a new user account; raises ValueError if the username is taken."""
         user_id = str(uuid.uuid4())[:12]
+        now = datetime.now().isoformat()
         user_data = {
             'user_id': user_id,
             'username': username,
             'email': email,
-            'created_at': datetime.now().isoformat(),
-            'last_login': datetime.now().isoformat(),
+            'created_at': now,
+            'last_login': now,
             'total_analyses': 0,
             'total_files_analyzed': 0,
             'preferences': {
@@ -69,64 +111,72 @@ class UserDatabase:
                 users_collection = self.mongo.get_collection('users')
                 users_collection.insert_one(user_data)
                 return user_data
+            except DuplicateKeyError:
+                # The unique username index rejected it; the JSON fallback must not take it either
+                raise ValueError(f"Username '{username}' already exists")
             except Exception as e:
                 print(f"MongoDB insert error: {e}")
                 # Fall back to JSON
                 pass
         
         # JSON fallback storage
-        data = self._load_json_data()
-        data[user_id] = user_data
-        self._save_json_data(data)
-        return user_data
+        with self._lock:
+            data = self._store.load()
+            if username in self._username_index:
+                raise ValueError(f"Username '{username}' already exists")
+            data[user_id] = user_data
+            self._username_index[username] = user_id
+            self._store.save(data)
+            return user_data
     
     def get_user_by_username(self, username: str) -> Optional[Dict[str, Any]]:
-        """Get user by username."""
+        """Get user by username; MongoDB leaves out the analysis history, which sign-in does not use."""
         if self.mongo.is_connected():
             try:
+                self._updates.sync()
                 users_collection = self.mongo.get_collection('users')
-                user = users_collection.find_one({'username': username})
-                if user:
-                    user.pop('_id', None)  # Remove MongoDB ObjectId
-                return user
+                return users_collection.find_one(
+                    {'username': username},
+                    projection={'_id': 0, 'analysis_history': 0}
+                )
             except Exception as e:
                 print(f"MongoDB query error: {e}")
                 # Fall back to JSON
                 pass
         
         # JSON fallback
-        data = self._load_json_data()
-        for user_data in data.values():
-            if user_data.get('username') == username:
-                return user_data
-        return None
+        data = self._store.load()
+        return data.get(self._username_index.get(username))
     
-    def get_user_by_id(self, user_id: str) -> Optional[Dict[str, Any]]:
-        """Get user by user ID."""
+    def get_user_by_id(self, user_id: str, projection: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Get user by user ID.
+        
+        projection limits which fields MongoDB returns; the JSON fallback always returns the full record.
+        """
         if self.mongo.is_connected():
             try:
+                self._updates.sync()
                 users_collection = self.mongo.get_collection('users')
-                user = users_collection.find_one({'user_id': user_id})
-                if user:
-                    user.pop('_id', None)  # Remove MongoDB ObjectId
-                return user
+                return users_collection.find_one({'user_id': user_id}, projection={**(projection or {}), '_id': 0})
             except Exception as e:
                 print(f"MongoDB query error: {e}")
                 # Fall back to JSON
                 pass
         
         # JSON fallback
-        data = self._load_json_data()
+        data = self._store.load()
         return data.get(user_id)
     
     def update_last_login(self, user_id: str):
         """Update user's last login time."""
+        now = datetime.now().isoformat()
         if self.mongo.is_connected():
             try:
                 users_collection = self.mongo.get_collection('users')
                 users_collection.update_one(
                     {'user_id': user_id},
-                    {'$set': {'last_login': datetime.now().isoformat()}}
+                    {'$set': {'last_login': now}}
                 )
                 return
             except Exception as e:
@@ -135,16 +185,52 @@ class UserDatabase:
                 pass
         
         # JSON fallback
-        data = self._load_json_data()
-        if user_id in data:
-            data[user_id]['last_login'] = datetime.now().isoformat()
-            self._save_json_data(data)
+        with self._lock:
+            data = self._store.load()
+            if user_id in data:
+                entry = {'user_id': user_id, 'last_login': now}
+                _apply_user_update(data[user_id], entry)
+                self._store.append_log(entry)
     
-    def save_analysis_result(self, user_id: str, analysis_data: Dict[str, Any]):
-        """Save analysis result to user's history."""
+    def login(self, username: str) -> Optional[Dict[str, Any]]:
+        """
+        Sign a user in: record the login time and return the updated user, or None if not found.
+        
+        MongoDB does both in one find_one_and_update and, like get_user_by_username,
+        leaves out the analysis history.
+        """
+        now = datetime.now().isoformat()
+        if self.mongo.is_connected():
+            try:
+                self._updates.sync()
+                users_collection = self.mongo.get_collection('users')
+                return users_collection.find_one_and_update(
+                    {'username': username},
+                    {'$set': {'last_login': now}},
+                    projection={'_id': 0, 'analysis_history': 0},
+                    return_document=ReturnDocument.AFTER
+                )
+            except Exception as e:
+                print(f"MongoDB update error: {e}")
+                # Fall back to JSON
+                pass
+        
+        # JSON fallback
+        with self._lock:
+            data = self._store.load()
+            user_id = self._username_index.get(username)
+            user_data = data.get(user_id)
+            if user_data is not None:
+                entry = {'user_id': user_id, 'last_login': now}
+                _apply_user_update(user_data, entry)
+                self._store.append_log(entry)
+            return user_data
+    
+    def save_analysis_result(self, user_id: str, analysis_data: Dict[str, Any], timestamp: Optional[str] = None):
+        """Save analysis result to user's history; timestamp defaults to now."""
         analysis_record = {
             'analysis_id': str(uuid.uuid4())[:8],
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': timestamp or datetime.now().isoformat(),
             'filename': analysis_data['filename'],
             'file_size': analysis_data['file_size'],
             'analysis_type': analysis_data['analysis_type'],
@@ -155,10 +241,10 @@ class UserDatabase:
         
         if self.mongo.is_connected():
             try:
-                users_collection = self.mongo.get_collection('users')
-                # Add to analysis history and update counters
-                users_collection.update_one(
-                    {'user_id': user_id},
+                # Add to analysis history and update counters; the $ne filter makes a retried
+                # batch skip a record it already pushed, so the counters are not bumped twice
+                self._updates.put(
+                    {'user_id': user_id, 'analysis_history.analysis_id': {'$ne': analysis_record['analysis_id']}},
                     {
                         '$push': {'analysis_history': {'$each': [analysis_record], '$slice': -50}},
                         '$inc': {'total_analyses': 1, 'total_files_analyzed': 1}
@@ -171,19 +257,17 @@ class UserDatabase:
                 pass
         
         # JSON fallback
-        data = self._load_json_data()
-        if user_id in data:
-            user_data = data[user_id]
-            user_data['analysis_history'].append(analysis_record)
-            # Keep only last 50 analyses
-            user_data['analysis_history'] = user_data['analysis_history'][-50:]
-            user_data['total_analyses'] = user_data.get('total_analyses', 0) + 1
-            user_data['total_files_analyzed'] = user_data.get('total_files_analyzed', 0) + 1
-            self._save_json_data(data)
+        with self._lock:
+            data = self._store.load()
+            if user_id in data:
+                # Appended to the update log rather than rewriting the whole JSON file
+                entry = {'user_id': user_id, 'record': analysis_record}
+                _apply_user_update(data[user_id], entry)
+                self._store.append_log(entry)
     
     def get_user_preferences(self, user_id: str) -> Dict[str, Any]:
         """Get user preferences."""
-        user_data = self.get_user_by_id(user_id)
+        user_data = self.get_user_by_id(user_id, {'preferences': 1})
         if user_data:
             return user_data.get('preferences', {})
         return {}
@@ -192,8 +276,7 @@ class UserDatabase:
         """Update user preferences."""
         if self.mongo.is_connected():
             try:
-                users_collection = self.mongo.get_collection('users')
-                users_collection.update_one(
+                self._updates.put(
                     {'user_id': user_id},
                     {'$set': {'preferences': preferences}}
                 )
@@ -204,14 +287,17 @@ class UserDatabase:
                 pass
         
         # JSON fallback
-        data = self._load_json_data()
-        if user_id in data:
-            data[user_id]['preferences'] = preferences
-            self._save_json_data(data)
+        with self._lock:
+            data = self._store.load()
+            if user_id in data:
+                data[user_id]['preferences'] = preferences
+                self._store.save(data)
     
     def get_analysis_history(self, user_id: str, limit: int = 10) -> List[Dict[str, Any]]:
         """Get user's analysis history."""
-        user_data = self.get_user_by_id(user_id)
+        # Only the requested tail of the history is read from MongoDB
+        projection = {'user_id': 1, 'analysis_history': {'$slice': -limit} if limit else 1}
+        user_data = self.get_user_by_id(user_id, projection)
         if user_data:
             history = user_data.get('analysis_history', [])
             return history[-limit:] if limit else history
@@ -219,7 +305,9 @@ class UserDatabase:
     
     def get_user_stats(self, user_id: str) -> Dict[str, Any]:
         """Get user statistics."""
-        user_data = self.get_user_by_id(user_id)
+        user_data = self.get_user_by_id(
+            user_id, dict.fromkeys(('total_analyses', 'total_files_analyzed', 'created_at', 'last_login'), 1)
+        )
         if user_data:
             return {
                 'total_analyses': user_data.get('total_analyses', 0),
@@ -227,4 +315,4 @@ class UserDatabase:
                 'member_since': user_data.get('created_at', ''),
                 'last_login': user_data.get('last_login', '')
             }
-        return {}
\ No newline at end of file
+        return {}
@@ -1,14 +1,242 @@
 import pycantonese
 import hanzidentifier
-from typing import Dict, List, Tuple, Any
+import atexit
+import json
+import os
+import sys
+import threading
+from heapq import nlargest
+from collections.abc import Mapping
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Any
 import re
 
+# orjson parses and encodes the cache several times faster than the stdlib json module
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Jyutping looked up in earlier runs, so a fresh process does not go back to pycantonese
+JYUTPING_CACHE_PATH = "data/jyutping_cache.json"
+
+# New lookups are saved this long after the first unsaved one, so the character and word
+# batches of an analysis (and of analyses close together) share one rewrite of the file
+JYUTPING_SAVE_DELAY_SECONDS = 5.0
+
+# Uncached characters or words are sent to pycantonese this many at a time, joined by a
+# full stop so the segmenter never reads neighbouring entries as one word
+JYUTPING_BATCH_SIZE = 1000
+_BATCH_SEPARATOR = '。'
+
+# Every byte except the ASCII tone digits 1-6, deleted from encoded Jyutping to leave only its tones
+_NON_TONE_BYTES = bytes(b for b in range(256) if not 0x31 <= b <= 0x36)
+
+_jyutping_cache: Dict[str, Dict[str, str]] = {}
+_jyutping_cache_loaded = False
+# Entries added since the cache was last written; changed only under _jyutping_cache_lock,
+# which every write to _jyutping_cache holds
+_jyutping_unsaved_entries = 0
+_jyutping_cache_lock = threading.Lock()
+# Keeps the timer and atexit saves from writing the file at the same time
+_jyutping_save_lock = threading.Lock()
+_jyutping_save_timer: Optional[threading.Timer] = None
+
+
+def _cached_jyutping(kind: str) -> Dict[str, str]:
+    """Return the character or word section of the Jyutping cache, loading the file on first use."""
+    global _jyutping_cache_loaded
+    if not _jyutping_cache_loaded:
+        with _jyutping_cache_lock:
+            if not _jyutping_cache_loaded:
+                try:
+                    with open(JYUTPING_CACHE_PATH, 'rb') as f:
+                        raw = f.read()
+                    _jyutping_cache.update(orjson.loads(raw) if orjson is not None else json.loads(raw))
+                except (OSError, ValueError):
+                    pass
+                _jyutping_cache_loaded = True
+    section = _jyutping_cache.get(kind)
+    if section is None:
+        with _jyutping_cache_lock:
+            section = _jyutping_cache.setdefault(kind, {})
+    return section
+
+
+def _add_jyutping(cache: Dict[str, str], entries: Iterable[Tuple[str, str]]):
+    """Add looked-up (text, jyutping) entries to a section of the Jyutping cache."""
+    global _jyutping_unsaved_entries
+    with _jyutping_cache_lock:
+        for text, jyutping in entries:
+            cache[text] = jyutping
+            _jyutping_unsaved_entries += 1
+
+
+def _schedule_jyutping_cache_save():
+    """Schedule a coalesced save of the Jyutping cache if lookups added to it."""
+    global _jyutping_save_timer
+    with _jyutping_cache_lock:
+        if _jyutping_unsaved_entries and _jyutping_save_timer is None:
+            _jyutping_save_timer = threading.Timer(JYUTPING_SAVE_DELAY_SECONDS, _save_jyutping_cache)
+            _jyutping_save_timer.daemon = True
+            _jyutping_save_timer.start()
+
+
+def _save_jyutping_cache():
+    """Write the Jyutping cache to disk if lookups added to it, replacing the file atomically."""
+    global _jyutping_unsaved_entries, _jyutping_save_timer
+    with _jyutping_save_lock:
+        # Only the snapshot holds the cache lock, so lookups are not held up by the write
+        with _jyutping_cache_lock:
+            _jyutping_save_timer = None
+            saved_entries = _jyutping_unsaved_entries
+            if not saved_entries:
+                return
+            snapshot = {kind: dict(section) for kind, section in _jyutping_cache.items()}
+        try:
+            if orjson is not None:
+                payload = orjson.dumps(snapshot)
+            else:
+                payload = json.dumps(snapshot, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            os.makedirs(os.path.dirname(JYUTPING_CACHE_PATH), exist_ok=True)
+            temp_path = f"{JYUTPING_CACHE_PATH}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(payload)
+            os.replace(temp_path, JYUTPING_CACHE_PATH)
+        except (OSError, ValueError) as e:
+            # The entries stay unsaved, for the next save to write
+            print(f"Error saving Jyutping cache: {e}")
+            return
+        with _jyutping_cache_lock:
+            _jyutping_unsaved_entries -= saved_entries
+
+
+atexit.register(_save_jyutping_cache)
+
+
+def _character_jyutping(char: str) -> str:
+    """Look up the Jyutping for a single character, cached across runs."""
+    cache = _cached_jyutping('characters')
+    jyutping = cache.get(char)
+    if jyutping is not None:
+        return jyutping
+    
+    try:
+        jyutping_result = pycantonese.characters_to_jyutping(char)
+        
+        if jyutping_result and len(jyutping_result) > 0:
+            # Extract the Jyutping pronunciation
+            jyutping = jyutping_result[0][1] if jyutping_result[0][1] else "unknown"
+        else:
+            jyutping = "unknown"
+        
+    except Exception:
+        # Lookup failures are not cached, so a later run can retry them
+        return "unknown"
+    
+    _add_jyutping(cache, [(char, jyutping)])
+    return jyutping
+
+
+def _word_jyutping(word: str) -> str:
+    """Look up the space-separated Jyutping for a word, cached across runs."""
+    cache = _cached_jyutping('words')
+    jyutping = cache.get(word)
+    if jyutping is not None:
+        return jyutping
+    
+    try:
+        jyutping_result = pycantonese.characters_to_jyutping(word)
+        
+        if jyutping_result:
+            # Combine all Jyutping pronunciations for the word
+            jyutping_parts = [pronunciation for _, pronunciation in jyutping_result if pronunciation]
+            jyutping = ' '.join(jyutping_parts) if jyutping_parts else "unknown"
+        else:
+            jyutping = "unknown"
+        
+    except Exception:
+        # Lookup failures are not cached, so a later run can retry them
+        return "unknown"
+    
+    _add_jyutping(cache, [(word, jyutping)])
+    return jyutping
+
+
+def _prefetch_jyutping(kind: str, texts: List[str]):
+    """
+    Cache the Jyutping of uncached characters or words with one pycantonese call per batch.
+    
+    Results are split back per entry at the separators; any entry the segmenter did not keep
+    apart is left uncached, for the single lookup in _character_jyutping or _word_jyutping.
+    """
+    cache = _cached_jyutping(kind)
+    misses = [text for text in texts if text not in cache and _BATCH_SEPARATOR not in text]
+    
+    # Batches are looked up in this process: the lookup is pure-Python work that holds the
+    # GIL, so threads would not overlap it, and a process pool would reload pycantonese
+    # for every prefetch
+    for start in range(0, len(misses), JYUTPING_BATCH_SIZE):
+        batch = misses[start:start + JYUTPING_BATCH_SIZE]
+        try:
+            jyutping_result = pycantonese.characters_to_jyutping(_BATCH_SEPARATOR.join(batch))
+        except Exception:
+            continue
+        
+        # Group the (segment, pronunciation) pairs into one run per entry
+        runs: List[List[Tuple[str, Any]]] = [[]]
+        for segment, pronunciation in jyutping_result:
+            if segment == _BATCH_SEPARATOR:
+                runs.append([])
+            else:
+                runs[-1].append((segment, pronunciation))
+        
+        entries = []
+        for text, run in zip(batch, runs):
+            if ''.join(segment for segment, _ in run) != text:
+                # Alignment is lost from here on; the rest of the batch is looked up singly
+                break
+            jyutping_parts = [pronunciation for _, pronunciation in run if pronunciation]
+            entries.append((text, ' '.join(jyutping_parts) if jyutping_parts else "unknown"))
+        _add_jyutping(cache, entries)
+
+
+class _FilterView(Mapping):
+    """Read-only view of the entries of a dict whose values satisfy a predicate, computed on access."""
+    
+    def __init__(self, source: Dict[str, Any], predicate: Callable[[Any], bool]):
+        self._source = source
+        self._predicate = predicate
+    
+    def __getitem__(self, key):
+        value = self._source[key]
+        if not self._predicate(value):
+            raise KeyError(key)
+        return value
+    
+    def __iter__(self):
+        predicate = self._predicate
+        return (key for key, value in self._source.items() if predicate(value))
+    
+    def __len__(self):
+        predicate = self._predicate
+        return sum(1 for value in self._source.values() if predicate(value))
+    
+    def items(self):
+        predicate = self._predicate
+        return ((key, value) for key, value in self._source.items() if predicate(value))
+    
+    def values(self):
+        predicate = self._predicate
+        return (value for value in self._source.values() if predicate(value))
+
+
 class PronunciationAnalyzer:
     """Provides Jyutping pronunciation analysis for Chinese characters and words."""
     
     def __init__(self):
         """Initialize the pronunciation analyzer."""
-        self.han_pattern = re.compile(r'[\u4e00-\u9fff\u3400-\u4dbf\uf900-\ufaff]+')
+        # Only ever searched for a first match, so one Han character is enough
+        self.han_pattern = re.compile(r'[\u4e00-\u9fff\u3400-\u4dbf\uf900-\ufaff]')
         
     def _identify_character_type(self, text: str) -> str:
         """
@@ -35,6 +263,38 @@ class PronunciationAnalyzer:
             return 'mixed'
         else:
             return 'unknown'
+    def get_character_jyutping_batch(self, chars: Iterable[str]) -> Dict[str, str]:
+        """
+        Get Jyutping for a batch of characters.
+        
+        Args:
+            chars: Characters to look up; duplicates are looked up once
+            
+        Returns:
+            Dictionary mapping each character to its Jyutping or "unknown"
+        """
+        chars = list(dict.fromkeys(chars))
+        _prefetch_jyutping('characters', chars)
+        jyutpings = {char: _character_jyutping(char) for char in chars}
+        _schedule_jyutping_cache_save()
+        return jyutpings
+    
+    def get_word_jyutping_batch(self, words: Iterable[str]) -> Dict[str, str]:
+        """
+        Get Jyutping for a batch of words.
+        
+        Args:
+            words: Words to look up; duplicates are looked up once
+            
+        Returns:
+            Dictionary mapping each word to its space-separated Jyutping or "unknown"
+        """
+        words = list(dict.fromkeys(words))
+        _prefetch_jyutping('words', words)
+        jyutpings = {word: _word_jyutping(word) for word in words}
+        _schedule_jyutping_cache_save()
+        return jyutpings
+    
     def get_character_pronunciations(self, char_frequency: Dict[str, int]) -> Dict[str, Dict[str, Any]]:
         """
         Get Jyutping pronunciations for characters.
@@ -47,67 +307,52 @@ class PronunciationAnalyzer:
         """
         character_data = {}
         
+        # Punctuation, digits and Latin letters have no Jyutping, so only Han characters
+        # are looked up; the rest are recorded as unknown without calling pycantonese
+        han_search = self.han_pattern.search
+        jyutpings = self.get_character_jyutping_batch(char for char in char_frequency if han_search(char))
+        
         for char, freq in char_frequency.items():
-            try:
-                # Convert character to Jyutping
-                jyutping_result = pycantonese.characters_to_jyutping(char)
-                
-                if jyutping_result and len(jyutping_result) > 0:
-                    # Extract the Jyutping pronunciation
-                    jyutping = jyutping_result[0][1] if jyutping_result[0][1] else "unknown"
-                else:
-                    jyutping = "unknown"
-                    
-            except Exception:
-                jyutping = "unknown"
-            
+            jyutping = jyutpings.get(char, "unknown")
             character_data[char] = {
                 'frequency': freq,
                 'jyutping': jyutping,
+                'jyutping_lc': sys.intern(jyutping.lower()),
                 'character': char,
                 'type': self._identify_character_type(char)
             }
         
         return character_data
     
-    def get_word_pronunciations(self, word_frequency: Dict[str, int]) -> Dict[str, Dict[str, Any]]:
+    def get_word_pronunciations(self, word_frequency: Dict[str, int],
+                                han_only: bool = False) -> Dict[str, Dict[str, Any]]:
         """
         Get Jyutping pronunciations for words.
         
         Args:
             word_frequency: Dictionary with word frequencies
+            han_only: True when every word is already known to contain Han characters,
+                such as WordAnalyzer's han_words, so they need not be checked again
             
         Returns:
             Dictionary with word data including pronunciation
         """
         word_data = {}
         
-        for word, freq in word_frequency.items():
-            # Only process words that contain Han characters
-            if not self.han_pattern.search(word):
-                continue
-                
-            try:
-                # Convert word to Jyutping
-                jyutping_result = pycantonese.characters_to_jyutping(word)
-                
-                if jyutping_result:
-                    # Combine all Jyutping pronunciations for the word
-                    jyutping_parts = []
-                    for char_group, pronunciation in jyutping_result:
-                        if pronunciation:
-                            jyutping_parts.append(pronunciation)
-                    
-                    jyutping = ' '.join(jyutping_parts) if jyutping_parts else "unknown"
-                else:
-                    jyutping = "unknown"
-                    
-            except Exception:
-                jyutping = "unknown"
-            
+        # Only process words that contain Han characters
+        if han_only:
+            han_words = word_frequency
+        else:
+            han_search = self.han_pattern.search
+            han_words = {word: freq for word, freq in word_frequency.items() if han_search(word)}
+        jyutpings = self.get_word_jyutping_batch(han_words.keys())
+        
+        for word, freq in han_words.items():
+            jyutping = jyutpings[word]
             word_data[word] = {
                 'frequency': freq,
                 'jyutping': jyutping,
+                'jyutping_lc': sys.intern(jyutping.lower()),
                 'word': word,
                 'length': len(word),
                 'type': self._identify_character_type(word)
@@ -127,56 +372,62 @@ class PronunciationAnalyzer:
         Returns:
             Formatted string summary
         """
-        summary = "Pronunciation Analysis Summary:\n\n"
+        parts = ["Pronunciation Analysis Summary:\n\n"]
         
         # Character pronunciation summary
         total_chars = len(character_data)
         chars_with_pronunciation = sum(1 for data in character_data.values() 
                                      if data['jyutping'] != "unknown")
         
-        summary += f"Characters with Jyutping: {chars_with_pronunciation}/{total_chars} "
-        summary += f"({chars_with_pronunciation/total_chars*100:.1f}%)\n\n"
+        parts.append(f"Characters with Jyutping: {chars_with_pronunciation}/{total_chars} ")
+        parts.append(f"({chars_with_pronunciation/total_chars*100:.1f}%)\n\n")
         
         # Top characters with pronunciation
-        sorted_chars = sorted(character_data.items(), 
-                            key=lambda x: x[1]['frequency'], reverse=True)
+        top_chars = nlargest(10, character_data.items(), key=lambda x: x[1]['frequency'])
         
-        summary += "Top 10 Characters with Pronunciation:\n"
-        for i, (char, data) in enumerate(sorted_chars[:10], 1):
-            summary += f"{i:2d}. {char} ({data['jyutping']}) - {data['frequency']} times\n"
+        parts.append("Top 10 Characters with Pronunciation:\n")
+        for i, (char, data) in enumerate(top_chars, 1):
+            parts.append(f"{i:2d}. {char} ({data['jyutping']}) - {data['frequency']} times\n")
         
         # Word pronunciation summary if provided
         if word_data:
-            summary += f"\n\nWords with Jyutping:\n"
+            parts.append(f"\n\nWords with Jyutping:\n")
             total_words = len(word_data)
             words_with_pronunciation = sum(1 for data in word_data.values() 
                                          if data['jyutping'] != "unknown")
             
-            summary += f"Words with pronunciation: {words_with_pronunciation}/{total_words} "
-            summary += f"({words_with_pronunciation/total_words*100:.1f}%)\n\n"
+            parts.append(f"Words with pronunciation: {words_with_pronunciation}/{total_words} ")
+            parts.append(f"({words_with_pronunciation/total_words*100:.1f}%)\n\n")
             
             # Top words with pronunciation
-            sorted_words = sorted(word_data.items(), 
-                                key=lambda x: x[1]['frequency'], reverse=True)
+            top_words = nlargest(10, word_data.items(), key=lambda x: x[1]['frequency'])
             
-            summary += "Top 10 Words with Pronunciation:\n"
-            for i, (word, data) in enumerate(sorted_words[:10], 1):
-                summary += f"{i:2d}. {word} ({data['jyutping']}) - {data['frequency']} times\n"
+            parts.append("Top 10 Words with Pronunciation:\n")
+            for i, (word, data) in enumerate(top_words, 1):
+                parts.append(f"{i:2d}. {word} ({data['jyutping']}) - {data['frequency']} times\n")
         
-        return summary
+        return "".join(parts)
     
     def filter_by_pronunciation_availability(self, data: Dict[str, Dict[str, Any]], 
-                                           has_pronunciation: bool = True) -> Dict[str, Dict[str, Any]]:
+                                           has_pronunciation: bool = True,
+                                           materialize: bool = True) -> Mapping:
         """
         Filter data by pronunciation availability.
         
         Args:
             data: Character or word data
             has_pronunciation: If True, return items with pronunciation; if False, return items without
+            materialize: If False, return a read-only view that filters data as it is read
+                instead of copying the matching entries into a new dictionary
             
         Returns:
-            Filtered data dictionary
+            Filtered data dictionary, or a view of it
         """
+        if not materialize:
+            if has_pronunciation:
+                return _FilterView(data, lambda value: value['jyutping'] != "unknown")
+            return _FilterView(data, lambda value: value['jyutping'] == "unknown")
+        
         if has_pronunciation:
             return {key: value for key, value in data.items() 
                    if value['jyutping'] != "unknown"}
@@ -195,19 +446,25 @@ class PronunciationAnalyzer:
             Dictionary with tone counts
         """
         tone_counts = {str(i): 0 for i in range(1, 7)}  # Tones 1-6
-        tone_counts['unknown'] = 0
         
+        # Many characters share a pronunciation, so frequencies are summed per Jyutping
+        # string first and each distinct string is scanned for tones only once
+        jyutping_frequency = {}
         for item_data in data.values():
             jyutping = item_data['jyutping']
-            if jyutping == "unknown":
-                tone_counts['unknown'] += item_data['frequency']
-                continue
-            
-            # Extract tones from Jyutping (numbers 1-6)
-            tones = re.findall(r'[1-6]', jyutping)
-            for tone in tones:
-                tone_counts[tone] += item_data['frequency']
+            jyutping_frequency[jyutping] = jyutping_frequency.get(jyutping, 0) + item_data['frequency']
+        unknown = jyutping_frequency.pop("unknown", 0)
         
+        # Extract tones from Jyutping (numbers 1-6): deleting every other byte leaves just
+        # the tone digits, which index straight into per-byte counts
+        byte_counts = [0] * 256
+        for jyutping, frequency in jyutping_frequency.items():
+            for tone_byte in jyutping.encode('utf-8').translate(None, _NON_TONE_BYTES):
+                byte_counts[tone_byte] += frequency
+        
+        for tone in tone_counts:
+            tone_counts[tone] = byte_counts[ord(tone)]
+        tone_counts['unknown'] = unknown
         return tone_counts
     
     def search_by_jyutping(self, data: Dict[str, Dict[str, Any]], 
@@ -216,18 +473,16 @@ class PronunciationAnalyzer:
         Search for characters or words by Jyutping pattern.
         
         Args:
-            data: Character or word data
+            data: Character or word data, such as that from get_character_pronunciations or
+                get_word_pronunciations, whose records carry the lowercased Jyutping
             jyutping_pattern: Jyutping pattern to search for (e.g., "hou", "gong2")
             
         Returns:
             Filtered data matching the pattern
         """
         pattern = jyutping_pattern.lower()
-        matching_data = {}
-        
-        for key, value in data.items():
-            jyutping = value['jyutping'].lower()
-            if pattern in jyutping:
-                matching_data[key] = value
-        
-        return matching_data
\ No newline at end of file
+        # Records built elsewhere (or saved before jyutping_lc existed) are lowercased here
+        return {
+            key: value for key, value in data.items()
+            if pattern in (value.get('jyutping_lc') or value['jyutping'].lower())
+        }
\ No newline at end of file
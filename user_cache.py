@@ -0,0 +1,31 @@
+"""
+Streamlit-cached access to the user database, shared by the app pages.
+"""
+
+import streamlit as st
+
+from mongodb_user_database import UserDatabase
+
+
+@st.cache_resource
+def get_user_db() -> UserDatabase:
+    """Shared user database handle, created once per process."""
+    return UserDatabase()
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def get_user_prefs(user_id: str):
+    """User preferences, re-read at most every 30 seconds unless cleared after an update."""
+    return get_user_db().get_user_preferences(user_id)
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def get_user_statistics(user_id: str):
+    """User statistics, re-read at most every 30 seconds unless cleared after an analysis."""
+    return get_user_db().get_user_statistics(user_id)
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def get_user_history(user_id: str, limit: int = 10):
+    """Recent analysis history, re-read at most every 30 seconds unless cleared after an analysis."""
+    return get_user_db().get_user_history(user_id, limit=limit)
@@ -2,13 +2,63 @@
 User database module for managing user data and progress using JSON-based NoSQL storage.
 """
 
-import json
 import os
+import threading
 import hashlib
 from datetime import datetime
+from itertools import islice
 from typing import Dict, Any, Optional, List
 import uuid
 
+from json_store import JsonStore
+
+
+# Logins and analysis results are appended to a log next to the JSON file instead of
+# rewriting it; once this many accumulate they are folded into a full save
+USER_LOG_CHECKPOINT = 200
+
+
+def _apply_user_update(user_data: Dict[str, Any], entry: Dict[str, Any]):
+    """Apply one logged login or analysis result to a user record; applying it twice changes nothing."""
+    if 'last_login' in entry:
+        user_data['last_login'] = entry['last_login']
+    
+    record = entry.get('record')
+    if record is None:
+        return
+    history = user_data['analysis_history']
+    if any(existing.get('analysis_id') == record['analysis_id'] for existing in history):
+        return
+    
+    # Keep only last 50 analyses to prevent database from growing too large
+    history.append(record)
+    del history[:-50]
+    
+    stats = user_data['statistics']
+    stats['total_analyses'] += 1
+    stats['files_processed'] += 1
+    stats['total_characters_analyzed'] += entry.get('characters', 0)
+    stats['total_words_analyzed'] += entry.get('words', 0)
+
+
+def _apply_logged_update(data: Dict[str, Any], entry: Dict[str, Any]):
+    """Replay one entry of the update log onto the loaded user records."""
+    user_data = data.get(entry['user_id'])
+    if user_data is not None:
+        _apply_user_update(user_data, entry)
+
+
+def _copy_user(user_data: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Copy a user record, with its own history, preferences and statistics, for use outside the lock."""
+    if user_data is None:
+        return None
+    return {
+        **user_data,
+        'analysis_history': list(user_data.get('analysis_history', [])),
+        'preferences': dict(user_data.get('preferences', {})),
+        'statistics': dict(user_data.get('statistics', {}))
+    }
+
 
 class UserDatabase:
     """Simple NoSQL database for user management and progress tracking."""
@@ -22,32 +72,31 @@ class UserDatabase:
         """
         self.db_path = db_path
         self.db_dir = os.path.dirname(db_path)
-        self._ensure_db_exists()
-    
-    def _ensure_db_exists(self):
-        """Ensure the database directory and file exist."""
-        if not os.path.exists(self.db_dir):
-            os.makedirs(self.db_dir)
         
-        if not os.path.exists(self.db_path):
-            self._save_data({})
-    
-    def _load_data(self) -> Dict[str, Any]:
-        """Load data from the JSON database file."""
-        try:
-            with open(self.db_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {}
+        # Records stay in memory after the first load, with logins and analysis results
+        # appended to a log rather than rewriting the file; _lock guards the records
+        self._lock = threading.RLock()
+        # username -> user_id for the cached records, rebuilt whenever they are reloaded
+        self._username_index: Dict[str, str] = {}
+        self._store = JsonStore(
+            db_path, lock=self._lock,
+            log_path=os.path.join(self.db_dir, "user_updates.jsonl"),
+            log_checkpoint=USER_LOG_CHECKPOINT,
+            apply_log_entry=_apply_logged_update,
+            on_load=self._build_username_index
+        )
     
-    def _save_data(self, data: Dict[str, Any]):
-        """Save data to the JSON database file."""
-        with open(self.db_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+    def _build_username_index(self, data: Dict[str, Any]):
+        """Index the loaded records by username."""
+        self._username_index = {
+            user_data['username']: user_id
+            for user_id, user_data in data.items() if user_data.get('username')
+        }
     
     def _generate_user_id(self, username: str) -> str:
         """Generate a unique user ID based on username."""
-        return hashlib.md5(username.encode()).hexdigest()[:12]
+        # A 6-byte digest is exactly the 12 hex characters an ID uses, with nothing truncated
+        return hashlib.blake2b(username.encode('utf-8'), digest_size=6).hexdigest()
     
     def create_user(self, username: str, email: str = "") -> str:
         """
@@ -63,40 +112,42 @@ class UserDatabase:
         Raises:
             ValueError: If username already exists
         """
-        data = self._load_data()
-        user_id = self._generate_user_id(username)
-        
-        # Check if username already exists
-        for existing_user in data.values():
-            if existing_user.get('username') == username:
+        with self._lock:
+            data = self._store.load()
+            user_id = self._generate_user_id(username)
+            
+            # Check if username already exists
+            if username in self._username_index:
                 raise ValueError(f"Username '{username}' already exists")
-        
-        # Create new user
-        user_data = {
-            'user_id': user_id,
-            'username': username,
-            'email': email,
-            'created_at': datetime.now().isoformat(),
-            'last_login': datetime.now().isoformat(),
-            'analysis_history': [],
-            'preferences': {
-                'preferred_analysis_type': 'both',
-                'min_frequency': 1,
-                'max_chars_display': 50,
-                'show_chart_type': 'bar'
-            },
-            'statistics': {
-                'total_analyses': 0,
-                'total_characters_analyzed': 0,
-                'total_words_analyzed': 0,
-                'files_processed': 0
+            
+            # Create new user
+            now = datetime.now().isoformat()
+            user_data = {
+                'user_id': user_id,
+                'username': username,
+                'email': email,
+                'created_at': now,
+                'last_login': now,
+                'analysis_history': [],
+                'preferences': {
+                    'preferred_analysis_type': 'both',
+                    'min_frequency': 1,
+                    'max_chars_display': 50,
+                    'show_chart_type': 'bar'
+                },
+                'statistics': {
+                    'total_analyses': 0,
+                    'total_characters_analyzed': 0,
+                    'total_words_analyzed': 0,
+                    'files_processed': 0
+                }
             }
-        }
-        
-        data[user_id] = user_data
-        self._save_data(data)
-        
-        return user_id
+            
+            data[user_id] = user_data
+            self._username_index[username] = user_id
+            self._store.save(data)
+            
+            return user_id
     
     def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
         """
@@ -108,8 +159,9 @@ class UserDatabase:
         Returns:
             User data dictionary or None if not found
         """
-        data = self._load_data()
-        return data.get(user_id)
+        with self._lock:
+            data = self._store.load()
+            return _copy_user(data.get(user_id))
     
     def get_user_by_username(self, username: str) -> Optional[Dict[str, Any]]:
         """
@@ -121,63 +173,58 @@ class UserDatabase:
         Returns:
             User data dictionary or None if not found
         """
-        data = self._load_data()
-        for user_data in data.values():
-            if user_data.get('username') == username:
-                return user_data
-        return None
+        with self._lock:
+            data = self._store.load()
+            return _copy_user(data.get(self._username_index.get(username)))
     
     def update_last_login(self, user_id: str):
         """Update user's last login timestamp."""
-        data = self._load_data()
-        if user_id in data:
-            data[user_id]['last_login'] = datetime.now().isoformat()
-            self._save_data(data)
+        with self._lock:
+            data = self._store.load()
+            if user_id in data:
+                entry = {'user_id': user_id, 'last_login': datetime.now().isoformat()}
+                _apply_user_update(data[user_id], entry)
+                self._store.append_log(entry)
     
-    def save_analysis_result(self, user_id: str, analysis_data: Dict[str, Any]):
+    def save_analysis_result(self, user_id: str, analysis_data: Dict[str, Any], timestamp: Optional[str] = None):
         """
         Save analysis result to user's history.
         
         Args:
             user_id: User ID
             analysis_data: Analysis results to save
+            timestamp: ISO time of the analysis; defaults to now
         """
-        data = self._load_data()
-        if user_id not in data:
-            return False
-        
-        # Create analysis record
-        analysis_record = {
-            'analysis_id': str(uuid.uuid4())[:8],
-            'timestamp': datetime.now().isoformat(),
-            'filename': analysis_data.get('filename', 'Unknown'),
-            'file_size': analysis_data.get('file_size', 0),
-            'analysis_type': analysis_data.get('analysis_type', 'both'),
-            'character_stats': analysis_data.get('character_stats', {}),
-            'word_stats': analysis_data.get('word_stats', {}),
-            'top_characters': analysis_data.get('top_characters', {}),
-            'top_words': analysis_data.get('top_words', {}),
-            'settings_used': analysis_data.get('settings_used', {})
-        }
-        
-        # Add to history
-        data[user_id]['analysis_history'].append(analysis_record)
-        
-        # Update statistics
-        stats = data[user_id]['statistics']
-        stats['total_analyses'] += 1
-        stats['files_processed'] += 1
-        if 'character_stats' in analysis_data:
-            stats['total_characters_analyzed'] += analysis_data['character_stats'].get('total_chars', 0)
-        if 'word_stats' in analysis_data:
-            stats['total_words_analyzed'] += analysis_data['word_stats'].get('total_words', 0)
-        
-        # Keep only last 50 analyses to prevent database from growing too large
-        if len(data[user_id]['analysis_history']) > 50:
-            data[user_id]['analysis_history'] = data[user_id]['analysis_history'][-50:]
-        
-        self._save_data(data)
-        return True
+        with self._lock:
+            data = self._store.load()
+            if user_id not in data:
+                return False
+            
+            # Create analysis record
+            analysis_record = {
+                'analysis_id': str(uuid.uuid4())[:8],
+                'timestamp': timestamp or datetime.now().isoformat(),
+                'filename': analysis_data.get('filename', 'Unknown'),
+                'file_size': analysis_data.get('file_size', 0),
+                'analysis_type': analysis_data.get('analysis_type', 'both'),
+                'character_stats': analysis_data.get('character_stats', {}),
+                'word_stats': analysis_data.get('word_stats', {}),
+                'top_characters': analysis_data.get('top_characters', {}),
+                'top_words': analysis_data.get('top_words', {}),
+                'settings_used': analysis_data.get('settings_used', {})
+            }
+            
+            # Add to history and update statistics; the update is appended to the log
+            # rather than rewriting the whole JSON file
+            entry = {
+                'user_id': user_id,
+                'record': analysis_record,
+                'characters': analysis_data.get('character_stats', {}).get('total_chars', 0),
+                'words': analysis_data.get('word_stats', {}).get('total_words', 0)
+            }
+            _apply_user_update(data[user_id], entry)
+            self._store.append_log(entry)
+            return True
     
     def get_user_history(self, user_id: str, limit: int = 10) -> List[Dict[str, Any]]:
         """
@@ -190,12 +237,14 @@ class UserDatabase:
         Returns:
             List of analysis records, most recent first
         """
-        data = self._load_data()
-        if user_id not in data:
-            return []
-        
-        history = data[user_id]['analysis_history']
-        return sorted(history, key=lambda x: x['timestamp'], reverse=True)[:limit]
+        with self._lock:
+            data = self._store.load()
+            if user_id not in data:
+                return []
+            
+            # Records are appended as analyses happen, so the history is already in time order
+            history = data[user_id]['analysis_history']
+            return list(islice(reversed(history), limit))
     
     def update_user_preferences(self, user_id: str, preferences: Dict[str, Any]):
         """
@@ -205,10 +254,11 @@ class UserDatabase:
             user_id: User ID
             preferences: Dictionary of preferences to update
         """
-        data = self._load_data()
-        if user_id in data:
-            data[user_id]['preferences'].update(preferences)
-            self._save_data(data)
+        with self._lock:
+            data = self._store.load()
+            if user_id in data:
+                data[user_id]['preferences'].update(preferences)
+                self._store.save(data)
     
     def get_user_preferences(self, user_id: str) -> Dict[str, Any]:
         """
@@ -220,9 +270,10 @@ class UserDatabase:
         Returns:
             User preferences dictionary
         """
-        data = self._load_data()
-        if user_id in data:
-            return data[user_id]['preferences']
+        with self._lock:
+            data = self._store.load()
+            if user_id in data:
+                return dict(data[user_id]['preferences'])
         return {}
     
     def get_user_statistics(self, user_id: str) -> Dict[str, Any]:
@@ -235,9 +286,10 @@ class UserDatabase:
         Returns:
             User statistics dictionary
         """
-        data = self._load_data()
-        if user_id in data:
-            return data[user_id]['statistics']
+        with self._lock:
+            data = self._store.load()
+            if user_id in data:
+                return dict(data[user_id]['statistics'])
         return {}
     
     def list_all_users(self) -> List[Dict[str, Any]]:
@@ -247,8 +299,9 @@ class UserDatabase:
         Returns:
             List of user data dictionaries
         """
-        data = self._load_data()
-        return list(data.values())
+        with self._lock:
+            data = self._store.load()
+            return [_copy_user(user_data) for user_data in data.values()]
     
     def delete_user(self, user_id: str) -> bool:
         """
@@ -260,9 +313,10 @@ class UserDatabase:
         Returns:
             True if user was deleted, False if not found
         """
-        data = self._load_data()
-        if user_id in data:
-            del data[user_id]
-            self._save_data(data)
-            return True
-        return False
\ No newline at end of file
+        with self._lock:
+            data = self._store.load()
+            if user_id in data:
+                self._username_index.pop(data.pop(user_id).get('username'), None)
+                self._store.save(data)
+                return True
+            return False
\ No newline at end of file
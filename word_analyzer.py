@@ -1,8 +1,12 @@
 import jieba
 import re
+import sys
 from collections import Counter
+from operator import itemgetter
 from typing import Dict, Any, List
 
+import numpy as np
+
 class WordAnalyzer:
     """Analyzes text for word frequency and statistics using Chinese word segmentation."""
     
@@ -13,8 +17,9 @@ class WordAnalyzer:
         except:
             pass  # Fall back to default mode if paddle is not available
         
-        # Pre-compile regex for Han characters
-        self.han_pattern = re.compile(r'[\u4e00-\u9fff\u3400-\u4dbf\uf900-\ufaff]+')
+        # Pre-compile regex for Han characters; it is only searched for a first match,
+        # so it matches a single character rather than a whole run
+        self.han_pattern = re.compile(r'[\u4e00-\u9fff\u3400-\u4dbf\uf900-\ufaff]')
         
     def analyze_text(self, text: str) -> Dict[str, Any]:
         """
@@ -42,31 +47,34 @@ class WordAnalyzer:
                 'avg_word_length': 0.0
             }
         
-        # Clean and normalize text
-        cleaned_text = self._clean_text(text)
-        
-        # Perform word segmentation
-        words = list(jieba.cut(cleaned_text))
-        
-        # Filter out empty strings and whitespace
-        words = [word.strip() for word in words if word.strip()]
-        
-        # Count word frequencies
-        word_frequency = Counter(words)
+        # Perform word segmentation and count word frequencies, stripping each word once
+        # and dropping the empty ones; the segmented words are never kept as a list.
+        # jieba emits every whitespace character as a token of its own, which the strip
+        # drops, so the text is segmented as-is instead of first collapsing its whitespace.
+        # Words are interned so every analysis shares one string object per distinct word
+        word_frequency = Counter(map(sys.intern, filter(None, map(str.strip, jieba.cut(text)))))
         
-        # Extract Han character words
+        # Everything below is derived from the distinct words and their counts, in one pass
+        # rather than by walking every occurrence again; first-appearance order is unchanged
+        han_search = self.han_pattern.search
         han_words = Counter()
-        for word in words:
-            if self.han_pattern.search(word):
-                han_words[word] += 1
-        
-        # Calculate word length distribution
-        word_lengths = Counter(len(word) for word in words)
+        word_lengths = Counter()
+        total_words = 0
+        total_length = 0
+        for word, count in word_frequency.items():
+            # Extract Han character words
+            if han_search(word):
+                han_words[word] = count
+            
+            # Word length distribution and the total length of all words
+            word_length = len(word)
+            word_lengths[word_length] += count
+            total_words += count
+            total_length += word_length * count
         
         # Calculate statistics
-        total_words = len(words)
         unique_words = len(word_frequency)
-        avg_word_length = sum(len(word) for word in words) / total_words if total_words > 0 else 0.0
+        avg_word_length = total_length / total_words if total_words > 0 else 0.0
         
         return {
             'word_frequency': word_frequency,
@@ -77,19 +85,6 @@ class WordAnalyzer:
             'avg_word_length': avg_word_length
         }
     
-    def _clean_text(self, text: str) -> str:
-        """Clean and normalize text for analysis."""
-        # Remove excessive whitespace
-        text = re.sub(r'\s+', ' ', text)
-        
-        # Remove common formatting artifacts
-        text = re.sub(r'[\r\n\t]+', ' ', text)
-        
-        # Strip leading/trailing whitespace
-        text = text.strip()
-        
-        return text
-    
     def get_word_difficulty_level(self, word_frequency: Counter, total_words: int) -> Dict[str, Dict[str, Any]]:
         """
         Categorize words by difficulty level based on frequency.
@@ -114,30 +109,21 @@ class WordAnalyzer:
         common_threshold = total_words * 0.002       # > 0.2% of all words
         uncommon_threshold = total_words * 0.0005    # > 0.05% of all words
         
-        levels = {
-            'very_common': {'count': 0, 'words': []},
-            'common': {'count': 0, 'words': []},
-            'uncommon': {'count': 0, 'words': []},
-            'rare': {'count': 0, 'words': []}
-        }
-        
-        for word, freq in word_frequency.items():
-            if freq >= very_common_threshold:
-                levels['very_common']['words'].append((word, freq))
-                levels['very_common']['count'] += 1
-            elif freq >= common_threshold:
-                levels['common']['words'].append((word, freq))
-                levels['common']['count'] += 1
-            elif freq >= uncommon_threshold:
-                levels['uncommon']['words'].append((word, freq))
-                levels['uncommon']['count'] += 1
-            else:
-                levels['rare']['words'].append((word, freq))
-                levels['rare']['count'] += 1
-        
-        # Sort words within each level by frequency
-        for level in levels.values():
-            level['words'].sort(key=lambda x: x[1], reverse=True)
+        # Sort once by descending frequency (ties keep first-appearance order), then bucket
+        # every frequency in one vectorized pass: 0 = rare ... 3 = very common
+        words = list(word_frequency.keys())
+        freqs = np.fromiter(word_frequency.values(), dtype=np.int64, count=len(words))
+        order = np.argsort(-freqs, kind='stable')
+        freqs = freqs[order]
+        buckets = np.digitize(freqs, [uncommon_threshold, common_threshold, very_common_threshold])
+        order = order.tolist()
+        freqs = freqs.tolist()
+        
+        # Each level's words are already sorted by frequency
+        levels = {}
+        for level, bucket in (('very_common', 3), ('common', 2), ('uncommon', 1), ('rare', 0)):
+            level_words = [(words[order[i]], freqs[i]) for i in np.flatnonzero(buckets == bucket).tolist()]
+            levels[level] = {'count': len(level_words), 'words': level_words}
         
         return levels
     
@@ -181,10 +167,9 @@ class WordAnalyzer:
         if total_words == 0:
             return {}
         
-        return {
-            word: (freq / total_words) * 100 
-            for word, freq in word_frequency.items()
-        }
+        # One division up front, then a multiplication per word
+        scale = 100.0 / total_words
+        return {word: freq * scale for word, freq in word_frequency.items()}
     
     def get_word_stats_summary(self, analysis_results: Dict[str, Any]) -> str:
         """
@@ -202,7 +187,7 @@ class WordAnalyzer:
         unique_words = analysis_results['unique_words']
         avg_word_length = analysis_results['avg_word_length']
         
-        summary = f"""Word Analysis Summary:
+        header = f"""Word Analysis Summary:
 
 Total words found: {total_words:,}
 Unique words: {unique_words:,}
@@ -212,16 +197,18 @@ Average word length: {avg_word_length:.1f} characters
 Top 10 most frequent words:
 """
         
+        parts = [header]
+        scale = 100.0 / total_words if total_words > 0 else 0
         for i, (word, freq) in enumerate(word_freq.most_common(10), 1):
-            percentage = (freq / total_words) * 100 if total_words > 0 else 0
-            summary += f"{i:2d}. {word} - {freq:4d} times ({percentage:5.1f}%)\n"
+            percentage = freq * scale
+            parts.append(f"{i:2d}. {word} - {freq:4d} times ({percentage:5.1f}%)\n")
         
-        summary += f"\nTop 10 most frequent Han words:\n"
+        parts.append("\nTop 10 most frequent Han words:\n")
         for i, (word, freq) in enumerate(han_words.most_common(10), 1):
-            percentage = (freq / total_words) * 100 if total_words > 0 else 0
-            summary += f"{i:2d}. {word} - {freq:4d} times ({percentage:5.1f}%)\n"
+            percentage = freq * scale
+            parts.append(f"{i:2d}. {word} - {freq:4d} times ({percentage:5.1f}%)\n")
         
-        return summary
+        return "".join(parts)
     
     def filter_words_by_length(self, word_frequency: Counter, min_length: int = 1, max_length: int = 10) -> Counter:
         """
@@ -251,14 +238,12 @@ Top 10 most frequent words:
             Dictionary with length as key and list of (word, frequency) tuples as value
         """
         words_by_length = {}
-        for word, freq in word_frequency.items():
-            length = len(word)
-            if length not in words_by_length:
-                words_by_length[length] = []
-            words_by_length[length].append((word, freq))
+        for item in word_frequency.items():
+            words_by_length.setdefault(len(item[0]), []).append(item)
         
         # Sort words within each length group by frequency
-        for length in words_by_length:
-            words_by_length[length].sort(key=lambda x: x[1], reverse=True)
+        by_frequency = itemgetter(1)
+        for length_words in words_by_length.values():
+            length_words.sort(key=by_frequency, reverse=True)
         
         return words_by_length
\ No newline at end of file